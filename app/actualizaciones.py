@@ -0,0 +1,115 @@
+# actualizaciones.py
+# Agrupa los page.update() de una misma acción en un solo envío al navegador
+#
+# Un clic pasaba por varios métodos y cada uno llamaba a page.update(), que envía
+# por websocket todos los cambios pendientes de la página. Ahora:
+#   - las vistas llaman a actualizar(page) (o actualizar(page, control)) en vez de
+#     page.update(): dentro de un lote solo se marca como pendiente
+#   - los manejadores de eventos se envuelven con @agrupar (métodos de vista, que
+#     tienen self.page) o agrupar_en(page) (funciones de main.py); al terminar el
+#     manejador se envía una sola actualización
+#   - fuera de un lote (hilos de reloj o de avisos) actualizar() envía en el acto
+#   - limitar() deja pasar a lo sumo una llamada cada tanto (eventos de resize)
+
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+_local = threading.local()   # lotes abiertos en este hilo: id(page) -> [profundidad, pendientes]
+
+
+def _lotes() -> dict:
+    if not hasattr(_local, "lotes"):
+        _local.lotes = {}
+    return _local.lotes
+
+
+def actualizar(page, *controles):
+    """page.update() diferido al final del lote en curso (o inmediato si no hay lote)."""
+    abierto = _lotes().get(id(page))
+    if abierto is None:
+        page.update(*controles)
+        return
+    # Sin controles se actualiza la página entera, que ya incluye cualquier control
+    for control in controles or (page,):
+        abierto[1][id(control)] = control
+
+
+def vaciar(page):
+    """Envía ya lo pendiente del lote (p. ej. entre dos pasos de una animación)."""
+    abierto = _lotes().get(id(page))
+    if abierto is None or not abierto[1]:
+        return
+    pendientes = abierto[1]
+    abierto[1] = {}
+    if id(page) in pendientes:
+        page.update()
+    else:
+        page.update(*pendientes.values())
+
+
+@contextmanager
+def lote(page):
+    """Agrupa las actualizaciones de `page` hechas dentro del bloque (admite anidarse)."""
+    lotes = _lotes()
+    clave = id(page)
+    if clave in lotes:
+        lotes[clave][0] += 1
+    else:
+        lotes[clave] = [1, {}]
+    try:
+        yield
+    finally:
+        lotes[clave][0] -= 1
+        if lotes[clave][0] == 0:
+            try:
+                vaciar(page)
+            finally:
+                del lotes[clave]
+
+
+def agrupar(metodo):
+    """Decorador para manejadores de una vista: un solo envío por evento."""
+    @wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with lote(self.page):
+            return metodo(self, *args, **kwargs)
+    return envoltura
+
+
+def agrupar_en(page):
+    """Como agrupar, para funciones sueltas que usan `page` del closure."""
+    def decorador(funcion):
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with lote(page):
+                return funcion(*args, **kwargs)
+        return envoltura
+    return decorador
+
+
+def limitar(segundos: float):
+    """
+    Decorador: ejecuta la función como mucho una vez cada `segundos`, con el último
+    evento recibido. Las llamadas intermedias se descartan (útil para on_resize).
+    """
+    def decorador(funcion):
+        estado = {"temporizador": None, "args": None}
+        candado = threading.Lock()
+
+        def ejecutar():
+            with candado:
+                args, kwargs = estado["args"]
+                estado["temporizador"] = None
+            funcion(*args, **kwargs)
+
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with candado:
+                estado["args"] = (args, kwargs)
+                if estado["temporizador"] is None:
+                    estado["temporizador"] = threading.Timer(segundos, ejecutar)
+                    estado["temporizador"].daemon = True
+                    estado["temporizador"].start()
+        return envoltura
+    return decorador
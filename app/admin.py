@@ -3,6 +3,7 @@
 
 import flet as ft
 import database
+from actualizaciones import actualizar, agrupar
 from pathlib import Path
 
 # ================================================================
@@ -175,19 +176,25 @@ class AdminView:
     # ================================================================
     # FUNCIONES
     # ================================================================
+    def activar(self):
+        self.cargar_estadisticas()
+
     def cargar_estadisticas(self):
         try:
             empleados = database.obtener_empleados()
-            asistencias = database.consultar_asistencias()
+            total, exacto = database.total_registros_asistencia()
+            registros = f"{total}" if exacto else f"≈ {total}"
             db_path = Path(__file__).parent / "data.db"
             db_size = db_path.stat().st_size / 1024
-            self.stats_text.value = f"• Empleados activos: {len(empleados)}\n• Registros de asistencia: {len(asistencias)}\n• Tamaño de base de datos: {db_size:.2f} KB"
+            self.stats_text.value = f"• Empleados activos: {len(empleados)}\n• Registros de asistencia: {registros}\n• Tamaño de base de datos: {db_size:.2f} KB"
         except Exception as e:
             self.stats_text.value = f"Error: {e}"
 
+    @agrupar
     def guardar_turnos(self, e):
         self.mostrar_snackbar("Función en desarrollo", COLOR_WARNING)
 
+    @agrupar
     def cambiar_password(self, e):
         if not self.password_actual.value or not self.password_nueva.value:
             self.mostrar_snackbar("Complete los campos", COLOR_DANGER)
@@ -197,6 +204,7 @@ class AdminView:
             return
         self.mostrar_snackbar("Función en desarrollo", COLOR_WARNING)
 
+    @agrupar
     def crear_backup(self, e):
         try:
             import shutil
@@ -211,9 +219,11 @@ class AdminView:
         except Exception as ex:
             self.mostrar_snackbar(f"Error: {ex}", COLOR_DANGER)
 
+    @agrupar
     def limpiar_registros_dialog(self, e):
         self.mostrar_snackbar("Función en desarrollo", COLOR_WARNING)
 
+    @agrupar
     def confirmar_borrar_todo(self, e):
         def ejecutar_borrado(e):
             try:
@@ -221,7 +231,7 @@ class AdminView:
                 db_path.unlink()
                 database.initialize_database()
                 dlg.open = False
-                self.page.update()
+                actualizar(self.page)
                 self.mostrar_snackbar("Base de datos reiniciada", COLOR_SUCCESS)
                 self.cargar_estadisticas()
             except Exception as ex:
@@ -235,14 +245,15 @@ class AdminView:
         )
         self.page.dialog = dlg
         dlg.open = True
-        self.page.update()
+        actualizar(self.page)
 
+    @agrupar
     def close_dialog(self, dlg):
         dlg.open = False
-        self.page.update()
+        actualizar(self.page)
 
     def mostrar_snackbar(self, mensaje, color):
         self.page.snack_bar.content.value = mensaje
         self.page.snack_bar.bgcolor = color
         self.page.snack_bar.open = True
-        self.page.update()
+        actualizar(self.page)
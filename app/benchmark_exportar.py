@@ -0,0 +1,81 @@
+# benchmark_exportar.py
+# Mide tiempo y memoria pico de la exportación a Excel con filas sintéticas
+#
+# Las filas salen de un generador con la misma forma que database.iterar_asistencias,
+# así que no hace falta base de datos. Cada tamaño corre en un proceso aparte para
+# que la memoria de uno no se sume al siguiente. Con exportar_excel en modo
+# write_only la memoria pico debe quedar casi igual de 1.000 a 1.000.000 filas;
+# solo crecen el tiempo y el tamaño del archivo.
+#
+#   python app/benchmark_exportar.py
+#   python app/benchmark_exportar.py --filas 1000 50000 --salida /tmp
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import date, time as hora, timedelta
+
+from exportar import exportar_excel
+
+TAMANOS = (1_000, 10_000, 100_000, 1_000_000)
+
+
+def filas_sinteticas(n: int):
+    """n asistencias falsas con los campos y tipos que lee exportar_excel."""
+    inicio = date(2024, 1, 1)
+    for i in range(n):
+        tarde = i % 10 == 0
+        yield {
+            "nombre": f"Empleado de Prueba {i % 500:03d}",
+            "cedula": f"{1000000 + i % 500}",
+            "fecha": inicio + timedelta(days=i // 500),
+            "turno": "DÍA" if i % 3 else "NOCHE",
+            "hora_llegada": hora(8, 5 if tarde else 0, i % 60),
+            "hora_salida": hora(16, 0, i % 60),
+            "segundos_trabajados": 28800 - (i % 600),
+            "llego_tarde": "SI" if tarde else "NO",
+        }
+
+
+def _medir(n: int, carpeta: str, resultado):
+    ruta = os.path.join(carpeta, f"benchmark_{n}.xlsx")
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    escritas = exportar_excel(filas_sinteticas(n), ruta)
+    segundos = time.perf_counter() - t0
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    resultado.put((escritas, segundos, pico, os.path.getsize(ruta)))
+    os.remove(ruta)
+
+
+def medir(n: int, carpeta: str):
+    """(filas, segundos, memoria pico en bytes, tamaño del archivo) en un proceso aparte."""
+    resultado = multiprocessing.Queue()
+    proceso = multiprocessing.Process(target=_medir, args=(n, carpeta, resultado))
+    proceso.start()
+    medicion = resultado.get()
+    proceso.join()
+    return medicion
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la exportación a Excel")
+    parser.add_argument("--filas", type=int, nargs="+", default=list(TAMANOS))
+    parser.add_argument("--salida", default=tempfile.gettempdir(), help="carpeta para los archivos temporales")
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'segundos':>9} {'filas/s':>9} {'pico MB':>8} {'archivo MB':>10}")
+    picos = []
+    for n in args.filas:
+        escritas, segundos, pico, tamano = medir(n, args.salida)
+        picos.append(pico)
+        print(f"{escritas:>10,} {segundos:>9.1f} {escritas / segundos:>9,.0f} "
+              f"{pico / 2**20:>8.1f} {tamano / 2**20:>10.1f}")
+
+    if len(picos) > 1:
+        print(f"Memoria pico: la mayor es {max(picos) / min(picos):.2f}x la menor "
+              f"({min(args.filas):,} a {max(args.filas):,} filas)")
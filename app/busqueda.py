@@ -0,0 +1,117 @@
+# busqueda.py
+# Búsqueda mientras se escribe: espera a que se deje de teclear, consulta en
+# segundo plano y cancela la consulta anterior si llega otra tecla
+#
+# Si el texto nuevo contiene al anterior ("jo" -> "jos") y la búsqueda anterior
+# trajo todas sus filas, el resultado sale de filtrar esas filas en memoria,
+# sin ir a la BD.
+#
+#   busqueda = BusquedaIncremental(page, buscar, coincide, mostrar)
+#   campo.on_change = busqueda.tecla
+#   busqueda.reiniciar()      # al cargar por otro camino (botón Filtrar, Limpiar...)
+#
+#   buscar(texto, cancelacion) -> (filas, total)   en segundo plano; completo si len(filas) == total
+#   coincide(fila, texto) -> bool                   texto ya normalizado; para acotar en memoria
+#   mostrar(texto, filas, total)                    dentro de un lote de actualizaciones
+
+import threading
+import unicodedata
+
+import psycopg2.extensions
+
+import database
+from actualizaciones import lote
+
+ESPERA = 0.3   # segundos sin teclear antes de buscar
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas y sin tildes, como f_unaccent(...) ILIKE en la BD."""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def contiene(texto_normalizado: str, *valores) -> bool:
+    """Algún valor contiene el texto, ignorando tildes y mayúsculas."""
+    return any(texto_normalizado in normalizar(str(v or "")) for v in valores)
+
+
+class BusquedaIncremental:
+    def __init__(self, page, buscar, coincide, mostrar, clave=None, espera: float = ESPERA):
+        self.page = page
+        self.buscar = buscar
+        self.coincide = coincide
+        self.mostrar = mostrar
+        self.clave = clave or (lambda: None)   # resto de filtros: si cambian, no se acota
+        self.espera = espera
+
+        self._lock = threading.Lock()
+        self._temporizador = None
+        self._cancelacion = None
+        self._generacion = 0
+        self._anterior = None   # (clave, texto normalizado, filas) de la última búsqueda completa
+        self.stats = {"consultas": 0, "acotadas": 0, "canceladas": 0}
+
+    def tecla(self, e=None):
+        """on_change del campo: reinicia la espera y cancela la consulta en curso."""
+        texto = e.control.value if e is not None else ""
+        with self._lock:
+            generacion = self._descartar_pendiente()
+            self._temporizador = threading.Timer(self.espera, self._ejecutar, (texto, generacion))
+            self._temporizador.daemon = True
+            self._temporizador.start()
+
+    def reiniciar(self):
+        """Descarta la búsqueda pendiente y el resultado guardado (se cargó por otro camino)."""
+        with self._lock:
+            self._descartar_pendiente()
+            self._anterior = None
+
+    def _descartar_pendiente(self) -> int:
+        # Con self._lock tomado
+        self._generacion += 1
+        if self._temporizador:
+            self._temporizador.cancel()
+            self._temporizador = None
+        if self._cancelacion:
+            self._cancelacion.cancelar()
+            self._cancelacion = None
+            self.stats["canceladas"] += 1
+        return self._generacion
+
+    def _ejecutar(self, texto, generacion):
+        clave = self.clave()
+        normalizado = normalizar(texto.strip())
+
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            anterior = self._anterior
+            cancelacion = None
+            if not (anterior and anterior[0] == clave and anterior[1] in normalizado):
+                cancelacion = self._cancelacion = database.Cancelacion()
+
+        if cancelacion is None:
+            # Acotar: cada fila que contiene el texto nuevo también contenía el anterior
+            filas = [f for f in anterior[2] if self.coincide(f, normalizado)]
+            total = len(filas)
+            self.stats["acotadas"] += 1
+        else:
+            try:
+                filas, total = self.buscar(texto.strip(), cancelacion)
+            except psycopg2.extensions.QueryCanceledError:
+                return
+            except Exception as e:
+                print(f"⚠️ Error en la búsqueda: {e}")
+                return
+            self.stats["consultas"] += 1
+
+        with self._lock:
+            if generacion != self._generacion:
+                return   # llegó otra tecla mientras se buscaba
+            self._cancelacion = None
+            self._temporizador = None
+            self._anterior = (clave, normalizado, filas) if len(filas) == total else None
+
+        with lote(self.page):
+            self.mostrar(texto.strip(), filas, total)
@@ -3,11 +3,22 @@
 # Soporta turnos nocturnos que cruzan medianoche
 
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 from psycopg2.extras import RealDictCursor
 from typing import List, Optional, Dict
 from datetime import datetime, date, time, timedelta
 from zoneinfo import ZoneInfo
+from collections import OrderedDict
+from contextlib import contextmanager
+import atexit
+import json
 import os
+import select
+import sys
+import threading
+import time as time_mod
+import weakref
 
 # URL de conexión desde variable de entorno o directa
 DATABASE_URL = os.getenv(
@@ -18,6 +29,7 @@ DATABASE_URL = os.getenv(
 # Definición de turnos
 TURNOS = {
     "DIA": {
+        "id": 1,
         "nombre": "Turno Día",
         "inicio": "09:00:00",
         "fin": "16:00:00",
@@ -25,6 +37,7 @@ TURNOS = {
         "cruza_medianoche": False
     },
     "NOCHE": {
+        "id": 2,
         "nombre": "Turno Noche",
         "inicio": "16:00:00",
         "fin": "23:59:59",  # Puede extenderse hasta después de medianoche
@@ -39,339 +52,1237 @@ def detectar_turno_automatico(hora_str: str) -> str:
     hora_16 = time(16, 0, 0)
     return "DIA" if h < hora_16 else "NOCHE"
 
+def formatear_duracion(segundos: Optional[int]) -> Optional[str]:
+    """Segundos trabajados a texto H:MM:SS, el formato que muestran reportes y exportaciones."""
+    if segundos is None:
+        return None
+    horas, resto = divmod(int(segundos), 3600)
+    minutos, segs = divmod(resto, 60)
+    return f"{horas}:{minutos:02d}:{segs:02d}"
+
+# ---------- Pool de conexiones ----------
+# Tamaño del pool y tiempos configurables por variables de entorno
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "2"))                   # conexiones que se mantienen abiertas
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))                  # máximo de conexiones simultáneas
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))        # segundos esperando una conexión libre
+POOL_IDLE_CHECK = float(os.getenv("DB_POOL_IDLE_CHECK", "30"))  # segundos ociosa antes de verificarla
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))     # segundos ociosa antes de cerrar las sobrantes
+
+# Keepalive TCP para que el proxy remoto no corte conexiones ociosas
+KEEPALIVE = {
+    "keepalives": 1,
+    "keepalives_idle": int(os.getenv("DB_KEEPALIVE_IDLE", "30")),
+    "keepalives_interval": 10,
+    "keepalives_count": 3,
+}
+
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(POOL_MAX)
+_libres = []  # pila LIFO de (conexión, último uso)
+_pool_stats = {
+    "creadas": 0,
+    "prestadas": 0,
+    "devueltas": 0,
+    "descartadas": 0,
+    "esperas": 0,
+    "timeouts": 0,
+    "abiertas": 0,
+    "en_uso": 0,
+}
+
+
+def _nueva_conexion():
+    conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor, **KEEPALIVE)
+    with _pool_lock:
+        _pool_stats["creadas"] += 1
+        _pool_stats["abiertas"] += 1
+    return conn
+
+
+def _descartar(conn):
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+    with _pool_lock:
+        _pool_stats["descartadas"] += 1
+        _pool_stats["abiertas"] -= 1
+
+
+def _conexion_sana(conn, ultimo_uso: float) -> bool:
+    """Verifica con SELECT 1 las conexiones que llevan tiempo ociosas."""
+    if conn.closed:
+        return False
+    if time_mod.monotonic() - ultimo_uso < POOL_IDLE_CHECK:
+        return True
+    try:
+        c = conn.cursor()
+        c.execute("SELECT 1")
+        c.close()
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+
 def get_connection():
-    """Abrir conexión PostgreSQL."""
-    return psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+    """Tomar una conexión del pool (espera hasta POOL_TIMEOUT si está lleno)."""
+    if not _pool_slots.acquire(blocking=False):
+        with _pool_lock:
+            _pool_stats["esperas"] += 1
+        if not _pool_slots.acquire(timeout=POOL_TIMEOUT):
+            with _pool_lock:
+                _pool_stats["timeouts"] += 1
+            raise psycopg2.pool.PoolError("No hay conexiones libres en el pool")
 
-def initialize_database():
-    """Crear tablas si no existen."""
+    try:
+        while True:
+            with _pool_lock:
+                item = _libres.pop() if _libres else None
+            if item is None:
+                conn = _nueva_conexion()
+                break
+            conn, ultimo_uso = item
+            if _conexion_sana(conn, ultimo_uso):
+                break
+            _descartar(conn)
+    except Exception:
+        _pool_slots.release()
+        raise
+
+    with _pool_lock:
+        _pool_stats["prestadas"] += 1
+        _pool_stats["en_uso"] += 1
+    return conn
+
+
+def release_connection(conn):
+    """Devolver una conexión al pool; las rotas o sobrantes se cierran."""
+    try:
+        if not conn.closed:
+            estado = conn.info.transaction_status
+            if estado == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                conn.close()
+            elif estado != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+    except psycopg2.Error:
+        pass
+
+    ahora = time_mod.monotonic()
+    sobrantes = []
+    with _pool_lock:
+        _pool_stats["devueltas"] += 1
+        _pool_stats["en_uso"] -= 1
+        if not conn.closed:
+            _libres.append((conn, ahora))
+        # Cerrar las ociosas por encima de POOL_MIN (las más antiguas están al fondo)
+        while len(_libres) > POOL_MIN and ahora - _libres[0][1] > POOL_MAX_IDLE:
+            sobrantes.append(_libres.pop(0)[0])
+
+    if conn.closed:
+        sobrantes.append(conn)
+    for vieja in sobrantes:
+        _descartar(vieja)
+    _pool_slots.release()
+
+
+class Cancelacion:
+    """
+    Permite cancelar desde otro hilo la consulta que corre con conexion(cancelacion).
+    La consulta cancelada lanza psycopg2.extensions.QueryCanceledError.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.cancelada = False
+
+    def cancelar(self):
+        with self._lock:
+            self.cancelada = True
+            if self._conn is not None and not self._conn.closed:
+                try:
+                    self._conn.cancel()   # pide al servidor que corte la sentencia en curso
+                except psycopg2.Error:
+                    pass
+
+    def _vigilar(self, conn):
+        with self._lock:
+            if self.cancelada:
+                raise psycopg2.extensions.QueryCanceledError("consulta cancelada")
+            self._conn = conn
+
+    def _soltar(self):
+        with self._lock:
+            self._conn = None
+
+
+@contextmanager
+def conexion(cancelacion: "Cancelacion" = None):
+    """Conexión prestada del pool; hace rollback si hay error y siempre la devuelve."""
     conn = get_connection()
-    c = conn.cursor()
-    
-    # Tabla empleados
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS empleados (
-        id SERIAL PRIMARY KEY,
-        nombre TEXT NOT NULL,
-        cedula TEXT UNIQUE NOT NULL,
-        numero TEXT,
-        activo BOOLEAN DEFAULT TRUE
-    );
-    """)
-    
-    # Tabla asistencias
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS asistencias (
-        id SERIAL PRIMARY KEY,
-        empleado_id INTEGER NOT NULL,
-        fecha DATE NOT NULL,
-        hora_llegada TIME,
-        hora_salida TIME,
-        turno TEXT NOT NULL,
-        llego_tarde TEXT DEFAULT 'NO',
-        horas_trabajadas TEXT,
-        turno_completado BOOLEAN DEFAULT FALSE,
-        FOREIGN KEY (empleado_id) REFERENCES empleados(id)
-    );
-    """)
-    
-    # Índices para mejor rendimiento
-    c.execute("""
-    CREATE INDEX IF NOT EXISTS idx_asistencias_empleado_fecha 
-    ON asistencias(empleado_id, fecha);
-    """)
-    
-    c.execute("""
-    CREATE INDEX IF NOT EXISTS idx_empleados_cedula 
-    ON empleados(cedula);
-    """)
-    
-    # Agregar columna turno_completado si no existe
     try:
-        c.execute("""
-        ALTER TABLE asistencias 
-        ADD COLUMN IF NOT EXISTS turno_completado BOOLEAN DEFAULT FALSE;
-        """)
-        conn.commit()
-    except:
+        if cancelacion:
+            cancelacion._vigilar(conn)
+        yield conn
+    except Exception:
+        if not conn.closed:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                pass
+        raise
+    finally:
+        if cancelacion:
+            cancelacion._soltar()
+        release_connection(conn)
+
+
+@contextmanager
+def conexion_autocommit():
+    """Conexión en autocommit: cada sentencia es su propia transacción, sin BEGIN/COMMIT aparte."""
+    with conexion() as conn:
+        conn.autocommit = True
+        try:
+            yield conn
+        finally:
+            if not conn.closed:
+                conn.autocommit = False
+
+
+def iniciar_pool():
+    """Abre POOL_MIN conexiones por adelantado para que la primera marcación no espere."""
+    with _pool_lock:
+        faltan = POOL_MIN - len(_libres) - _pool_stats["en_uso"]
+    for _ in range(max(faltan, 0)):
+        conn = _nueva_conexion()
+        with _pool_lock:
+            _libres.append((conn, time_mod.monotonic()))
+
+
+def estadisticas_pool() -> Dict:
+    """Estadísticas del pool para monitoreo."""
+    with _pool_lock:
+        stats = dict(_pool_stats)
+        stats["libres"] = len(_libres)
+    stats["min"] = POOL_MIN
+    stats["max"] = POOL_MAX
+    return stats
+
+
+def cerrar_pool():
+    """Cierra las conexiones ociosas del pool (al apagar el proceso)."""
+    with _pool_lock:
+        viejas = [conn for conn, _ in _libres]
+        _libres.clear()
+    for conn in viejas:
+        _descartar(conn)
+
+
+atexit.register(cerrar_pool)
+
+# ---------- Esquema ----------
+def initialize_database():
+    """Aplica las migraciones pendientes (ver migraciones.py)."""
+    import migraciones
+    migraciones.aplicar()
+
+def verificar_esquema() -> bool:
+    """
+    Compara la versión del esquema con la que espera el código: una sola consulta,
+    sin DDL. Las migraciones se aplican aparte con: python app/migraciones.py aplicar
+    """
+    import migraciones
+    version = migraciones.version_actual()
+    if version is None:
+        print("❌ Base de datos sin versionar: ejecute python app/migraciones.py aplicar")
+        return False
+    if version < migraciones.VERSION_ESQUEMA:
+        print(f"❌ Esquema en versión {version}, se requiere {migraciones.VERSION_ESQUEMA}: "
+              "ejecute python app/migraciones.py aplicar")
+        return False
+    return True
+
+# ---------- Avisos entre procesos (LISTEN/NOTIFY) ----------
+# Un solo hilo por proceso escucha los canales de CANALES_AVISOS con una conexión
+# propia (fuera del pool) y reparte cada aviso a los suscriptores de ese canal.
+# Al conectar o reconectar se llama a cada suscriptor con payload None: pudo
+# perderse algún aviso y debe recargar su estado.
+
+CANALES_AVISOS = (
+    "empleados_cambios",        # id del empleado, o '*' (migración 007)
+    "asistencias_marcaciones",  # JSON con la fila de asistencias (migración 010)
+)
+AVISOS_REINTENTO = 5.0   # segundos antes de reconectar el hilo que escucha
+AVISOS = os.getenv("DB_AVISOS", "1") != "0"   # 0 en procesos auxiliares (exportaciones): sin hilo ni cachés
+
+_avisos_lock = threading.Lock()
+_avisos_suscriptores: Dict[str, list] = {canal: [] for canal in CANALES_AVISOS}
+_avisos_hilo: Optional[threading.Thread] = None
+_avisos_detener = threading.Event()
+
+
+def suscribir_aviso(canal: str, callback, convertir=None):
+    """
+    Llama a callback(payload) por cada aviso del canal, desde el hilo que escucha;
+    con `convertir`, recibe convertir(payload). Los métodos se guardan con
+    referencia débil: si el objeto (una vista, por ejemplo) se libera, la
+    suscripción desaparece sola.
+    """
+    ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+    with _avisos_lock:
+        _avisos_suscriptores[canal].append((ref, convertir))
+
+
+def cancelar_aviso(canal: str, callback):
+    with _avisos_lock:
+        _avisos_suscriptores[canal] = [
+            (ref, convertir) for ref, convertir in _avisos_suscriptores[canal]
+            if ref() not in (None, callback)
+        ]
+
+
+def _repartir_aviso(canal: str, payload: Optional[str]):
+    with _avisos_lock:
+        _avisos_suscriptores[canal] = [(ref, cv) for ref, cv in _avisos_suscriptores[canal] if ref()]
+        suscriptores = [(ref(), cv) for ref, cv in _avisos_suscriptores[canal]]
+    convertidos = {}
+    for callback, convertir in suscriptores:
+        if callback is None:
+            continue
+        try:
+            valor = payload
+            if convertir and payload is not None:
+                # Una sola conversión por aviso aunque haya varios suscriptores
+                if convertir not in convertidos:
+                    convertidos[convertir] = convertir(payload)
+                valor = convertidos[convertir]
+            callback(valor)
+        except Exception as e:
+            print(f"⚠️ Error atendiendo aviso de {canal}: {e}")
+
+
+def _escuchar_avisos():
+    while not _avisos_detener.is_set():
+        conn = None
+        try:
+            conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor, **KEEPALIVE)
+            conn.autocommit = True
+            c = conn.cursor()
+            for canal in CANALES_AVISOS:
+                c.execute(f"LISTEN {canal}")
+            # Después de LISTEN: un cambio durante la recarga llega igual como aviso
+            for canal in CANALES_AVISOS:
+                _repartir_aviso(canal, None)
+
+            while not _avisos_detener.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                avisos = list(conn.notifies)
+                conn.notifies.clear()
+                for aviso in avisos:
+                    _repartir_aviso(aviso.channel, aviso.payload)
+        except (psycopg2.Error, OSError) as e:
+            print(f"⚠️ Sin avisos de la BD, se reintenta en {AVISOS_REINTENTO:.0f}s: {e}")
+        finally:
+            _cache_desconectada()
+            _reportes_desconectada()
+            if conn is not None:
+                try:
+                    conn.close()
+                except psycopg2.Error:
+                    pass
+        _avisos_detener.wait(AVISOS_REINTENTO)
+
+
+def iniciar_avisos():
+    """Arranca el hilo que escucha los avisos (una vez por proceso)."""
+    global _avisos_hilo
+    if _avisos_hilo and _avisos_hilo.is_alive():
+        return
+    _avisos_detener.clear()
+    _avisos_hilo = threading.Thread(target=_escuchar_avisos, name="avisos-bd", daemon=True)
+    _avisos_hilo.start()
+
+
+def detener_avisos():
+    """Detiene el hilo; las cachés de empleados y reportes dejan de usarse."""
+    _avisos_detener.set()
+    _cache_desconectada()
+    _reportes_desconectada()
+
+
+atexit.register(detener_avisos)
+
+# ---------- Caché de empleados ----------
+# Copia en memoria de los empleados activos, por cédula y por id. Se mantiene con
+# los avisos de empleados_cambios y se refresca solo el empleado que cambió, así
+# que las consultas del kiosco no van a la BD. Mientras el hilo de avisos no esté
+# escuchando la caché no se usa y todo se lee de la BD.
+
+CACHE_EMPLEADOS = os.getenv("DB_CACHE_EMPLEADOS", "1") != "0"
+
+_cache_lock = threading.Lock()
+_cache_por_cedula: Dict[str, Dict] = {}
+_cache_por_id: Dict[int, Dict] = {}
+_cache_valida = False
+_cache_stats = {
+    "aciertos": 0,
+    "fallos": 0,
+    "invalidaciones": 0,
+    "recargas": 0,
+}
+
+
+def _cache_quitar(emp_id: int):
+    viejo = _cache_por_id.pop(emp_id, None)
+    if viejo:
+        _cache_por_cedula.pop(viejo["cedula"], None)
+
+
+def _cache_recargar(c):
+    c.execute("SELECT * FROM empleados WHERE activo = TRUE")
+    filas = [dict(row) for row in c.fetchall()]
+    global _cache_valida
+    with _cache_lock:
+        _cache_por_id.clear()
+        _cache_por_cedula.clear()
+        for emp in filas:
+            _cache_por_id[emp["id"]] = emp
+            _cache_por_cedula[emp["cedula"]] = emp
+        _cache_valida = True
+        _cache_stats["recargas"] += 1
+
+
+def _cache_refrescar(c, emp_id: int):
+    c.execute("SELECT * FROM empleados WHERE id = %s AND activo = TRUE", (emp_id,))
+    row = c.fetchone()
+    with _cache_lock:
+        _cache_quitar(emp_id)
+        if row:
+            emp = dict(row)
+            _cache_por_id[emp["id"]] = emp
+            _cache_por_cedula[emp["cedula"]] = emp
+        _cache_stats["invalidaciones"] += 1
+
+
+def _cache_aviso(payload: Optional[str]):
+    """Suscriptor de empleados_cambios: None o '*' recargan todo, un id refresca ese empleado."""
+    with conexion() as conn:
+        c = conn.cursor()
+        if payload is None or payload == "*":
+            _cache_recargar(c)
+        else:
+            _cache_refrescar(c, int(payload))
         conn.rollback()
-    
-    conn.commit()
-    conn.close()
+
+
+def _cache_desconectada():
+    global _cache_valida
+    with _cache_lock:
+        _cache_valida = False
+
+
+if CACHE_EMPLEADOS:
+    suscribir_aviso("empleados_cambios", _cache_aviso)
+
+
+def _cache_invalidar(emp_id: int):
+    """
+    Refresca en el acto el empleado que este proceso acaba de escribir (si no, un
+    empleado recién creado pasaría por desconocido hasta que llegue el aviso).
+    Los demás procesos se enteran por NOTIFY.
+    """
+    if not _cache_valida:
+        return
+    try:
+        with conexion() as conn:
+            _cache_refrescar(conn.cursor(), emp_id)
+            conn.rollback()
+    except psycopg2.Error:
+        pass   # el aviso de NOTIFY lo refrescará igual
+
+
+def _cache_buscar(indice: Dict, clave):
+    """
+    Retorna (encontrado, empleado). Con la caché válida una clave ausente es
+    definitiva (no hay tal empleado activo) y tampoco requiere ir a la BD.
+    """
+    with _cache_lock:
+        if not _cache_valida:
+            _cache_stats["fallos"] += 1
+            return False, None
+        _cache_stats["aciertos"] += 1
+        emp = indice.get(clave)
+        return True, dict(emp) if emp else None
+
+
+def estadisticas_cache_empleados() -> Dict:
+    """Aciertos, fallos (consultas que fueron a la BD) y tamaño de la caché."""
+    with _cache_lock:
+        stats = dict(_cache_stats)
+        stats["empleados"] = len(_cache_por_id)
+        stats["valida"] = _cache_valida
+    return stats
+
 
 # ---------- CRUD Empleados ----------
 def crear_empleado(nombre: str, cedula: str, numero: str = "") -> int:
-    conn = get_connection()
-    c = conn.cursor()
-    try:
-        c.execute("""
-            INSERT INTO empleados (nombre, cedula, numero) 
-            VALUES (%s, %s, %s) RETURNING id
-        """, (nombre.strip(), cedula.strip(), numero.strip()))
-        emp_id = c.fetchone()["id"]
-        conn.commit()
-    except psycopg2.IntegrityError:
-        conn.rollback()
-        c.execute("SELECT id FROM empleados WHERE cedula = %s", (cedula.strip(),))
-        row = c.fetchone()
-        emp_id = row["id"] if row else None
-    finally:
-        conn.close()
+    with conexion() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("""
+                INSERT INTO empleados (nombre, cedula, numero) 
+                VALUES (%s, %s, %s) RETURNING id
+            """, (nombre.strip(), cedula.strip(), numero.strip()))
+            emp_id = c.fetchone()["id"]
+            conn.commit()
+            _cache_invalidar(emp_id)
+        except psycopg2.IntegrityError:
+            conn.rollback()
+            c.execute("SELECT id FROM empleados WHERE cedula = %s", (cedula.strip(),))
+            row = c.fetchone()
+            emp_id = row["id"] if row else None
     return emp_id
 
 def actualizar_empleado(emp_id: int, nombre: str, cedula: str, numero: str) -> bool:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        UPDATE empleados 
-        SET nombre = %s, cedula = %s, numero = %s 
-        WHERE id = %s
-    """, (nombre.strip(), cedula.strip(), numero.strip(), emp_id))
-    conn.commit()
-    affected = c.rowcount
-    conn.close()
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("""
+            UPDATE empleados 
+            SET nombre = %s, cedula = %s, numero = %s 
+            WHERE id = %s
+        """, (nombre.strip(), cedula.strip(), numero.strip(), emp_id))
+        conn.commit()
+        affected = c.rowcount
+    _cache_invalidar(emp_id)
+    _reportes_invalidar()
     return affected > 0
 
 def eliminar_empleado(emp_id: int) -> bool:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("DELETE FROM asistencias WHERE empleado_id = %s", (emp_id,))
-    c.execute("DELETE FROM empleados WHERE id = %s", (emp_id,))
-    conn.commit()
-    affected = c.rowcount
-    conn.close()
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM asistencias WHERE empleado_id = %s", (emp_id,))
+        c.execute("DELETE FROM empleados WHERE id = %s", (emp_id,))
+        conn.commit()
+        affected = c.rowcount
+    _cache_invalidar(emp_id)
+    _reportes_invalidar()
     return affected > 0
 
-def obtener_empleados() -> List[Dict]:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
+def _filtro_empleados(filtro_texto: str = None):
+    """Condición de búsqueda por nombre (sin tildes) o cédula, como en reportes."""
+    if not filtro_texto:
+        return "", []
+    like = f"%{_escapar_like(filtro_texto)}%"
+    return " AND (f_unaccent(nombre) ILIKE f_unaccent(%s) OR cedula ILIKE %s)", [like, like]
+
+def obtener_empleados(limite: int = None, despues_de: tuple = None,
+                      filtro_texto: str = None, cancelacion: Cancelacion = None) -> List[Dict]:
+    """
+    Empleados activos por nombre. Con `limite` se obtiene una sola página;
+    `despues_de` es el cursor (nombre, id) de la última fila de la anterior.
+    """
+    sql = """
         SELECT id, nombre, cedula, numero 
         FROM empleados 
         WHERE activo = TRUE 
-        ORDER BY nombre
-    """)
-    rows = c.fetchall()
-    conn.close()
+    """
+    sql_filtro, params = _filtro_empleados(filtro_texto)
+    sql += sql_filtro
+    if despues_de:
+        sql += " AND (nombre, id) > (%s, %s)"
+        params.extend(despues_de)
+    sql += " ORDER BY nombre, id"
+    if limite:
+        sql += " LIMIT %s"
+        params.append(limite)
+
+    with conexion(cancelacion) as conn:
+        c = conn.cursor()
+        c.execute(sql, tuple(params))
+        rows = c.fetchall()
     return [dict(row) for row in rows]
 
+def cursor_empleado(fila: Dict) -> tuple:
+    """Cursor de paginación (nombre, id) de obtener_empleados."""
+    return (fila["nombre"], fila["id"])
+
+def contar_empleados(filtro_texto: str = None, cancelacion: Cancelacion = None) -> int:
+    # Con la caché al día no hace falta ir a la BD
+    if not filtro_texto:
+        with _cache_lock:
+            if _cache_valida:
+                return len(_cache_por_id)
+    sql_filtro, params = _filtro_empleados(filtro_texto)
+    with conexion(cancelacion) as conn:
+        c = conn.cursor()
+        c.execute("SELECT COUNT(*) AS total FROM empleados WHERE activo = TRUE" + sql_filtro, tuple(params))
+        row = c.fetchone()
+    return row["total"]
+
 def obtener_empleado_por_cedula(cedula: str) -> Optional[Dict]:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        SELECT * FROM empleados 
-        WHERE cedula = %s AND activo = TRUE
-    """, (cedula.strip(),))
-    row = c.fetchone()
-    conn.close()
+    encontrado, emp = _cache_buscar(_cache_por_cedula, cedula.strip())
+    if encontrado:
+        return emp
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT * FROM empleados 
+            WHERE cedula = %s AND activo = TRUE
+        """, (cedula.strip(),))
+        row = c.fetchone()
     return dict(row) if row else None
 
 def obtener_empleado_por_id(emp_id: int) -> Optional[Dict]:
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("SELECT * FROM empleados WHERE id = %s", (emp_id,))
-    row = c.fetchone()
-    conn.close()
+    # La caché solo tiene activos: un id ausente puede ser un empleado inactivo
+    encontrado, emp = _cache_buscar(_cache_por_id, emp_id)
+    if emp:
+        return emp
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM empleados WHERE id = %s", (emp_id,))
+        row = c.fetchone()
     return dict(row) if row else None
 
 # ---------- Sistema de Marcación con Turnos ----------
-def obtener_asistencia_hoy(empleado_id: int) -> Optional[Dict]:
+# Minutos desde la llegada en los que otra marcación se toma como repetida (doble
+# Enter, o el empleado que vuelve a poner la cédula para comprobar) y no cierra el turno
+MARCAR_INTERVALO_MINIMO = int(os.getenv("MARCAR_INTERVALO_MINIMO", "5"))
+
+def marcar(cedula: str) -> Optional[Dict]:
     """
-    Verifica si el empleado tiene registro activo (hoy o ayer sin completar).
-    Esto permite que turnos nocturnos marquen salida después de medianoche.
+    Marca llegada o salida según el estado del turno, en un solo viaje a la BD.
+    Retorna None si la cédula no pertenece a un empleado activo.
+    tipo: 'LLEGADA', 'SALIDA', 'COMPLETO' (jornada ya cerrada) o 'DUPLICADO'
+    (a menos de MARCAR_INTERVALO_MINIMO de la llegada); en los dos últimos no se
+    escribe nada.
     """
     ahora = datetime.now(ZoneInfo("America/Bogota"))
-    hoy = ahora.date()
-    ayer = hoy - timedelta(days=1)
-    
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Primero buscar registro de hoy
-    c.execute("""
-        SELECT * FROM asistencias 
-        WHERE empleado_id = %s AND fecha = %s
-        ORDER BY id DESC LIMIT 1
-    """, (empleado_id, hoy))
-    registro_hoy = c.fetchone()
-    
-    # Si hay registro de hoy, retornarlo
-    if registro_hoy:
-        conn.close()
-        return dict(registro_hoy)
-    
-    # Si es antes de las 6 AM, buscar turno de ayer sin completar (turno nocturno)
-    if ahora.hour < 6:
-        c.execute("""
-            SELECT * FROM asistencias 
-            WHERE empleado_id = %s 
-            AND fecha = %s 
-            AND turno_completado = FALSE
-            AND hora_salida IS NULL
-            ORDER BY id DESC LIMIT 1
-        """, (empleado_id, ayer))
-        registro_ayer = c.fetchone()
-        
-        if registro_ayer:
-            conn.close()
-            return dict(registro_ayer)
-    
-    conn.close()
-    return None
-
-def registrar_llegada(empleado_id: int) -> dict:
-    """Registra la hora de llegada del empleado con detección automática de turno."""
-    ahora = datetime.now(ZoneInfo("America/Bogota"))
-    fecha = ahora.date()
     hora = ahora.time()
     hora_str = hora.strftime("%H:%M:%S")
-    
+
     turno_key = detectar_turno_automatico(hora_str)
     turno_info = TURNOS[turno_key]
+    tarde = hora_str > turno_info["limite_tarde"]
 
-    limite_tarde = turno_info["limite_tarde"]
-    llego_tarde = "SI" if hora_str > limite_tarde else "NO"
+    # Cédula desconocida: se responde desde la caché sin ocupar una conexión
+    encontrado, emp = _cache_buscar(_cache_por_cedula, cedula.strip())
+    if encontrado and emp is None:
+        return None
 
-    conn = get_connection()
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO asistencias (empleado_id, fecha, hora_llegada, turno, llego_tarde, turno_completado)
-        VALUES (%s, %s, %s, %s, %s, FALSE)
-    """, (empleado_id, fecha, hora, turno_info["nombre"], llego_tarde))
-    conn.commit()
-    conn.close()
+    with conexion_autocommit() as conn:
+        c = conn.cursor()
+        c.execute(
+            "SELECT * FROM marcar_asistencia(%s, %s, %s, %s, %s::smallint, %s, %s)",
+            (cedula.strip(), ahora.date(), hora, ahora.hour < 6, turno_info["id"], tarde,
+             MARCAR_INTERVALO_MINIMO * 60),
+        )
+        row = c.fetchone()
+
+    if not row:
+        return None
 
+    row = dict(row)
+    if row["tipo"] in ("LLEGADA", "SALIDA"):
+        _reportes_invalidar(row["fecha"])
     return {
-        "fecha": fecha.strftime("%Y-%m-%d"),
+        "tipo": row["tipo"],
+        "empleado": {
+            "id": row["empleado_id"],
+            "nombre": row["nombre"],
+            "cedula": row["cedula"],
+            "numero": row["numero"],
+        },
+        "fecha": row["fecha"].strftime("%Y-%m-%d"),
         "hora": hora_str,
-        "tipo": "LLEGADA",
-        "turno": turno_info["nombre"],
-        "tarde": llego_tarde
+        "hora_llegada": row["hora_llegada"],
+        "hora_salida": row["hora_salida"],
+        "turno": row["turno"],
+        "tarde": "SI" if row["tarde"] else "NO",
+        "horas": formatear_duracion(row["segundos_trabajados"]),
     }
 
-def registrar_salida(empleado_id: int) -> dict:
+def _marcacion_desde_aviso(payload: str) -> Dict:
     """
-    Registra la hora de salida del empleado.
-    Permite salidas después de medianoche para turnos nocturnos.
+    Fila de asistencias publicada por trg_asistencias_notificar, con los mismos
+    campos que consultar_asistencias. El empleado sale de la caché.
     """
-    ahora = datetime.now(ZoneInfo("America/Bogota"))
-    hoy = ahora.date()
-    ayer = hoy - timedelta(days=1)
-    hora_salida = ahora.time()
-    hora_salida_str = hora_salida.strftime("%H:%M:%S")
+    fila = json.loads(payload)
+    fila["fecha"] = date.fromisoformat(fila["fecha"])
+    if fila["op"] == "DELETE":
+        return fila
+    emp = obtener_empleado_por_id(fila["empleado_id"]) or {}
+    turno = next((t for t in TURNOS.values() if t["id"] == fila["turno_id"]), None)
+    fila.update({
+        "nombre": emp.get("nombre"),
+        "cedula": emp.get("cedula"),
+        "numero": emp.get("numero"),
+        "turno": turno["nombre"] if turno else None,
+        "llego_tarde": "SI" if fila["tarde"] else "NO",
+        "horas_trabajadas": formatear_duracion(fila["segundos_trabajados"]),
+    })
+    return fila
 
-    conn = get_connection()
-    c = conn.cursor()
-    
-    # Buscar registro activo (hoy o ayer si es madrugada)
-    registro = None
-    
-    # Primero buscar en hoy
-    c.execute("""
-        SELECT * FROM asistencias 
-        WHERE empleado_id = %s AND fecha = %s
-        ORDER BY id DESC LIMIT 1
-    """, (empleado_id, hoy))
-    registro = c.fetchone()
-    
-    # Si es madrugada (antes de las 6 AM) y no hay registro hoy, buscar ayer
-    if not registro and ahora.hour < 6:
-        c.execute("""
-            SELECT * FROM asistencias 
-            WHERE empleado_id = %s 
-            AND fecha = %s 
-            AND turno_completado = FALSE
-            AND hora_salida IS NULL
-            ORDER BY id DESC LIMIT 1
-        """, (empleado_id, ayer))
-        registro = c.fetchone()
-
-    if registro and registro["hora_llegada"]:
-        hora_llegada = registro["hora_llegada"]
-        fecha_registro = registro["fecha"]
-        
-        # Convertir a datetime para calcular diferencia
-        fecha_llegada_dt = datetime.combine(fecha_registro, hora_llegada)
-        
-        # Si la salida es al día siguiente (después de medianoche)
-        if ahora.date() > fecha_registro:
-            fecha_salida_dt = datetime.combine(ahora.date(), hora_salida)
-        else:
-            fecha_salida_dt = datetime.combine(fecha_registro, hora_salida)
-        
-        # Calcular horas trabajadas
-        delta = fecha_salida_dt - fecha_llegada_dt
-        horas_trabajadas = str(delta).split('.')[0]
+def suscribir_marcaciones(callback):
+    """
+    callback(fila) por cada llegada o salida registrada en cualquier proceso, con
+    fila["op"] = 'INSERT', 'UPDATE' o 'DELETE' y los campos de consultar_asistencias.
+    Recibe None al (re)conectarse el hilo de avisos: pudieron perderse
+    marcaciones y hay que recargar.
+    """
+    suscribir_aviso("asistencias_marcaciones", callback, convertir=_marcacion_desde_aviso)
 
-        c.execute("""
-            UPDATE asistencias 
-            SET hora_salida = %s, horas_trabajadas = %s, turno_completado = TRUE
-            WHERE id = %s
-        """, (hora_salida, horas_trabajadas, registro["id"]))
-        conn.commit()
-        conn.close()
+def cancelar_marcaciones(callback):
+    cancelar_aviso("asistencias_marcaciones", callback)
+
+# ---------- Caché de reportes ----------
+# Resultados de consultar_asistencias y contar_asistencias por filtros normalizados.
+# Las sesiones de supervisores repiten los mismos rangos (Hoy, Semana, Mes) y la
+# exportación vuelve a pedir lo que la tabla acaba de mostrar. Cada entrada dura
+# CACHE_REPORTES_TTL segundos; al escribir una marcación se descartan las entradas
+# cuyo rango de fechas incluye esa fecha (en este proceso en el acto, en los demás
+# por el aviso asistencias_marcaciones). Si se pasa de CACHE_REPORTES_MB se
+# descartan las menos usadas. Las filas devueltas se comparten: no modificarlas.
+# Una consulta que estaba en curso cuando se invalidó su rango no se guarda (su
+# resultado puede ser anterior a la escritura), y mientras el hilo de avisos está
+# desconectado la caché no se usa, como la de empleados.
+
+CACHE_REPORTES_TTL = float(os.getenv("DB_CACHE_REPORTES_TTL", "60"))   # 0 desactiva la caché
+CACHE_REPORTES_BYTES = int(float(os.getenv("DB_CACHE_REPORTES_MB", "32")) * 1024 * 1024)
+
+_reportes_lock = threading.Lock()
+_reportes_cache: "OrderedDict[tuple, tuple]" = OrderedDict()   # clave -> (expira, desde, hasta, valor, bytes)
+_reportes_bytes = 0
+_reportes_en_curso: Dict[int, list] = {}   # id -> [desde, hasta, vigente] de cada consulta en curso
+_reportes_valida = False   # True mientras el hilo de avisos está conectado
+_reportes_stats = {
+    "aciertos": 0,
+    "fallos": 0,
+    "expiradas": 0,
+    "invalidaciones": 0,
+    "desalojos": 0,
+}
+
+
+def _fecha_normalizada(valor) -> Optional[date]:
+    if not valor:
+        return None
+    if isinstance(valor, date):
+        return valor
+    return date.fromisoformat(str(valor).strip())
+
+
+def _reportes_clave(tipo: str, f_inicio, f_fin, filtro_texto, solo_tarde,
+                    limite=None, despues_de=None) -> Optional[tuple]:
+    """
+    Clave de caché y rango de fechas (desde, hasta) que abarca la consulta, o None
+    si no se puede cachear (fecha mal escrita: que la BD dé el error de siempre).
+    """
+    try:
+        desde = _fecha_normalizada(f_inicio)
+        hasta = _fecha_normalizada(f_fin)
+    except ValueError:
+        return None
+    texto = (filtro_texto or "").strip().lower() or None   # ILIKE no distingue mayúsculas
+    clave = (tipo, desde, hasta, texto, bool(solo_tarde), limite, tuple(despues_de) if despues_de else None)
+    if despues_de:
+        # Con cursor solo se leen fechas hasta la del cursor
+        hasta = min(hasta, despues_de[0]) if hasta else despues_de[0]
+    return clave, desde or date.min, hasta or date.max
+
+
+def _tamano_aproximado(valor) -> int:
+    if not isinstance(valor, list):
+        return sys.getsizeof(valor)
+    return sys.getsizeof(valor) + sum(
+        sys.getsizeof(fila) + sum(sys.getsizeof(v) for v in fila.values()) for fila in valor
+    )
+
+
+def _reportes_leer(clave):
+    with _reportes_lock:
+        entrada = _reportes_cache.get(clave)
+        if entrada is None:
+            _reportes_stats["fallos"] += 1
+            return False, None
+        if entrada[0] < time_mod.monotonic():
+            _reportes_quitar(clave)
+            _reportes_stats["expiradas"] += 1
+            _reportes_stats["fallos"] += 1
+            return False, None
+        _reportes_cache.move_to_end(clave)
+        _reportes_stats["aciertos"] += 1
+        return True, entrada[3]
 
-        return {
-            "fecha": fecha_registro.strftime("%Y-%m-%d"),
-            "hora": hora_salida_str,
-            "tipo": "SALIDA",
-            "horas": horas_trabajadas
-        }
 
-    conn.close()
-    return None
+def _reportes_guardar(clave, desde, hasta, valor, consulta: list):
+    """Guarda el resultado de `consulta` salvo que una escritura haya invalidado su rango mientras corría."""
+    global _reportes_bytes
+    tamano = _tamano_aproximado(valor)
+    with _reportes_lock:
+        _reportes_en_curso.pop(id(consulta), None)
+        if not consulta[2] or not _reportes_valida or tamano > CACHE_REPORTES_BYTES:
+            return
+        _reportes_quitar(clave)
+        _reportes_cache[clave] = (time_mod.monotonic() + CACHE_REPORTES_TTL, desde, hasta, valor, tamano)
+        _reportes_bytes += tamano
+        while _reportes_bytes > CACHE_REPORTES_BYTES:
+            _reportes_quitar(next(iter(_reportes_cache)))
+            _reportes_stats["desalojos"] += 1
+
+
+def _reportes_quitar(clave):
+    # Con _reportes_lock tomado
+    global _reportes_bytes
+    entrada = _reportes_cache.pop(clave, None)
+    if entrada:
+        _reportes_bytes -= entrada[4]
+
+
+def _reportes_invalidar(fecha=None):
+    """Descarta las entradas que incluyen `fecha` (todas si es None), también las que se están consultando."""
+    with _reportes_lock:
+        for consulta in _reportes_en_curso.values():
+            if fecha is None or consulta[0] <= fecha <= consulta[1]:
+                consulta[2] = False
+        claves = [
+            clave for clave, entrada in _reportes_cache.items()
+            if fecha is None or entrada[1] <= fecha <= entrada[2]
+        ]
+        for clave in claves:
+            _reportes_quitar(clave)
+        _reportes_stats["invalidaciones"] += len(claves)
+
+
+def _fecha_desde_aviso(payload: str) -> date:
+    return date.fromisoformat(json.loads(payload)["fecha"])
+
+
+def _reportes_aviso_marcacion(fecha: Optional[date]):
+    """Suscriptor de asistencias_marcaciones; None (reconexión) vacía la caché y la habilita."""
+    global _reportes_valida
+    _reportes_invalidar(fecha)
+    if fecha is None:
+        with _reportes_lock:
+            _reportes_valida = True
+
+
+def _reportes_desconectada():
+    global _reportes_valida
+    with _reportes_lock:
+        _reportes_valida = False
+    _reportes_invalidar()
+
+
+def _reportes_aviso_empleado(payload: Optional[str]):
+    """Un empleado cambió de nombre o cédula (o se borró con sus asistencias)."""
+    _reportes_invalidar()
+
+
+def _reportes_cacheado(clave_rango, consultar):
+    """Valor de la caché para `clave_rango`, o el de consultar() guardándolo."""
+    if clave_rango is None or CACHE_REPORTES_TTL <= 0 or not _reportes_valida:
+        return consultar()
+    clave, desde, hasta = clave_rango
+    encontrado, valor = _reportes_leer(clave)
+    if encontrado:
+        return valor
+    consulta = [desde, hasta, True]
+    with _reportes_lock:
+        _reportes_en_curso[id(consulta)] = consulta
+    try:
+        valor = consultar()
+    except BaseException:
+        with _reportes_lock:
+            _reportes_en_curso.pop(id(consulta), None)
+        raise
+    _reportes_guardar(clave, desde, hasta, valor, consulta)
+    return valor
+
+
+def estadisticas_cache_reportes() -> Dict:
+    """Aciertos, fallos, proporción de aciertos y memoria aproximada de la caché."""
+    with _reportes_lock:
+        stats = dict(_reportes_stats)
+        stats["entradas"] = len(_reportes_cache)
+        stats["bytes"] = _reportes_bytes
+        stats["valida"] = _reportes_valida
+    consultas = stats["aciertos"] + stats["fallos"]
+    stats["proporcion_aciertos"] = round(stats["aciertos"] / consultas, 3) if consultas else None
+    return stats
+
+
+if CACHE_REPORTES_TTL > 0:
+    suscribir_aviso("asistencias_marcaciones", _reportes_aviso_marcacion, convertir=_fecha_desde_aviso)
+    suscribir_aviso("empleados_cambios", _reportes_aviso_empleado)
 
 # ---------- Consultas para reportes ----------
-def consultar_asistencias(f_inicio: str = None, f_fin: str = None,
-                          filtro_texto: str = None, solo_tarde: bool = False) -> List[Dict]:
-    """Devuelve asistencias con los datos del empleado."""
-    conn = get_connection()
-    c = conn.cursor()
+def _escapar_like(texto: str) -> str:
+    """Escapa los comodines de LIKE para buscar el texto literal."""
+    return texto.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def _filtros_asistencias(f_inicio: str = None, f_fin: str = None,
+                         filtro_texto: str = None, solo_tarde: bool = False,
+                         cambios_desde: int = None):
+    """Condiciones WHERE (sobre v_asistencias a y empleados e) y sus parámetros."""
+    sql = ""
+    params = []
+
+    if f_inicio:
+        sql += " AND a.fecha >= %s::date"
+        params.append(f_inicio)
+    if f_fin:
+        sql += " AND a.fecha <= %s::date"
+        params.append(f_fin)
+    if filtro_texto:
+        # Misma expresión que los índices de trigramas (migración 004) para que el
+        # planificador los use; f_unaccent ignora tildes: "Jose" encuentra "José"
+        sql += " AND (f_unaccent(e.nombre) ILIKE f_unaccent(%s) OR e.cedula ILIKE %s)"
+        like = f"%{_escapar_like(filtro_texto)}%"
+        params.extend([like, like])
+    if solo_tarde:
+        sql += " AND a.tarde"
+    if cambios_desde:
+        # Filas escritas por transacciones desde la marca (exportación incremental);
+        # la subconsulta usa idx_asistencias_cambio (migración 013)
+        sql += " AND a.id IN (SELECT id FROM asistencias WHERE cambio >= %s)"
+        params.append(cambios_desde)
+
+    return sql, params
+
+def cursor_asistencia(fila: Dict) -> tuple:
+    """Cursor de paginación (fecha, hora_llegada, id) a partir de una fila ya leída."""
+    return (fila["fecha"], fila["hora_llegada"], fila["id"])
+
+def sql_consultar_asistencias(f_inicio: str = None, f_fin: str = None,
+                              filtro_texto: str = None, solo_tarde: bool = False,
+                              limite: int = None, despues_de: tuple = None,
+                              cambios_desde: int = None):
+    """SQL y parámetros de consultar_asistencias (también lo usa verificar_indices.py)."""
     sql = """
     SELECT 
         a.id, 
+        a.empleado_id,
         e.nombre, 
         e.cedula, 
+        e.numero,
         a.fecha, 
         a.hora_llegada,
         a.hora_salida,
         a.horas_trabajadas,
         a.turno, 
         a.llego_tarde,
-        a.turno_completado
-    FROM asistencias a
+        a.turno_completado,
+        a.tarde,
+        a.turno_codigo,
+        a.segundos_trabajados
+    FROM v_asistencias a
     JOIN empleados e ON e.id = a.empleado_id
     WHERE 1=1
     """
-    params = []
+    filtros, params = _filtros_asistencias(f_inicio, f_fin, filtro_texto, solo_tarde, cambios_desde)
+    sql += filtros
+
+    if despues_de:
+        # La condición suelta sobre fecha es redundante con la de fila, pero es la
+        # que permite descartar las particiones de meses más nuevos que el cursor
+        sql += " AND a.fecha <= %s::date AND (a.fecha, a.hora_llegada, a.id) < (%s, %s, %s)"
+        params.append(despues_de[0])
+        params.extend(despues_de)
+
+    sql += " ORDER BY a.fecha DESC, a.hora_llegada DESC, a.id DESC"
+    if limite:
+        sql += " LIMIT %s"
+        params.append(limite)
+
+    return sql, params
+
+def consultar_asistencias(f_inicio: str = None, f_fin: str = None,
+                          filtro_texto: str = None, solo_tarde: bool = False,
+                          limite: int = None, despues_de: tuple = None,
+                          cancelacion: Cancelacion = None) -> List[Dict]:
+    """
+    Devuelve asistencias con los datos del empleado, de la más reciente a la más antigua.
+    Con `limite` se obtiene una sola página; `despues_de` es el cursor de la última
+    fila de la página anterior (ver cursor_asistencia).
+    """
+    def consultar():
+        sql, params = sql_consultar_asistencias(f_inicio, f_fin, filtro_texto, solo_tarde, limite, despues_de)
+        with conexion(cancelacion) as conn:
+            c = conn.cursor()
+            c.execute(sql, tuple(params))
+            rows = c.fetchall()
+        return [dict(row) for row in rows]
+
+    clave = _reportes_clave("consultar", f_inicio, f_fin, filtro_texto, solo_tarde, limite, despues_de)
+    return list(_reportes_cacheado(clave, consultar))
+
+def iterar_asistencias(f_inicio: str = None, f_fin: str = None,
+                       filtro_texto: str = None, solo_tarde: bool = False,
+                       lote: int = 2000, cancelacion: Cancelacion = None):
+    """
+    Mismas filas que consultar_asistencias, leídas con un cursor del servidor de
+    `lote` en `lote`: memoria constante aunque sean millones (exportaciones).
+    No pasa por la caché de reportes. Mantiene la conexión prestada hasta
+    terminar de recorrerse.
+    """
+    sql, params = sql_consultar_asistencias(f_inicio, f_fin, filtro_texto, solo_tarde)
+    with conexion(cancelacion) as conn:
+        # Cursor con nombre: vive en una transacción que release_connection cierra
+        # al devolver la conexión, aunque no se recorra entero
+        c = conn.cursor(name="iterar_asistencias")
+        c.itersize = lote
+        c.execute(sql, tuple(params))
+        yield from c
+
+SQL_ASISTENCIAS_CSV = """
+    SELECT
+        e.nombre AS "Nombre",
+        e.cedula AS "Cédula",
+        a.fecha AS "Fecha",
+        a.turno AS "Turno",
+        a.hora_llegada AS "Llegada",
+        a.hora_salida AS "Salida",
+        a.horas_trabajadas AS "Horas",
+        a.llego_tarde AS "Tarde"
+    FROM v_asistencias a
+    JOIN empleados e ON e.id = a.empleado_id
+    WHERE 1=1
+    """
+
+def _copiar_csv(c, archivo, filtros: str, params: list) -> int:
+    """COPY de SQL_ASISTENCIAS_CSV con `filtros` hacia `archivo`; retorna las filas copiadas."""
+    sql = SQL_ASISTENCIAS_CSV + filtros + " ORDER BY a.fecha DESC, a.hora_llegada DESC, a.id DESC"
+    # COPY no admite parámetros: se incrustan ya escapados con mogrify
+    consulta = c.mogrify(sql, tuple(params)).decode()
+    c.copy_expert(f"COPY ({consulta}) TO STDOUT WITH (FORMAT csv, HEADER true, ENCODING 'UTF8')", archivo)
+    return c.rowcount
+
+def copiar_asistencias_csv(archivo, f_inicio: str = None, f_fin: str = None,
+                           filtro_texto: str = None, solo_tarde: bool = False,
+                           cancelacion: Cancelacion = None) -> int:
+    """
+    Escribe en `archivo` (cualquier objeto con write(bytes)) el CSV con encabezado
+    de las asistencias filtradas, generado por la BD con COPY ... TO STDOUT:
+    mismas filas y orden que consultar_asistencias, columnas del Excel.
+    """
+    filtros, params = _filtros_asistencias(f_inicio, f_fin, filtro_texto, solo_tarde)
+    with conexion(cancelacion) as conn:
+        filas = _copiar_csv(conn.cursor(), archivo, filtros, params)
+        conn.rollback()
+    return filas
+
+def contar_asistencias(f_inicio: str = None, f_fin: str = None,
+                       filtro_texto: str = None, solo_tarde: bool = False,
+                       cancelacion: Cancelacion = None) -> int:
+    """Total de asistencias que cumplen los filtros (para el paginador)."""
+    def consultar():
+        sql = """
+        SELECT COUNT(*) AS total
+        FROM v_asistencias a
+        JOIN empleados e ON e.id = a.empleado_id
+        WHERE 1=1
+        """
+        filtros, params = _filtros_asistencias(f_inicio, f_fin, filtro_texto, solo_tarde)
+        sql += filtros
+        with conexion(cancelacion) as conn:
+            c = conn.cursor()
+            c.execute(sql, tuple(params))
+            row = c.fetchone()
+        return row["total"]
+
+    clave = _reportes_clave("contar", f_inicio, f_fin, filtro_texto, solo_tarde)
+    return _reportes_cacheado(clave, consultar)
+
+# ---------- Exportación incremental (sincronización de nómina) ----------
+# Cada INSERT/UPDATE de asistencias guarda en `cambio` el id de su transacción
+# (migración 012). Una exportación incremental entrega las filas con cambio >= la
+# marca del consumidor y, solo si termina bien, guarda como marca nueva el xmin
+# de su snapshot, en la misma transacción. Toda transacción que el snapshot no
+# alcanzó a ver tiene un id >= ese xmin, así que un cambio que se confirma tarde
+# sale en la exportación siguiente (con una marca de hora se perdería). Algunas
+# filas pueden repetirse: el consumidor aplica cada fila como estado actual.
+# Los borrados no se informan.
+
+LOCK_EXPORTACION = 7210002   # con hashtext(consumidor): una exportación a la vez por consumidor
+
+
+class ExportacionEnCurso(Exception):
+    """Ya hay otra exportación incremental del mismo consumidor."""
+
+
+class CambiosAsistencias:
+    """Filas pendientes de un consumidor, dentro de la transacción de exportacion_incremental."""
+
+    def __init__(self, conn, consumidor: str, desde: int, hasta: int):
+        self.conn = conn
+        self.consumidor = consumidor
+        self.desde = desde   # 0: primera exportación, van todas las filas
+        self.hasta = hasta
+        self.total = 0
+
+    def filas(self, lote: int = 2000):
+        """Filas con las columnas de consultar_asistencias, por cursor del servidor."""
+        sql, params = sql_consultar_asistencias(cambios_desde=self.desde)
+        c = self.conn.cursor(name="exportacion_incremental")
+        c.itersize = lote
+        c.execute(sql, tuple(params))
+        for fila in c:
+            self.total += 1
+            yield fila
+
+    def copiar_csv(self, archivo) -> int:
+        """CSV de las filas (mismo formato que copiar_asistencias_csv) hacia `archivo`."""
+        filtros, params = _filtros_asistencias(cambios_desde=self.desde)
+        self.total = _copiar_csv(self.conn.cursor(), archivo, filtros, params)
+        return self.total
+
 
+@contextmanager
+def exportacion_incremental(consumidor: str):
+    """
+    Asistencias creadas o cambiadas desde la última exportación confirmada de
+    `consumidor`. Si el bloque termina sin error se guarda la marca nueva; si no,
+    la marca queda igual y la próxima exportación repite las mismas filas.
+
+        with database.exportacion_incremental("nomina") as cambios:
+            exportar_excel(cambios.filas(), ruta)
+    """
+    with conexion() as conn:
+        c = conn.cursor()
+        # Un solo snapshot para la marca y las filas
+        c.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ WRITE")
+        c.execute("SELECT pg_try_advisory_xact_lock(%s, hashtext(%s)) AS libre", (LOCK_EXPORTACION, consumidor))
+        if not c.fetchone()["libre"]:
+            raise ExportacionEnCurso(consumidor)
+        c.execute("SELECT marca FROM marcas_exportacion WHERE consumidor = %s", (consumidor,))
+        row = c.fetchone()
+        c.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) AS hasta")
+        cambios = CambiosAsistencias(conn, consumidor, row["marca"] if row else 0, c.fetchone()["hasta"])
+
+        yield cambios
+
+        # Si otra exportación del consumidor guardó su marca después de este
+        # snapshot, REPEATABLE READ rechaza el UPDATE en vez de retroceder la marca
+        c.execute("""
+            INSERT INTO marcas_exportacion (consumidor, marca, filas, actualizada)
+            VALUES (%s, %s, %s, now())
+            ON CONFLICT (consumidor) DO UPDATE
+            SET marca = EXCLUDED.marca, filas = EXCLUDED.filas, actualizada = EXCLUDED.actualizada
+        """, (consumidor, cambios.hasta, cambios.total))
+        conn.commit()
+
+def marcas_exportacion() -> List[Dict]:
+    """Marca, filas y fecha de la última exportación incremental de cada consumidor."""
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT consumidor, marca, filas, actualizada FROM marcas_exportacion ORDER BY consumidor")
+        rows = c.fetchall()
+    return [dict(row) for row in rows]
+
+def reiniciar_marca_exportacion(consumidor: str) -> bool:
+    """Olvida la marca del consumidor: su próxima exportación trae todas las filas."""
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("DELETE FROM marcas_exportacion WHERE consumidor = %s", (consumidor,))
+        borrada = c.rowcount > 0
+        conn.commit()
+    return borrada
+
+def total_registros_asistencia() -> tuple:
+    """
+    (total, exacto) de filas en asistencias para el panel de administración.
+    Con estadísticas del planificador usa su estimación (reltuples, sumando las
+    particiones) para no recorrer la tabla; si la tabla nunca se analizó, cuenta.
+    """
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT COALESCE(SUM(reltuples) FILTER (WHERE reltuples >= 0), 0)::bigint AS estimado,
+                   COALESCE(bool_or(reltuples < 0), TRUE) AS sin_analizar
+            FROM pg_class
+            WHERE relkind = 'r'
+            AND (oid = to_regclass('asistencias')
+                 OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass('asistencias')))
+        """)
+        row = c.fetchone()
+        if row["sin_analizar"] or not row["estimado"]:
+            c.execute("SELECT COUNT(*) AS total FROM asistencias")
+            total, exacto = c.fetchone()["total"], True
+        else:
+            total, exacto = row["estimado"], False
+        conn.rollback()
+    return total, exacto
+
+def resumen_dia(fecha: date = None) -> Dict:
+    """
+    Contadores del día (empleados activos, cuántos marcaron, llegadas tarde, en
+    turno) y la lista de empleados activos sin marcación, en un solo viaje a la BD.
+    """
+    fecha = fecha or datetime.now(ZoneInfo("America/Bogota")).date()
+    with conexion_autocommit() as conn:
+        c = conn.cursor()
+        c.execute("SELECT * FROM resumen_dia(%s::date)", (fecha,))
+        row = dict(c.fetchone())
+    row["fecha"] = fecha
+    row["faltan"] = len(row["ausentes"])
+    return row
+
+def consultar_resumen_diario(f_inicio: str = None, f_fin: str = None,
+                             por_mes: bool = False) -> List[Dict]:
+    """
+    Totales por día y turno desde resumen_diario (migración 009): llegadas, llegadas
+    tarde, turnos completos y segundos trabajados. Con por_mes=True agrupa por mes.
+    Lee unas pocas filas por día en vez de recorrer asistencias.
+    """
+    periodo = "date_trunc('month', r.fecha)::date" if por_mes else "r.fecha"
+    sql = f"""
+    SELECT
+        {periodo} AS fecha,
+        t.nombre AS turno,
+        SUM(r.llegadas)::integer AS llegadas,
+        SUM(r.tarde)::integer AS tarde,
+        SUM(r.completos)::integer AS completos,
+        SUM(r.segundos_trabajados)::bigint AS segundos_trabajados
+    FROM resumen_diario r
+    JOIN turnos t ON t.id = r.turno_id
+    WHERE 1=1
+    """
+    params = []
     if f_inicio:
-        sql += " AND fecha >= %s"
+        sql += " AND r.fecha >= %s::date"
         params.append(f_inicio)
     if f_fin:
-        sql += " AND fecha <= %s"
+        sql += " AND r.fecha <= %s::date"
         params.append(f_fin)
-    if filtro_texto:
-        sql += " AND (e.nombre ILIKE %s OR e.cedula ILIKE %s)"
-        like = f"%{filtro_texto}%"
-        params.extend([like, like])
-    if solo_tarde:
-        sql += " AND a.llego_tarde = 'SI'"
+    sql += " GROUP BY 1, t.id, t.nombre ORDER BY 1 DESC, t.id"
 
-    sql += " ORDER BY a.fecha DESC, a.hora_llegada DESC"
-    c.execute(sql, tuple(params))
-    rows = c.fetchall()
-    conn.close()
-    return [dict(row) for row in rows]
+    with conexion() as conn:
+        c = conn.cursor()
+        c.execute(sql, tuple(params))
+        rows = c.fetchall()
+    resultado = []
+    for row in rows:
+        fila = dict(row)
+        fila["horas_trabajadas"] = formatear_duracion(fila["segundos_trabajados"])
+        resultado.append(fila)
+    return resultado
 
-# Inicializar al importar
+# Conectar al importar (sin DDL: solo se verifica la versión del esquema)
 try:
-    initialize_database()
-    print("✅ Base de datos PostgreSQL inicializada correctamente")
+    iniciar_pool()
+    if verificar_esquema():
+        if AVISOS:
+            iniciar_avisos()
+        print("✅ Base de datos PostgreSQL lista")
 except Exception as e:
-    print(f"❌ Error al inicializar la base de datos: {e}")
+    print(f"❌ Error al conectar con la base de datos: {e}")
 
 if __name__ == "__main__":
     print("Conexión PostgreSQL configurada")
+    print("Pool de conexiones:", estadisticas_pool())
+    print("Caché de empleados:", estadisticas_cache_empleados())
+    print("Caché de reportes:", estadisticas_cache_reportes())
     print("Turnos configurados:", TURNOS)
     print("Soporte para turnos nocturnos: ✅")
\ No newline at end of file
@@ -0,0 +1,298 @@
+# descargas.py
+# Archivos generados (exportaciones) servidos por HTTP junto a la app de Flet
+#
+# Antes el archivo entero viajaba en base64 dentro de un data URL por el websocket
+# (un 33% más grande, varias copias en memoria y límite de largo de URL en el
+# navegador). Ahora la vista deja el archivo en DESCARGAS_DIR, registra un token y
+# abre /descargas/<token>:
+#   - el token es aleatorio, vence a los DESCARGAS_TTL segundos y se consume
+#     cuando se terminó de enviar el archivo completo, de una vez o por tramos
+#     (después se borra)
+#   - la respuesta se envía por partes, sin leer el archivo entero
+#   - admite Range (un solo rango) para reanudar descargas cortadas
+#
+#   ruta = descargas.nueva_ruta("pdf")      # ... se escribe el archivo ...
+#   token = descargas.registrar(ruta, "asistencias.pdf", "application/pdf")
+#   page.launch_url(descargas.url(token))
+#
+# También hay descargas sin archivo (flujos): producir(escribir) corre en un hilo
+# cuando el navegador abre la URL y cada escribir(bytes) va directo a la
+# respuesta. No hay Content-Length ni Range, y el token se consume al empezar.
+# Si el cliente se va, escribir() retorna False para que el productor pare.
+#
+#   token = descargas.registrar_flujo(lambda escribir: ..., "asistencias.csv", "text/csv")
+
+import atexit
+import os
+import queue
+import re
+import secrets
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Callable
+from urllib.parse import quote
+
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+
+DESCARGAS_DIR = os.getenv("DESCARGAS_DIR") or tempfile.mkdtemp(prefix="asistencia_descargas_")
+DESCARGAS_TTL = float(os.getenv("DESCARGAS_TTL", "600"))   # segundos de validez de un token
+BLOQUE = 64 * 1024
+
+os.makedirs(DESCARGAS_DIR, exist_ok=True)
+
+_RANGO = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+@dataclass
+class Descarga:
+    ruta: str
+    nombre: str
+    mime: str
+    expira: float
+    borrar: bool = True   # False si el archivo es de otro (trabajos.py lo guarda un rato)
+    enviando: int = 0   # respuestas en curso: no se borra el archivo mientras tanto
+    consumida: bool = False
+    entregado: list = field(default_factory=list)   # tramos (inicio, fin) ya enviados enteros
+
+    def marcar_entregado(self, inicio: int, fin: int, tamano: int):
+        """Se consume cuando entre todas las respuestas se entregó el archivo completo."""
+        tramos = sorted(self.entregado + [(inicio, fin)])
+        unidos = [tramos[0]]
+        for a, b in tramos[1:]:
+            if a <= unidos[-1][1] + 1:
+                unidos[-1] = (unidos[-1][0], max(unidos[-1][1], b))
+            else:
+                unidos.append((a, b))
+        self.entregado = unidos
+        self.consumida = unidos[0][0] == 0 and unidos[0][1] >= tamano - 1
+
+
+@dataclass
+class Flujo:
+    producir: Callable   # producir(escribir); escribir(bytes) -> False si el cliente se fue
+    nombre: str
+    mime: str
+    expira: float
+
+
+_lock = threading.Lock()
+_descargas = {}   # token -> Descarga
+_flujos = {}      # token -> Flujo todavía no pedido
+_FIN = object()
+
+
+def nueva_ruta(extension: str) -> str:
+    """Ruta libre dentro de DESCARGAS_DIR para generar un archivo."""
+    fd, ruta = tempfile.mkstemp(suffix=f".{extension}", dir=DESCARGAS_DIR)
+    os.close(fd)
+    return ruta
+
+
+def registrar(ruta: str, nombre: str, mime: str, ttl: float = DESCARGAS_TTL, borrar: bool = True) -> str:
+    """Publica el archivo y retorna el token de un solo uso para descargarlo."""
+    _limpiar()
+    token = secrets.token_urlsafe(24)
+    with _lock:
+        _descargas[token] = Descarga(ruta, nombre, mime, time.monotonic() + ttl, borrar)
+    return token
+
+
+def registrar_flujo(producir, nombre: str, mime: str, ttl: float = DESCARGAS_TTL) -> str:
+    """Publica una descarga generada al vuelo por producir(escribir); retorna su token."""
+    _limpiar()
+    token = secrets.token_urlsafe(24)
+    with _lock:
+        _flujos[token] = Flujo(producir, nombre, mime, time.monotonic() + ttl)
+    return token
+
+
+def url(token: str) -> str:
+    return f"/descargas/{token}"
+
+
+def _borrar(descarga: Descarga):
+    if not descarga.borrar:
+        return
+    try:
+        os.remove(descarga.ruta)
+    except OSError:
+        pass
+
+
+def _limpiar():
+    """Quita los tokens vencidos o consumidos que ya no se están enviando."""
+    ahora = time.monotonic()
+    with _lock:
+        muertas = [
+            token for token, d in _descargas.items()
+            if (d.consumida or d.expira < ahora)
+            # Una respuesta que el servidor nunca llegó a recorrer no retiene el archivo para siempre
+            and (not d.enviando or d.expira + DESCARGAS_TTL < ahora)
+        ]
+        borrar = [_descargas.pop(token) for token in muertas]
+        for token in [token for token, f in _flujos.items() if f.expira < ahora]:
+            del _flujos[token]
+    for descarga in borrar:
+        _borrar(descarga)
+
+
+def _rango(cabecera: str, tamano: int):
+    """(inicio, fin) inclusive del Range pedido; None si no hay; ValueError si no se puede servir."""
+    if not cabecera:
+        return None
+    m = _RANGO.match(cabecera.strip())
+    if not m:
+        return None   # varios rangos u otra unidad: se envía el archivo completo
+    inicio, fin = m.groups()
+    if not inicio:
+        # bytes=-N: los últimos N bytes
+        if not fin:
+            raise ValueError(cabecera)
+        inicio, fin = max(tamano - int(fin), 0), tamano - 1
+    else:
+        inicio, fin = int(inicio), min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        raise ValueError(cabecera)
+    return inicio, fin
+
+
+def _enviar(descarga: Descarga, inicio: int, fin: int, tamano: int):
+    completo = False
+    try:
+        with open(descarga.ruta, "rb") as f:
+            f.seek(inicio)
+            pendiente = fin - inicio + 1
+            while pendiente > 0:
+                bloque = f.read(min(BLOQUE, pendiente))
+                if not bloque:
+                    break
+                pendiente -= len(bloque)
+                yield bloque
+        completo = pendiente == 0
+    finally:
+        with _lock:
+            descarga.enviando -= 1
+            if completo:
+                descarga.marcar_entregado(inicio, fin, tamano)
+        _limpiar()
+
+
+def _poner(cola: queue.Queue, item, cerrado: threading.Event) -> bool:
+    """Encola esperando lugar mientras el cliente siga ahí; False si se fue."""
+    while not cerrado.is_set():
+        try:
+            cola.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _producir(flujo: Flujo, cola: queue.Queue, cerrado: threading.Event):
+    try:
+        flujo.producir(lambda datos: _poner(cola, datos, cerrado))
+    except Exception as e:
+        if cerrado.is_set():
+            return   # el cliente ya se fue: el error es de haberlo cortado
+        print(f"[ERROR] Descarga {flujo.nombre} falló: {e}")
+        _poner(cola, e, cerrado)
+    else:
+        _poner(cola, _FIN, cerrado)
+
+
+def _fluir(flujo: Flujo):
+    # Cola acotada: si el cliente baja lento, el productor espera en vez de acumular
+    cola = queue.Queue(maxsize=16)
+    cerrado = threading.Event()
+    threading.Thread(
+        target=_producir, args=(flujo, cola, cerrado), name="descarga-flujo", daemon=True
+    ).start()
+    try:
+        while True:
+            item = cola.get()
+            if item is _FIN:
+                return
+            if isinstance(item, Exception):
+                # Cortar la respuesta: mejor una descarga fallida que un archivo truncado
+                raise item
+            yield item
+    finally:
+        cerrado.set()
+
+
+router = APIRouter()
+
+
+@router.api_route("/descargas/{token}", methods=["GET", "HEAD"])
+def descargar(token: str, request: Request):
+    with _lock:
+        flujo = _flujos.get(token)
+        if flujo and flujo.expira >= time.monotonic() and request.method == "GET":
+            del _flujos[token]   # se genera una sola vez
+    if flujo:
+        cabeceras = {
+            "Accept-Ranges": "none",
+            "Cache-Control": "no-store",
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(flujo.nombre)}",
+        }
+        if flujo.expira < time.monotonic():
+            return PlainTextResponse("Descarga no disponible o vencida", status_code=404)
+        if request.method == "HEAD":
+            return Response(status_code=200, headers=cabeceras, media_type=flujo.mime)
+        return StreamingResponse(_fluir(flujo), headers=cabeceras, media_type=flujo.mime)
+
+    with _lock:
+        descarga = _descargas.get(token)
+        valida = descarga and not descarga.consumida and descarga.expira >= time.monotonic()
+        if valida and request.method == "GET":
+            descarga.enviando += 1
+    if not valida:
+        return PlainTextResponse("Descarga no disponible o vencida", status_code=404)
+
+    try:
+        tamano = os.path.getsize(descarga.ruta)
+    except OSError:
+        # El archivo ya no está (venció en la caché de trabajos)
+        if request.method == "GET":
+            with _lock:
+                descarga.enviando -= 1
+        return PlainTextResponse("Descarga no disponible o vencida", status_code=404)
+
+    cabeceras = {
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "no-store",
+        "Content-Disposition": f"attachment; filename*=UTF-8''{quote(descarga.nombre)}",
+    }
+    try:
+        rango = _rango(request.headers.get("range"), tamano)
+    except ValueError:
+        if request.method == "GET":
+            with _lock:
+                descarga.enviando -= 1
+        cabeceras["Content-Range"] = f"bytes */{tamano}"
+        return PlainTextResponse("Rango no válido", status_code=416, headers=cabeceras)
+
+    inicio, fin = rango or (0, tamano - 1)
+    estado = 206 if rango else 200
+    if rango:
+        cabeceras["Content-Range"] = f"bytes {inicio}-{fin}/{tamano}"
+    cabeceras["Content-Length"] = str(fin - inicio + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=estado, headers=cabeceras, media_type=descarga.mime)
+    return StreamingResponse(
+        _enviar(descarga, inicio, fin, tamano),
+        status_code=estado,
+        headers=cabeceras,
+        media_type=descarga.mime,
+    )
+
+
+@atexit.register
+def _borrar_todo():
+    if not os.getenv("DESCARGAS_DIR"):
+        shutil.rmtree(DESCARGAS_DIR, ignore_errors=True)
@@ -3,16 +3,26 @@
 
 import flet as ft
 import database
+from actualizaciones import actualizar, agrupar
+from busqueda import BusquedaIncremental, contiene
 from diseño_premium import COLORS, PremiumButton, PremiumTextField
+from tabla_paginada import TablaPaginada
 
 class EmpleadosView:
     def __init__(self, page, on_refresh_callback, on_lock_callback=None):
         self.page = page
         self.on_refresh = on_refresh_callback
         self.on_lock = on_lock_callback
-        self.table = None
+        self.tabla = None
         self.empleado_editar_id = None
         self.empleado_eliminar_id = None
+        self.filtro_texto = None  # búsqueda con la que se cargó la tabla
+        self.busqueda = BusquedaIncremental(
+            page,
+            buscar=self.buscar_texto,
+            coincide=lambda emp, texto: contiene(texto, emp["nombre"], emp["cedula"]),
+            mostrar=self.mostrar_busqueda,
+        )
         self.build_ui()
 
     def build_ui(self):
@@ -49,16 +59,30 @@ class EmpleadosView:
             width=180,
         )
 
-        # Tabla de empleados (DataTable)
-        self.table = ft.DataTable(
-            columns=[
+        self.buscar_input = PremiumTextField(
+            label="Buscar por nombre o cédula",
+            width=300,
+            prefix_icon=ft.Icons.SEARCH,
+            on_change=self.busqueda.tecla,
+        )
+
+        # Tabla de empleados paginada por nombre
+        self.tabla = TablaPaginada(
+            self.page,
+            columnas=[
                 ft.DataColumn(ft.Text("ID", weight=ft.FontWeight.BOLD, color=COLORS["text_primary"])),
                 ft.DataColumn(ft.Text("Nombre", weight=ft.FontWeight.BOLD, color=COLORS["text_primary"])),
                 ft.DataColumn(ft.Text("Cédula", weight=ft.FontWeight.BOLD, color=COLORS["text_primary"])),
                 ft.DataColumn(ft.Text("Teléfono", weight=ft.FontWeight.BOLD, color=COLORS["text_primary"])),
                 ft.DataColumn(ft.Text("Acciones", weight=ft.FontWeight.BOLD, color=COLORS["text_primary"])),
             ],
-            rows=[],
+            obtener_pagina=lambda limite, despues_de: database.obtener_empleados(
+                limite=limite, despues_de=despues_de, filtro_texto=self.filtro_texto
+            ),
+            cursor=database.cursor_empleado,
+            construir_fila=self.fila_empleado,
+            contar=lambda: database.contar_empleados(self.filtro_texto),
+            color=COLORS["text_primary"],
             border=ft.border.all(1, COLORS["glass_border"]),
             border_radius=10,
         )
@@ -207,8 +231,15 @@ class EmpleadosView:
                 ft.Container(
                     content=ft.Column(
                         [
-                            ft.Text("Lista de Empleados", size=16, weight=ft.FontWeight.BOLD, color=COLORS["text_primary"]),
-                            ft.Container(content=self.table, padding=8),
+                            ft.Row(
+                                [
+                                    ft.Text("Lista de Empleados", size=16, weight=ft.FontWeight.BOLD, color=COLORS["text_primary"]),
+                                    self.buscar_input,
+                                    self.tabla.paginacion,
+                                ],
+                                alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                            ),
+                            ft.Container(content=self.tabla.table, padding=8),
                         ],
                         spacing=12,
                     ),
@@ -226,49 +257,67 @@ class EmpleadosView:
         self.container = ft.Stack([self.main_column, self.overlay_editar, self.overlay_eliminar], expand=True)
 
         # Carga inicial
+        self.tabla.cargar()
+
+    def activar(self):
+        """Al volver a la vista: otra sesión pudo cambiar la lista de empleados."""
         self.cargar_tabla()
 
+    @agrupar
     def cargar_tabla(self, e=None):
-        rows = []
-        empleados = database.obtener_empleados()
-
-        for emp in empleados:
-            emp_id = emp["id"]
-
-            # Crear botones con data
-            btn_editar = ft.IconButton(
-                icon=ft.Icons.EDIT,
-                icon_color=COLORS["accent_blue"],
-                tooltip="Editar",
-                data=emp_id,
-                on_click=self.click_editar,
-            )
-
-            btn_eliminar = ft.IconButton(
-                icon=ft.Icons.DELETE,
-                icon_color=COLORS["danger"],
-                tooltip="Eliminar",
-                data=emp_id,
-                on_click=self.click_eliminar,
-            )
-
-            acciones = ft.Row([btn_editar, btn_eliminar], spacing=6)
-
-            rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(str(emp_id), color=COLORS["text_primary"])),
-                        ft.DataCell(ft.Text(emp["nombre"] or "", color=COLORS["text_primary"])),
-                        ft.DataCell(ft.Text(emp["cedula"] or "", color=COLORS["text_primary"])),
-                        ft.DataCell(ft.Text(emp["numero"] or "-", color=COLORS["text_secondary"])),
-                        ft.DataCell(acciones),
-                    ]
-                )
-            )
-
-        self.table.rows = rows
-        self.page.update()
+        """Vuelve a traer la página visible (tras agregar, editar o eliminar)."""
+        self.busqueda.reiniciar()
+        self.filtro_texto = (self.buscar_input.value or "").strip() or None
+        self.tabla.recargar()
+
+    # ---------- Búsqueda mientras se escribe ----------
+    def buscar_texto(self, texto, cancelacion):
+        """Primera página para `texto` (en segundo plano); el total solo si hay más de una."""
+        tamano = self.tabla.tamano_pagina
+        filas = database.obtener_empleados(
+            limite=tamano + 1, filtro_texto=texto or None, cancelacion=cancelacion
+        )
+        if len(filas) <= tamano:
+            return filas, len(filas)
+        return filas, database.contar_empleados(texto or None, cancelacion=cancelacion)
+
+    def mostrar_busqueda(self, texto, filas, total):
+        self.filtro_texto = texto or None
+        self.tabla.mostrar_primera(filas, total)
+
+    def fila_empleado(self, emp):
+        emp_id = emp["id"]
+
+        # Crear botones con data
+        btn_editar = ft.IconButton(
+            icon=ft.Icons.EDIT,
+            icon_color=COLORS["accent_blue"],
+            tooltip="Editar",
+            data=emp_id,
+            on_click=self.click_editar,
+        )
+
+        btn_eliminar = ft.IconButton(
+            icon=ft.Icons.DELETE,
+            icon_color=COLORS["danger"],
+            tooltip="Eliminar",
+            data=emp_id,
+            on_click=self.click_eliminar,
+        )
+
+        acciones = ft.Row([btn_editar, btn_eliminar], spacing=6)
+
+        return ft.DataRow(
+            cells=[
+                ft.DataCell(ft.Text(str(emp_id), color=COLORS["text_primary"])),
+                ft.DataCell(ft.Text(emp["nombre"] or "", color=COLORS["text_primary"])),
+                ft.DataCell(ft.Text(emp["cedula"] or "", color=COLORS["text_primary"])),
+                ft.DataCell(ft.Text(emp["numero"] or "-", color=COLORS["text_secondary"])),
+                ft.DataCell(acciones),
+            ]
+        )
 
+    @agrupar
     def click_editar(self, e):
         """Handler del click en botón editar."""
         emp_id = e.control.data
@@ -285,12 +334,14 @@ class EmpleadosView:
 
         # Mostrar overlay
         self.overlay_editar.visible = True
-        self.page.update()
+        actualizar(self.page)
 
+    @agrupar
     def cerrar_overlay_editar(self, e=None):
         self.overlay_editar.visible = False
-        self.page.update()
+        actualizar(self.page)
 
+    @agrupar
     def guardar_edicion_overlay(self, e):
         """Guarda los cambios del overlay de edición."""
         database.actualizar_empleado(
@@ -307,19 +358,22 @@ class EmpleadosView:
         self.page.snack_bar.content.value = "✓ Empleado actualizado"
         self.page.snack_bar.bgcolor = COLORS["success"]
         self.page.snack_bar.open = True
-        self.page.update()
+        actualizar(self.page)
 
+    @agrupar
     def click_eliminar(self, e):
         """Handler del click en botón eliminar."""
         emp_id = e.control.data
         self.empleado_eliminar_id = emp_id
         self.overlay_eliminar.visible = True
-        self.page.update()
+        actualizar(self.page)
 
+    @agrupar
     def cerrar_overlay_eliminar(self, e=None):
         self.overlay_eliminar.visible = False
-        self.page.update()
+        actualizar(self.page)
 
+    @agrupar
     def eliminar_overlay(self, e):
         """Elimina el empleado desde el overlay."""
         database.eliminar_empleado(self.empleado_eliminar_id)
@@ -329,8 +383,9 @@ class EmpleadosView:
         self.page.snack_bar.content.value = "✓ Empleado eliminado"
         self.page.snack_bar.bgcolor = COLORS["warning"]
         self.page.snack_bar.open = True
-        self.page.update()
+        actualizar(self.page)
 
+    @agrupar
     def agregar_empleado(self, e):
         nombre = (self.nombre_input.value or "").strip()
         cedula = (self.cedula_input.value or "").strip()
@@ -340,7 +395,7 @@ class EmpleadosView:
             self.page.snack_bar.content.value = "El nombre y la cédula son obligatorios"
             self.page.snack_bar.bgcolor = COLORS["danger"]
             self.page.snack_bar.open = True
-            self.page.update()
+            actualizar(self.page)
             return
 
         try:
@@ -353,14 +408,15 @@ class EmpleadosView:
             self.page.snack_bar.content.value = "✓ Empleado agregado exitosamente"
             self.page.snack_bar.bgcolor = COLORS["success"]
             self.page.snack_bar.open = True
-            self.page.update()
+            actualizar(self.page)
         except Exception as ex:
             self.page.snack_bar.content.value = f"Error: {str(ex)}"
             self.page.snack_bar.bgcolor = COLORS["danger"]
             self.page.snack_bar.open = True
-            self.page.update()
+            actualizar(self.page)
 
     # helper
+    @agrupar
     def cerrar_dialogo(self, dlg):
         dlg.open = False
-        self.page.update()
+        actualizar(self.page)
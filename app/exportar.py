@@ -1,124 +1,460 @@
 # exportar.py
-# Funciones para exportar a Excel y PDF - Compatible con Web
+# Funciones para exportar a Excel, PDF y CSV - Compatible con Web
 
-from io import BytesIO
-import pandas as pd
 import datetime
+import multiprocessing
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from diseño_premium import COLORS
 
+# openpyxl (Excel) en modo solo escritura: las filas van a disco a medida que llegan
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
 # ReportLab (PDF)
 from reportlab.lib.pagesizes import letter, landscape
-from reportlab.platypus import (
-    SimpleDocTemplate,
-    Table,
-    TableStyle,
-    Paragraph,
-    Spacer
-)
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen import canvas
+from reportlab.platypus import Table, TableStyle, Paragraph
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 
 
-def exportar_excel(data: list) -> bytes:
+PROGRESO_FILAS = 1000   # cada cuántas filas avisa exportar_excel
+
+
+class ExportacionCancelada(Exception):
+    """Se pidió cancelar la exportación mientras se generaba."""
+
+
+# (encabezado, ancho, formato) de cada columna del Excel
+COLUMNAS_EXCEL = [
+    ("Nombre", 34, None),
+    ("Cédula", 15, "@"),
+    ("Fecha", 12, "yyyy-mm-dd"),
+    ("Turno", 10, None),
+    ("Llegada", 10, "hh:mm:ss"),
+    ("Salida", 10, "hh:mm:ss"),
+    ("Horas", 10, "[h]:mm:ss"),
+    ("Tarde", 8, None),
+]
+
+
+def _valores_excel(r) -> tuple:
+    """Fila de consultar_asistencias/iterar_asistencias con tipos de Excel (fecha, hora, duración)."""
+    segundos = r["segundos_trabajados"]
+    return (
+        r["nombre"],
+        r["cedula"],
+        r["fecha"],
+        r["turno"],
+        r["hora_llegada"],
+        r["hora_salida"],
+        datetime.timedelta(seconds=segundos) if segundos is not None else None,
+        r["llego_tarde"],
+    )
+
+
+def exportar_excel(filas, destino, on_progreso=None) -> int:
     """
-    Exporta asistencias a Excel usando pandas.
-    Retorna bytes directamente para descarga web.
-    data: lista de dicts con las nuevas columnas.
+    Escribe las asistencias en un .xlsx sin tenerlas todas en memoria: `filas`
+    puede ser un generador (database.iterar_asistencias) y openpyxl en modo
+    write_only va volcando cada fila a un temporal. `destino` es una ruta o un
+    archivo abierto en binario. on_progreso(filas, 0) cada PROGRESO_FILAS filas.
+    Retorna cuántas filas escribió.
     """
-    columnas = ["Nombre", "Cédula", "Fecha", "Turno", "Llegada", "Salida", "Horas", "Tarde"]
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Asistencias")
+    ws.freeze_panes = "A2"
+    for i, (_, ancho, _) in enumerate(COLUMNAS_EXCEL, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = ancho
+
+    fuente = Font(bold=True, color="FFFFFF")
+    relleno = PatternFill("solid", fgColor="2563EB")
+    encabezado = []
+    for titulo, _, _ in COLUMNAS_EXCEL:
+        celda = WriteOnlyCell(ws, value=titulo)
+        celda.font = fuente
+        celda.fill = relleno
+        encabezado.append(celda)
+    ws.append(encabezado)
+
+    # Solo las columnas con formato necesitan celda propia (openpyxl comparte el estilo)
+    formatos = [formato for _, _, formato in COLUMNAS_EXCEL]
+    total = 0
+    try:
+        for r in filas:
+            fila = []
+            for valor, formato in zip(_valores_excel(r), formatos):
+                if formato and valor is not None:
+                    celda = WriteOnlyCell(ws, value=valor)
+                    celda.number_format = formato
+                    fila.append(celda)
+                else:
+                    fila.append(valor)
+            ws.append(fila)
+            total += 1
+            if on_progreso and total % PROGRESO_FILAS == 0:
+                on_progreso(total, 0)
+    except BaseException:
+        ws.close()   # cierra el temporal de la hoja (cancelada o con error)
+        raise
+
+    wb.save(destino)
+    if on_progreso:
+        on_progreso(total, 0)
+    return total
+
+
+# ---------- PDF ----------
+# Una tabla pequeña por página en vez de una sola Table con todas las filas: el
+# costo de maquetar crece lineal y en memoria solo está la página en curso. Las
+# filas tienen alto fijo, así que se sabe de antemano cuántas caben.
+
+PAGINA = landscape(letter)
+MARGEN_X, MARGEN_ARRIBA, MARGEN_ABAJO = 20, 30, 40
+ALTO_ENCABEZADO, ALTO_FILA = 24, 20
+
+COLUMNAS_PDF = [
+    ("Nombre", 200),
+    ("Cédula", 90),
+    ("Fecha", 75),
+    ("Turno", 70),
+    ("Llegada", 70),
+    ("Salida", 70),
+    ("Horas Trabajadas", 105),
+    ("Tarde", 52),
+]
+ENCABEZADO_PDF = [titulo for titulo, _ in COLUMNAS_PDF]
+ANCHOS_PDF = [ancho for _, ancho in COLUMNAS_PDF]
+
+# Estilos construidos una vez y compartidos por todas las páginas
+ESTILOS = getSampleStyleSheet()
+ESTILO_TABLA = TableStyle([
+    # Encabezado con color azul moderno
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2563EB")),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
 
-    df = pd.DataFrame(data if data else [], columns=columnas)
+    # Cuerpo
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+    ('FONTSIZE', (0, 1), (-1, -1), 9),
+    ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
 
-    # Crear buffer en memoria
-    buffer = BytesIO()
-    df.to_excel(buffer, index=False, engine='openpyxl')
-    buffer.seek(0)
-    
-    return buffer.getvalue()
+    # Bordes
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor("#2563EB")),
 
+    # Padding
+    ('TOPPADDING', (0, 0), (-1, -1), 3),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+    ('LEFTPADDING', (0, 0), (-1, -1), 8),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 8),
+])
 
-def exportar_pdf(data: list) -> bytes:
+
+def _recortar(texto: str, ancho: float) -> str:
+    """Recorta el texto para que quepa en la celda (las filas no crecen de alto)."""
+    disponible = ancho - 16
+    if stringWidth(texto, "Helvetica", 9) <= disponible:
+        return texto
+    while texto and stringWidth(texto + "…", "Helvetica", 9) > disponible:
+        texto = texto[:-1]
+    return texto + "…"
+
+
+def _fila_pdf(r) -> list:
+    return [
+        _recortar(r["nombre"] or "", ANCHOS_PDF[0]),
+        r["cedula"],
+        str(r["fecha"]),
+        r["turno"],
+        str(r["hora_llegada"]) if r["hora_llegada"] else "-",
+        str(r["hora_salida"]) if r["hora_salida"] else "-",
+        r["horas_trabajadas"] if r["horas_trabajadas"] else "-",
+        r["llego_tarde"],
+    ]
+
+
+def _pie(c, pagina: int):
+    c.setFont("Helvetica-Oblique", 8)
+    c.setFillColor(colors.grey)
+    c.drawString(MARGEN_X, MARGEN_ABAJO / 2,
+                 "Sistema de Control de Personal - Todos los derechos reservados")
+    c.drawRightString(PAGINA[0] - MARGEN_X, MARGEN_ABAJO / 2, f"Página {pagina}")
+
+
+def _titulo(c) -> float:
+    """Título y fecha de generación en la primera página; retorna la altura usada."""
+    ancho = PAGINA[0] - 2 * MARGEN_X
+    y = PAGINA[1] - MARGEN_ARRIBA
+    for parrafo, espacio in (
+        (Paragraph("<b>Reporte de Asistencia | Control de Personal</b>", ESTILOS["Title"]), 12),
+        (Paragraph(f"<i>Generado el: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</i>",
+                   ESTILOS["Normal"]), 20),
+    ):
+        _, alto = parrafo.wrapOn(c, ancho, y)
+        parrafo.drawOn(c, MARGEN_X, y - alto)
+        y -= alto + espacio
+    return PAGINA[1] - MARGEN_ARRIBA - y
+
+
+def exportar_pdf(filas, destino, on_progreso=None) -> int:
     """
-    Exporta asistencias a PDF (formato horizontal).
-    Retorna bytes directamente para descarga web.
-    data: lista de filas [Nombre, Cédula, Fecha, Turno, Llegada, Salida, Horas, Tarde]
+    Escribe las asistencias en un PDF horizontal, página por página. `filas` puede
+    ser un generador (database.iterar_asistencias); `destino` es una ruta o un
+    archivo abierto en binario. on_progreso(filas, paginas) tras cada página.
+    Retorna cuántas filas escribió.
     """
-    # Crear buffer en memoria
-    buffer = BytesIO()
-
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=landscape(letter),
-        rightMargin=20,
-        leftMargin=20,
-        topMargin=30,
-        bottomMargin=30
-    )
+    c = canvas.Canvas(destino, pagesize=PAGINA)
+    c.setTitle("Reporte de Asistencia")
+    alto_util = PAGINA[1] - MARGEN_ARRIBA - MARGEN_ABAJO
 
-    styles = getSampleStyleSheet()
-    flow = []
-
-    # Título con color azul moderno
-    titulo = Paragraph("<b>Reporte de Asistencia | Control de Personal</b>", styles["Title"])
-    flow.append(titulo)
-    flow.append(Spacer(1, 12))
-    
-    # Fecha de generación
-    fecha_gen = Paragraph(
-        f"<i>Generado el: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</i>",
-        styles["Normal"]
-    )
-    flow.append(fecha_gen)
-    flow.append(Spacer(1, 20))
-
-    # Encabezados
-    tabla_data = [["Nombre", "Cédula", "Fecha", "Turno", "Llegada", "Salida", "Horas Trabajadas", "Tarde"]]
-
-    # Datos
-    if data:
-        tabla_data.extend(data)
-
-    # Construir tabla
-    tabla = Table(tabla_data, repeatRows=1)
-
-    tabla.setStyle(TableStyle([
-        # Encabezado con color azul moderno
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#2563EB")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-        
-        # Cuerpo
-        ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-        ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('ALIGN', (0, 1), (-1, -1), 'LEFT'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        
-        # Bordes
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('LINEBELOW', (0, 0), (-1, 0), 2, colors.HexColor("#2563EB")),
-        
-        # Padding
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-        ('LEFTPADDING', (0, 0), (-1, -1), 8),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 8),
-    ]))
-
-    flow.append(tabla)
-    
-    # Pie de página
-    flow.append(Spacer(1, 20))
-    pie = Paragraph(
-        "<i>Sistema de Control de Personal - Todos los derechos reservados</i>",
-        styles["Normal"]
-    )
-    flow.append(pie)
-    
-    doc.build(flow)
-    
-    buffer.seek(0)
-    return buffer.getvalue()
\ No newline at end of file
+    usado = _titulo(c)
+    pagina, total, lote = 1, 0, []
+    capacidad = int((alto_util - usado - ALTO_ENCABEZADO) // ALTO_FILA)
+
+    def volcar():
+        nonlocal pagina, usado, capacidad, lote
+        tabla = Table(
+            [ENCABEZADO_PDF] + lote,
+            colWidths=ANCHOS_PDF,
+            rowHeights=[ALTO_ENCABEZADO] + [ALTO_FILA] * len(lote),
+            style=ESTILO_TABLA,
+        )
+        _, alto = tabla.wrapOn(c, PAGINA[0] - 2 * MARGEN_X, alto_util)
+        tabla.drawOn(c, MARGEN_X, PAGINA[1] - MARGEN_ARRIBA - usado - alto)
+        _pie(c, pagina)
+        c.showPage()
+        if on_progreso:
+            on_progreso(total, pagina)
+        pagina += 1
+        usado, lote = 0, []
+        capacidad = int((alto_util - ALTO_ENCABEZADO) // ALTO_FILA)
+
+    for r in filas:
+        lote.append(_fila_pdf(r))
+        total += 1
+        if len(lote) == capacidad:
+            volcar()
+    if lote or total == 0:
+        volcar()
+
+    c.save()
+    return total
+
+
+# ---------- CSV ----------
+# El CSV lo arma Postgres con COPY ... TO STDOUT: no pasan filas por Python,
+# solo bytes que se reenvían (comprimidos si se pide) a medida que llegan. Como
+# casi todo el trabajo es de la BD, corre en un hilo y no en el pool de procesos.
+
+BLOQUE_CSV = 64 * 1024   # bytes que se juntan antes de entregar un trozo
+
+
+class _SalidaCsv:
+    """Archivo para copy_expert: junta, comprime y entrega los bytes a escribir()."""
+
+    def __init__(self, escribir, cancelacion, comprimir: bool):
+        self.escribir = escribir
+        self.cancelacion = cancelacion
+        # wbits 31 = formato gzip (cabecera y CRC), no zlib crudo
+        self.gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+        self.pendiente = []
+        self.tamano = 0
+        self.enviados = 0
+        self.cortado = False
+
+    def write(self, datos):
+        if self.cortado:
+            return   # se está cancelando el COPY: lo que llegue se descarta
+        if isinstance(datos, str):
+            datos = datos.encode()
+        if self.gzip:
+            datos = self.gzip.compress(datos)
+        if datos:
+            self.pendiente.append(datos)
+            self.tamano += len(datos)
+        if self.tamano >= BLOQUE_CSV:
+            self._entregar()
+
+    def cerrar(self):
+        if self.gzip and not self.cortado:
+            self.pendiente.append(self.gzip.flush())
+        self._entregar()
+
+    def _entregar(self):
+        if self.cortado or not self.pendiente:
+            return
+        trozo = b"".join(self.pendiente)
+        self.pendiente, self.tamano = [], 0
+        if self.escribir(trozo) is False:
+            # Nadie recibe el archivo: que la BD deje de generarlo
+            self.cortado = True
+            self.cancelacion.cancelar()
+        else:
+            self.enviados += len(trozo)
+
+
+def exportar_csv(escribir, filtros: dict, comprimir: bool = False) -> int:
+    """
+    CSV de las asistencias de database.copiar_asistencias_csv(**filtros), entregado
+    por trozos a escribir(bytes) y en gzip si `comprimir`. escribir() retorna False
+    si el destino ya no lo quiere (cliente desconectado): se cancela la consulta en
+    el servidor y se lanza ExportacionCancelada. Retorna los bytes entregados.
+    """
+    import psycopg2.extensions
+    import database   # solo aquí: los procesos del pool no lo necesitan por este camino
+    cancelacion = database.Cancelacion()
+    salida = _SalidaCsv(escribir, cancelacion, comprimir)
+    try:
+        database.copiar_asistencias_csv(salida, cancelacion=cancelacion, **filtros)
+    except psycopg2.extensions.QueryCanceledError:
+        if salida.cortado:
+            raise ExportacionCancelada("destino cerrado") from None
+        raise
+    salida.cerrar()
+    if salida.cortado:
+        raise ExportacionCancelada("destino cerrado")
+    return salida.enviados
+
+
+# ---------- Exportación incremental ----------
+def exportar_incremental(consumidor: str, destino: str, tipo: str = "excel") -> int:
+    """
+    Escribe en `destino` (Excel o CSV según `tipo`) las asistencias creadas o
+    cambiadas desde la última exportación de `consumidor` (ver
+    database.exportacion_incremental). El archivo se arma aparte y reemplaza a
+    `destino` de una vez; recién entonces se guarda la marca. Retorna las filas.
+    """
+    import database   # solo aquí: los procesos del pool no lo necesitan por este camino
+    parcial = destino + ".parcial"
+    try:
+        with database.exportacion_incremental(consumidor) as cambios:
+            if tipo == "csv":
+                with open(parcial, "wb") as f:
+                    cambios.copiar_csv(f)
+            else:
+                exportar_excel(cambios.filas(), parcial)
+            os.replace(parcial, destino)
+    finally:
+        if os.path.exists(parcial):
+            os.remove(parcial)
+    return cambios.total
+
+
+# ---------- Exportaciones en procesos aparte ----------
+# Generar un archivo grande es puro CPU y, dentro del manejador de Flet, retiene
+# el GIL y frena a todas las sesiones. Se genera en un pool de procesos; cada
+# proceso lee las filas de la BD por su cuenta (sin hilo de avisos) y manda el
+# avance por una cola que un hilo de este proceso reparte a los callbacks. Para
+# cancelar una exportación en curso se crea <ruta>.cancelar, que el proceso mira
+# cada vez que avisa su avance.
+
+PROCESOS_EXPORTAR = int(os.getenv("EXPORTAR_PROCESOS", "2"))
+PROGRESO_INTERVALO = 0.5   # segundos mínimos entre avisos de avance de un trabajo
+
+_pool_exportar = None
+_pool_lock = threading.Lock()
+_progreso_cola = None
+_progreso_callbacks = {}   # id de trabajo -> on_progreso
+_siguiente_trabajo = 0
+
+
+def _iniciar_proceso(cola):
+    global _progreso_cola
+    _progreso_cola = cola
+
+
+def _exportar_en_proceso(trabajo: int, tipo: str, filtros: dict, ruta: str) -> int:
+    import database   # en el proceso hijo ya está importado, con DB_AVISOS=0
+    ultimo = [0.0]
+
+    def progreso(filas, paginas):
+        ahora = time.monotonic()
+        if ahora - ultimo[0] >= PROGRESO_INTERVALO:
+            ultimo[0] = ahora
+            if os.path.exists(ruta + ".cancelar"):
+                raise ExportacionCancelada(ruta)
+            _progreso_cola.put((trabajo, filas, paginas))
+
+    exportador = exportar_pdf if tipo == "pdf" else exportar_excel
+    return exportador(database.iterar_asistencias(**filtros), ruta, on_progreso=progreso)
+
+
+def _repartir_progreso(cola):
+    while True:
+        trabajo, filas, paginas = cola.get()
+        callback = _progreso_callbacks.get(trabajo)
+        if callback:
+            try:
+                callback(filas, paginas)
+            except Exception as e:
+                print(f"⚠️ Error mostrando el avance de la exportación: {e}")
+
+
+def _pool():
+    global _pool_exportar, _progreso_cola
+    with _pool_lock:
+        if _pool_exportar is None:
+            # spawn: el proceso de Flet tiene hilos y un fork los copiaría a medias.
+            # Cada hijo vuelve a importar main.py (y con él database) antes del
+            # initializer, así que la configuración va por el entorno que heredan;
+            # aquí ya no cambia nada porque database se importó.
+            os.environ["DB_AVISOS"] = "0"
+            os.environ["DB_POOL_MIN"] = "1"
+            contexto = multiprocessing.get_context("spawn")
+            _progreso_cola = contexto.Queue()
+            _pool_exportar = ProcessPoolExecutor(
+                max_workers=PROCESOS_EXPORTAR,
+                mp_context=contexto,
+                initializer=_iniciar_proceso,
+                initargs=(_progreso_cola,),
+            )
+            threading.Thread(
+                target=_repartir_progreso, args=(_progreso_cola,), name="progreso-exportar", daemon=True
+            ).start()
+        return _pool_exportar
+
+
+def _terminado(trabajo: int, ruta: str):
+    _progreso_callbacks.pop(trabajo, None)
+    try:
+        os.remove(ruta + ".cancelar")
+    except OSError:
+        pass
+
+
+def exportar_en_proceso(tipo: str, filtros: dict, ruta: str, on_progreso=None):
+    """
+    Genera en `ruta` el Excel o PDF (`tipo`) de database.iterar_asistencias(**filtros)
+    en un proceso aparte. Retorna un Future con el total de filas (o que falla con
+    ExportacionCancelada); on_progreso(filas, paginas) se llama desde un hilo de
+    este proceso mientras avanza.
+    """
+    global _siguiente_trabajo
+    pool = _pool()
+    with _pool_lock:
+        _siguiente_trabajo += 1
+        trabajo = _siguiente_trabajo
+        if on_progreso:
+            _progreso_callbacks[trabajo] = on_progreso
+    futuro = pool.submit(_exportar_en_proceso, trabajo, tipo, filtros, ruta)
+    futuro.add_done_callback(lambda _: _terminado(trabajo, ruta))
+    return futuro
+
+
+def cancelar_exportacion(futuro, ruta: str):
+    """Saca la exportación de la cola o, si ya empezó, le pide al proceso que pare."""
+    if not futuro.cancel() and not futuro.done():
+        open(ruta + ".cancelar", "w").close()
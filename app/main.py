@@ -5,8 +5,12 @@ from marcaciones_diarias import MarcacionesDiariasView
 from reportes import ReportesView
 from admin import AdminView
 from diseño_premium import COLORS, PremiumTextField, PremiumButton, SidebarItem
+from actualizaciones import actualizar, agrupar_en, limitar, vaciar
+import descargas
 
+import flet.fastapi as flet_fastapi
 import os
+import uvicorn
 
 # === CONFIGURACIÓN GLOBAL DE COLORES ===
 COLORS["text_primary"] = "#000000"
@@ -54,22 +58,25 @@ def main(page: ft.Page):
 
     # === FUNCIONES ===
     def refresh_callback(): 
-        page.update()
+        actualizar(page)
 
+    @agrupar_en(page)
     def toggle_menu(e=None):
         nonlocal menu_abierto
         menu_abierto = not menu_abierto
         menu_lateral.visible = menu_abierto
         overlay_menu.visible = menu_abierto
-        page.update()
+        actualizar(page)
 
+    @agrupar_en(page)
     def cerrar_menu(e=None):
         nonlocal menu_abierto
         menu_abierto = False
         menu_lateral.visible = False
         overlay_menu.visible = False
-        page.update()
+        actualizar(page)
 
+    @agrupar_en(page)
     def lock_callback(vista_nombre):
         nonlocal autenticado_empleados, autenticado_reportes, autenticado_admin
         if vista_nombre == "empleados": 
@@ -81,18 +88,41 @@ def main(page: ft.Page):
         mostrar_vista("marcacion")
         page.snack_bar.content.value = f"🔒 {vista_nombre.capitalize()} bloqueado"
         page.snack_bar.open = True
-        page.update()
+        actualizar(page)
 
+    # --- Vistas: cada una se construye al primer uso y se reutiliza en la sesión ---
+    fabricas_vistas = {
+        "marcacion": lambda: MarcacionView(page, refresh_callback),
+        "empleados": lambda: EmpleadosView(page, refresh_callback, lock_callback),
+        "diarias": lambda: MarcacionesDiariasView(page),
+        "reportes": lambda: ReportesView(page, lock_callback),
+        "admin": lambda: AdminView(page, lock_callback),
+    }
+    vistas = {}
+
+    def obtener_vista(vista_nombre):
+        """La primera vez construye la vista; las siguientes la reactiva (si tiene activar())."""
+        vista = vistas.get(vista_nombre)
+        if vista is None:
+            vista = vistas[vista_nombre] = fabricas_vistas[vista_nombre]()
+        elif hasattr(vista, "activar"):
+            vista.activar()
+        return vista
+
+    def cerrar_sesion(e=None):
+        """Al expirar la sesión: las vistas con detener() sueltan reloj y avisos."""
+        for vista in vistas.values():
+            if hasattr(vista, "detener"):
+                vista.detener()
+        vistas.clear()
+
+    @agrupar_en(page)
     def mostrar_vista(vista_nombre):
         nonlocal vista_activa
-        
-        contenedor.content = {
-            "marcacion": MarcacionView(page, refresh_callback).container,
-            "empleados": EmpleadosView(page, refresh_callback, lock_callback).container,
-            "diarias": MarcacionesDiariasView(page).container,
-            "reportes": ReportesView(page, lock_callback).container,
-            "admin": AdminView(page, lock_callback).container
-        }.get(vista_nombre, MarcacionView(page, refresh_callback).container)
+
+        if vista_nombre not in fabricas_vistas:
+            vista_nombre = "marcacion"
+        contenedor.content = obtener_vista(vista_nombre).container
         
         vista_activa = vista_nombre
         actualizar_botones(vista_activa)
@@ -100,18 +130,21 @@ def main(page: ft.Page):
         # Cerrar menú después de seleccionar
         cerrar_menu()
 
-        # Animación suave
+        # Animación suave: se envía ya con opacidad 0 para que el paso a 1,
+        # que sale al final del lote, se anime
         contenedor.opacity = 0
-        page.update()
+        vaciar(page)
         contenedor.opacity = 1
-        page.update()
+        actualizar(page, contenedor)   # vaciar ya despachó lo pendiente: sin esto el 1 no se envía
 
+    @agrupar_en(page)
     def cerrar_overlay(e=None):
         overlay_password.visible = False
         password_input.value = ""
         password_input.error_text = ""
-        page.update()
+        actualizar(page)
 
+    @agrupar_en(page)
     def verificar_password(e=None):
         nonlocal autenticado_empleados, autenticado_reportes, autenticado_admin
         if password_input.value == ADMIN_PASSWORD:
@@ -126,17 +159,19 @@ def main(page: ft.Page):
         else:
             password_input.error_text = "❌ Contraseña incorrecta"
             password_input.value = ""
-            page.update()
+            actualizar(page)
 
+    @agrupar_en(page)
     def solicitar_password(vista_nombre):
         nonlocal vista_pendiente
         vista_pendiente = vista_nombre
         overlay_password.visible = True
         password_input.value = ""
         password_input.error_text = ""
-        page.update()
+        vaciar(page)   # el campo tiene que estar visible antes de enfocarlo
         password_input.focus()
 
+    @agrupar_en(page)
     def cambiar_vista(vista):
         if vista == "empleados" and not autenticado_empleados: 
             solicitar_password(vista)
@@ -164,7 +199,7 @@ def main(page: ft.Page):
         lock_reportes.visible = not autenticado_reportes
         lock_admin.visible = not autenticado_admin
         
-        page.update()
+        actualizar(page)
 
     def ajustar_layout(e=None):
         is_mobile = es_movil()
@@ -230,7 +265,7 @@ def main(page: ft.Page):
         overlay_menu.width = page.width
         overlay_menu.height = page.height
         
-        page.update()
+        actualizar(page)
 
     # === 1. BOTÓN HAMBURGUESA FIJO ===
     btn_menu = ft.Container(
@@ -462,7 +497,7 @@ def main(page: ft.Page):
 
     # === 7. CONTENEDOR PRINCIPAL ===
     contenedor = ft.Container(
-        content=MarcacionView(page, refresh_callback).container, 
+        content=obtener_vista("marcacion").container, 
         expand=True, 
         padding=30, 
         bgcolor=COLORS["bg_primary"],
@@ -492,14 +527,18 @@ def main(page: ft.Page):
 
     page.add(layout)
     page.overlay.append(overlay_password)
-    page.on_resize = ajustar_layout
+    # Al arrastrar la ventana llegan decenas de eventos: se ajusta como mucho cada 150 ms
+    page.on_resize = limitar(0.15)(ajustar_layout)
+    page.on_close = cerrar_sesion
     
     # Llamar ajustar_layout al inicio
     ajustar_layout()
 
-ft.app(
-    target=main, 
-    view=ft.WEB_BROWSER, 
-    host="0.0.0.0", 
-    port=int(os.environ.get("PORT", 8000))
-)
\ No newline at end of file
+# Servidor web: la app de Flet en "/" y las descargas de exportaciones al lado
+servidor = flet_fastapi.FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+servidor.include_router(descargas.router)
+servidor.mount("/", flet_fastapi.app(main, web_renderer=ft.WebRenderer.AUTO))
+
+# Los procesos de exportación (spawn) importan este módulo: solo el principal sirve
+if __name__ == "__main__":
+    uvicorn.run(servidor, host="0.0.0.0", port=int(os.environ.get("PORT", 8000)))
\ No newline at end of file
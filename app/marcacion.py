@@ -3,23 +3,26 @@
 
 import flet as ft
 import database
-from datetime import datetime
-import threading
-import time
+from actualizaciones import actualizar, agrupar
+import reloj
 from diseño_premium import (
     COLORS, GlassCard, PremiumButton, PremiumTextField,
     PremiumHeader, Badge
 )
-from zoneinfo import ZoneInfo
+
+MESES = ["enero", "febrero", "marzo", "abril", "mayo", "junio",
+         "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
+DIAS = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
 
 class MarcacionView:
     def __init__(self, page, on_refresh_callback):
         self.page = page
         self.on_refresh = on_refresh_callback
         self.empleado_actual = None
-        self.reloj_activo = True
+        self.turno_actual = None
+        self.dia_actual = None
         self.build_ui()
-        self.iniciar_reloj()
+        reloj.suscribir(self.tic)
     
     def build_ui(self):
         # Campo de cédula premium
@@ -27,15 +30,15 @@ class MarcacionView:
             label="Ingrese su cédula",
             hint_text="Ej: 1234567890",
             width=450,
-            on_submit=self.buscar_empleado,
+            on_submit=self.marcar,
             prefix_icon=ft.Icons.CREDIT_CARD_ROUNDED,
         )
         
-        # Botón de búsqueda premium
-        self.btn_buscar = PremiumButton(
-            "Buscar Empleado",
-            icon=ft.Icons.SEARCH_ROUNDED,
-            on_click=self.buscar_empleado,
+        # Botón de marcación premium
+        self.btn_marcar = PremiumButton(
+            "Marcar",
+            icon=ft.Icons.FINGERPRINT_ROUNDED,
+            on_click=self.marcar,
             width=200,
         )
         
@@ -82,60 +85,6 @@ class MarcacionView:
             ),
         )
         
-        # Botones de acción premium
-        self.btn_llegada = PremiumButton(
-            "MARCAR LLEGADA",
-            icon=ft.Icons.LOGIN_ROUNDED,
-            on_click=self.marcar_llegada,
-            width=300,
-            height=60,
-        )
-        
-        self.btn_salida = ft.Container(
-            content=ft.Row(
-                [
-                    ft.Icon(ft.Icons.LOGOUT_ROUNDED, size=20, color=COLORS["text_primary"]),
-                    ft.Text(
-                        "MARCAR SALIDA",
-                        size=15,
-                        weight=ft.FontWeight.W_600,
-                        color=COLORS["text_primary"],
-                    ),
-                ],
-                alignment=ft.MainAxisAlignment.CENTER,
-                spacing=10,
-            ),
-            gradient=ft.LinearGradient(
-                begin=ft.alignment.Alignment(-1, 0),
-                end=ft.alignment.Alignment(1, 0),
-                colors=[COLORS["warning"], "#FB923C"],
-            ),
-            padding=15,
-            border_radius=12,
-            width=300,
-            height=60,
-            shadow=ft.BoxShadow(
-                spread_radius=0,
-                blur_radius=20,
-                color=COLORS["warning"] + "60",
-                offset=ft.Offset(0, 6),
-            ),
-            on_click=self.marcar_salida,
-            ink=True,
-        )
-        
-        self.botones_accion = ft.Container(
-            visible=False,
-            content=ft.Column(
-                [
-                    self.btn_llegada,
-                    self.btn_salida,
-                ],
-                horizontal_alignment=ft.CrossAxisAlignment.CENTER,
-                spacing=16,
-            ),
-        )
-        
         # Mensaje de estado
         self.mensaje_estado = ft.Container(
             visible=False,
@@ -147,8 +96,8 @@ class MarcacionView:
             ),
         )
         
-        # Reloj con gradiente - CORREGIDO: usar ZoneInfo desde el inicio
-        ahora_bogota = datetime.now(ZoneInfo("America/Bogota"))
+        # Reloj con gradiente (hora de Bogotá)
+        ahora_bogota = reloj.ahora()
         self.reloj = ft.Container(
             content=ft.Text(
                 ahora_bogota.strftime("%H:%M:%S"),
@@ -173,22 +122,16 @@ class MarcacionView:
         # Indicador de turno
         self.turno_badge = Badge("", icon=ft.Icons.WB_SUNNY_ROUNDED)
         
-        # Fecha en español - CORREGIDO: usar ahora_bogota
-        meses = ["enero", "febrero", "marzo", "abril", "mayo", "junio",
-                 "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"]
-        dias = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-        
-        dia_semana = dias[ahora_bogota.weekday()]
-        mes = meses[ahora_bogota.month - 1]
-        
+        # Fecha en español
         self.fecha = ft.Text(
-            f"{dia_semana}, {ahora_bogota.day} de {mes} de {ahora_bogota.year}",
+            "",
             size=16,
             color=COLORS["text_secondary"],
         )
         
-        # Actualizar turno inicial
-        self.actualizar_turno()
+        # Fecha y turno iniciales
+        self.actualizar_fecha(ahora_bogota)
+        self.actualizar_turno(ahora_bogota)
         
         # Layout principal con scroll
         self.container = ft.Container(
@@ -218,7 +161,7 @@ class MarcacionView:
                         text_align=ft.TextAlign.CENTER,
                     ),
                     ft.Text(
-                        "Ingrese su cédula para registrar su asistencia",
+                        "Ingrese su cédula para marcar llegada o salida",
                         size=15,
                         color=COLORS["text_secondary"],
                         text_align=ft.TextAlign.CENTER,
@@ -230,7 +173,7 @@ class MarcacionView:
                     ft.Row(
                         [
                             self.cedula_input,
-                            self.btn_buscar,
+                            self.btn_marcar,
                         ],
                         alignment=ft.MainAxisAlignment.CENTER,
                         spacing=16,
@@ -245,11 +188,6 @@ class MarcacionView:
                     
                     # Mensaje de estado
                     self.mensaje_estado,
-                    
-                    ft.Container(height=24),
-                    
-                    # Botones de acción
-                    self.botones_accion,
                 ],
                 horizontal_alignment=ft.CrossAxisAlignment.CENTER,
                 spacing=0,
@@ -258,34 +196,43 @@ class MarcacionView:
             padding=30,
         )
     
-    def iniciar_reloj(self):
-        """Inicia el reloj en tiempo real."""
-        def actualizar():
-            while self.reloj_activo:
-                try:
-                    # CORREGIDO: usar ZoneInfo en cada actualización
-                    ahora_bogota = datetime.now(ZoneInfo("America/Bogota"))
-                    self.reloj.content.value = ahora_bogota.strftime("%H:%M:%S")
-                    self.actualizar_turno()
-                    self.page.update()
-                except:
-                    break
-                time.sleep(1)
-        
-        hilo = threading.Thread(target=actualizar, daemon=True)
-        hilo.start()
-    
-    def actualizar_turno(self):
-        """Actualiza el badge del turno actual."""
-        from database import detectar_turno_automatico, TURNOS
-        
-        # CORREGIDO: Hora actual en Bogotá
-        ahora_bogota = datetime.now(ZoneInfo("America/Bogota"))
-        hora_actual = ahora_bogota.strftime("%H:%M:%S")
-        
-        # Detectar turno
-        turno_key = detectar_turno_automatico(hora_actual)
-        turno_info = TURNOS[turno_key]
+    def tic(self, ahora):
+        """
+        Cada segundo, desde el hilo compartido de reloj.py. Solo se envía el texto
+        del reloj; el badge y la fecha únicamente cuando cambian de turno o de día.
+        """
+        self.reloj.content.value = ahora.strftime("%H:%M:%S")
+        cambiados = [self.reloj.content]
+        if self.actualizar_turno(ahora):
+            cambiados.append(self.turno_badge)
+        if self.actualizar_fecha(ahora):
+            cambiados.append(self.fecha)
+
+        # Fuera de pantalla (otra vista activa) solo se guardan los valores;
+        # al volver a mostrarse se envía la vista completa
+        if self.container.page is None:
+            return
+        for control in cambiados:
+            control.update()
+
+    def detener(self):
+        """Al cerrar la sesión: deja de recibir el reloj."""
+        reloj.cancelar(self.tic)
+
+    def actualizar_fecha(self, ahora) -> bool:
+        if ahora.date() == self.dia_actual:
+            return False
+        self.dia_actual = ahora.date()
+        self.fecha.value = f"{DIAS[ahora.weekday()]}, {ahora.day} de {MESES[ahora.month - 1]} de {ahora.year}"
+        return True
+
+    def actualizar_turno(self, ahora) -> bool:
+        """Actualiza el badge del turno actual. Retorna False si el turno no cambió."""
+        turno_key = database.detectar_turno_automatico(ahora.strftime("%H:%M:%S"))
+        if turno_key == self.turno_actual:
+            return False
+        self.turno_actual = turno_key
+        turno_info = database.TURNOS[turno_key]
         
         # Obtener el Row que contiene el icono y el texto
         badge_row = self.turno_badge.content
@@ -326,101 +273,68 @@ class MarcacionView:
                 color="#4A5AFF50",
                 offset=ft.Offset(0, 4),
             )
-        
-        # Refrescar la página
-        self.page.update()
+        return True
 
     
-    def buscar_empleado(self, e):
+    @agrupar
+    def marcar(self, e):
         cedula = (self.cedula_input.value or "").strip()
         
         if not cedula:
             self.mostrar_snackbar("Por favor ingrese una cédula")
             return
         
-        empleado = database.obtener_empleado_por_cedula(cedula)
+        # Una sola consulta: busca al empleado y registra llegada o salida
+        resultado = database.marcar(cedula)
         
-        if not empleado:
+        if not resultado:
             self.mostrar_snackbar("❌ Empleado no encontrado")
             self.ocultar_info()
             return
         
-        self.empleado_actual = empleado
-        self.mostrar_info_empleado()
-    
-    def mostrar_info_empleado(self):
-        if not self.empleado_actual:
-            return
+        self.empleado_actual = resultado["empleado"]
+        self.mostrar_resultado(resultado)
         
+        if resultado["tipo"] in ("LLEGADA", "SALIDA"):
+            self.on_refresh()
+    
+    def mostrar_resultado(self, resultado):
         info_col = self.info_empleado.content.content
         info_col.controls[2].value = self.empleado_actual["nombre"]
         info_col.controls[3].value = f"📱 {self.empleado_actual['cedula']}"
         
         self.info_empleado.visible = True
         
-        registro_hoy = database.obtener_asistencia_hoy(self.empleado_actual["id"])
-        
-        if not registro_hoy:
-            self.btn_llegada.visible = True
-            self.btn_salida.visible = False
-            self.mensaje_estado.content.value = "✨ Bienvenido! Registre su llegada"
-            self.mensaje_estado.content.color = COLORS["success"]
-        elif registro_hoy["hora_salida"]:
-            self.btn_llegada.visible = False
-            self.btn_salida.visible = False
-            self.mensaje_estado.content.value = f"✅ Jornada completa\nLlegada: {registro_hoy['hora_llegada']} | Salida: {registro_hoy['hora_salida']}"
-            self.mensaje_estado.content.color = COLORS["text_secondary"]
+        if resultado["tipo"] == "LLEGADA":
+            if resultado["tarde"] == "SI":
+                mensaje = f"⚠️ Llegada registrada (TARDE)\n{resultado['hora']}"
+                color = COLORS["warning"]
+            else:
+                mensaje = f"✅ Llegada registrada\n{resultado['hora']}"
+                color = COLORS["success"]
+        elif resultado["tipo"] == "SALIDA":
+            mensaje = f"👋 Salida registrada\n{resultado['hora']} | Trabajadas: {resultado['horas']}"
+            color = COLORS["success"]
+        elif resultado["tipo"] == "DUPLICADO":
+            mensaje = f"⏱️ Ya tiene llegada registrada a las {resultado['hora_llegada']}\nLa salida se podrá marcar más tarde"
+            color = COLORS["warning"]
         else:
-            self.btn_llegada.visible = False
-            self.btn_salida.visible = True
-            self.mensaje_estado.content.value = f"⏰ Llegada: {registro_hoy['hora_llegada']}\nAhora puede marcar su salida"
-            self.mensaje_estado.content.color = COLORS["warning"]
+            mensaje = f"✅ Jornada completa\nLlegada: {resultado['hora_llegada']} | Salida: {resultado['hora_salida']}"
+            color = COLORS["text_secondary"]
         
+        self.mensaje_estado.content.value = mensaje
+        self.mensaje_estado.content.color = color
         self.mensaje_estado.visible = True
-        self.botones_accion.visible = True
-        self.page.update()
-    
-    def marcar_llegada(self, e):
-        if not self.empleado_actual:
-            return
-        
-        resultado = database.registrar_llegada(self.empleado_actual["id"])
-        
-        if resultado['tarde'] == "SI":
-            mensaje = f"⚠️ Llegada registrada (TARDE)\n{resultado['hora']}"
-        else:
-            mensaje = f"✅ Llegada registrada\n{resultado['hora']}"
         
+        self.cedula_input.value = ""
         self.mostrar_snackbar(mensaje)
-        self.limpiar_formulario()
-        self.on_refresh()
-    
-    def marcar_salida(self, e):
-        if not self.empleado_actual:
-            return
-        
-        resultado = database.registrar_salida(self.empleado_actual["id"])
-        
-        if resultado:
-            mensaje = f"👋 Salida registrada\n{resultado['hora']} | Trabajadas: {resultado['horas']}"
-            self.mostrar_snackbar(mensaje)
-            self.limpiar_formulario()
-            self.on_refresh()
-        else:
-            self.mostrar_snackbar("❌ Error al registrar salida")
     
     def ocultar_info(self):
         self.info_empleado.visible = False
-        self.botones_accion.visible = False
         self.mensaje_estado.visible = False
-        self.page.update()
-    
-    def limpiar_formulario(self):
-        self.cedula_input.value = ""
-        self.empleado_actual = None
-        self.ocultar_info()
+        actualizar(self.page)
     
     def mostrar_snackbar(self, mensaje):
         self.page.snack_bar.content.value = mensaje
         self.page.snack_bar.open = True
-        self.page.update()
\ No newline at end of file
+        actualizar(self.page)
\ No newline at end of file
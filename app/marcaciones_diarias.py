@@ -3,6 +3,8 @@
 
 import flet as ft
 import database
+from actualizaciones import actualizar, agrupar
+import threading
 from datetime import datetime
 
 # ---------------------------
@@ -26,6 +28,16 @@ def safe_get(row, key, default=None):
 class MarcacionesDiariasView:
     def __init__(self, page):
         self.page = page
+        # Estado para aplicar las marcaciones en vivo como cambios puntuales
+        self.lock = threading.Lock()
+        self.fecha = None
+        self.cards = {}              # id de asistencia -> tarjeta
+        self.marcados = set()        # empleados con marcación hoy
+        self.tarde = set()           # empleados que llegaron tarde hoy
+        self.chips_ausentes = {}     # id de empleado -> chip
+        self.contadores = {"total": 0, "marcados": 0, "tarde": 0}
+        self.desactualizada = False
+        self.recargando = False   # hay un hilo recargando tras un aviso
         self.build_ui()
     
     def build_ui(self):
@@ -40,6 +52,14 @@ class MarcacionesDiariasView:
             icon_size=30,
             on_click=self.cargar_marcaciones,
         )
+
+        # Marcaciones de cualquier kiosco llegan por aviso de la BD
+        self.switch_en_vivo = ft.Switch(
+            label="En vivo",
+            value=True,
+            label_style=ft.TextStyle(color="#000000"),
+            on_change=self.cambiar_en_vivo,
+        )
         
         # ---------------------------
         # Fecha actual formateada
@@ -80,6 +100,14 @@ class MarcacionesDiariasView:
             scroll=ft.ScrollMode.AUTO,
         )
         
+        # ---------------------------
+        # Empleados sin marcación hoy
+        # ---------------------------
+        self.lista_ausentes = ft.Row(
+            spacing=10,
+            wrap=True,
+        )
+
         # ---------------------------
         # LAYOUT GENERAL
         # ---------------------------
@@ -107,7 +135,7 @@ class MarcacionesDiariasView:
                                     ],
                                     spacing=15,
                                 ),
-                                self.btn_refrescar,
+                                ft.Row([self.switch_en_vivo, self.btn_refrescar], spacing=10),
                             ],
                             alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
                         ),
@@ -136,6 +164,25 @@ class MarcacionesDiariasView:
                         ),
                         height=500,
                     ),
+
+                    ft.Text(
+                        "Faltan por Marcar",
+                        size=22,
+                        weight=ft.FontWeight.BOLD,
+                        color="#000000",
+                    ),
+
+                    ft.Container(
+                        content=self.lista_ausentes,
+                        bgcolor="#FFFFFF",
+                        padding=20,
+                        border_radius=15,
+                        shadow=ft.BoxShadow(
+                            spread_radius=2,
+                            blur_radius=10,
+                            color="#00000019",
+                        ),
+                    ),
                 ],
                 spacing=15,
                 scroll=ft.ScrollMode.AUTO,
@@ -143,6 +190,7 @@ class MarcacionesDiariasView:
         )
         
         self.cargar_marcaciones()
+        database.suscribir_marcaciones(self.aplicar_marcacion)
     
 
     # =====================================================================
@@ -176,44 +224,179 @@ class MarcacionesDiariasView:
     #                         CARGA PRINCIPAL
     # =====================================================================
 
+    @agrupar
     def cargar_marcaciones(self, e=None):
-        hoy = datetime.now().strftime("%Y-%m-%d")
-        
-        marcaciones = database.consultar_asistencias(f_inicio=hoy, f_fin=hoy)
-        empleados = database.obtener_empleados()
+        with self.lock:
+            self._cargar()
+        actualizar(self.page)
+
+    def _cargar(self):
+        # Contadores y ausentes calculados en la BD; solo se descargan las filas que se muestran
+        resumen = database.resumen_dia()
+        marcaciones = database.consultar_asistencias(f_inicio=resumen["fecha"], f_fin=resumen["fecha"])
+
+        self.fecha = resumen["fecha"]
+        self.desactualizada = False
+        self.contadores = {
+            "total": resumen["total_empleados"],
+            "marcados": resumen["marcados"],
+            "tarde": resumen["tarde"],
+        }
+        self.marcados = {m["empleado_id"] for m in marcaciones}
+        self.tarde = {m["empleado_id"] for m in marcaciones if m["tarde"]}
+
+        self.lista_ausentes.controls.clear()
+        self.chips_ausentes = {}
+        for emp in resumen["ausentes"]:
+            chip = self.chip_ausente(emp)
+            self.chips_ausentes[emp["id"]] = chip
+            self.lista_ausentes.controls.append(chip)
+        if not self.chips_ausentes:
+            self.lista_ausentes.controls.append(self.texto_sin_ausentes())
 
-        total = len(empleados)
-        marcados = len(marcaciones)
-        tarde = sum(1 for m in marcaciones if safe_get(m, "llego_tarde") == "SI")
-        faltan = total - marcados
-        
-        # Actualizar estadísticas
-        self.stats_container.controls[0].content.controls[1].value = str(total)
-        self.stats_container.controls[1].content.controls[1].value = str(marcados)
-        self.stats_container.controls[2].content.controls[1].value = str(tarde)
-        self.stats_container.controls[3].content.controls[1].value = str(faltan)
-        
         self.lista_marcaciones.controls.clear()
-        
+        self.cards = {}
         if not marcaciones:
-            self.lista_marcaciones.controls.append(
-                ft.Container(
-                    content=ft.Column(
-                        [
-                            ft.Icon(ft.Icons.INFO_OUTLINE, size=60, color="#000000"),
-                            ft.Text("No hay marcaciones registradas hoy", size=16, color="#000000"),
-                        ],
-                        horizontal_alignment=ft.CrossAxisAlignment.CENTER
-                    ),
-                    padding=40,
-                )
-            )
+            self.lista_marcaciones.controls.append(self.sin_marcaciones())
         else:
-            ordenadas = sorted(marcaciones, key=lambda x: safe_get(x, "hora_llegada", ""), reverse=True)
-            for m in ordenadas:
-                self.lista_marcaciones.controls.append(self.card_marcacion(m))
+            # consultar_asistencias ya las trae de la más reciente a la más antigua
+            for m in marcaciones:
+                card = self.card_marcacion(m)
+                self.cards[m["id"]] = card
+                self.lista_marcaciones.controls.append(card)
 
-        self.page.update()
+        self.mostrar_contadores()
+
+    def mostrar_contadores(self):
+        valores = [
+            self.contadores["total"],
+            self.contadores["marcados"],
+            self.contadores["tarde"],
+            len(self.chips_ausentes),
+        ]
+        for card, valor in zip(self.stats_container.controls, valores):
+            card.content.controls[1].value = str(valor)
+
+    def sin_marcaciones(self):
+        return ft.Container(
+            content=ft.Column(
+                [
+                    ft.Icon(ft.Icons.INFO_OUTLINE, size=60, color="#000000"),
+                    ft.Text("No hay marcaciones registradas hoy", size=16, color="#000000"),
+                ],
+                horizontal_alignment=ft.CrossAxisAlignment.CENTER
+            ),
+            padding=40,
+        )
+
+    def texto_sin_ausentes(self):
+        return ft.Text("✅ Todos los empleados han marcado", size=16, color="#000000")
+
+
+    # =====================================================================
+    #                         EN VIVO
+    # =====================================================================
+
+    def activar(self):
+        """Al volver a la vista: solo recarga si no estaba en vivo o se perdió algún aviso."""
+        if not self.switch_en_vivo.value or self.desactualizada:
+            self.cargar_marcaciones()
+
+    def detener(self):
+        database.cancelar_marcaciones(self.aplicar_marcacion)
+
+    @agrupar
+    def cambiar_en_vivo(self, e):
+        if self.switch_en_vivo.value:
+            self.cargar_marcaciones()
+            database.suscribir_marcaciones(self.aplicar_marcacion)
+        else:
+            database.cancelar_marcaciones(self.aplicar_marcacion)
+
+    @agrupar
+    def aplicar_marcacion(self, fila):
+        """
+        Aviso de una marcación (hilo de avisos de database). Se aplica como cambio
+        puntual: una tarjeta nueva o reemplazada y los contadores; sin volver a
+        consultar ni redibujar la lista.
+        """
+        if self.container.page is None:
+            # Vista fuera de pantalla: se recarga entera con el próximo aviso
+            self.desactualizada = True
+            return
+
+        with self.lock:
+            if (fila is None or self.desactualizada or fila["op"] == "DELETE"
+                    or (self.fecha and fila["fecha"] > self.fecha)):
+                # Recargar consulta la BD: en otro hilo, para no frenar los avisos.
+                # Los que lleguen antes de la recarga ya quedan incluidos en ella
+                self.desactualizada = True
+                if not self.recargando:
+                    self.recargando = True
+                    threading.Thread(target=self._recargar, daemon=True).start()
+                return
+            if fila["fecha"] != self.fecha:
+                return   # salida de un turno nocturno de ayer
+            self._aplicar(fila)
+        actualizar(self.page, self.lista_marcaciones, self.stats_container, self.lista_ausentes)
+
+    def _recargar(self):
+        with self.lock:
+            try:
+                self._cargar()
+            finally:
+                self.recargando = False   # si falló, el próximo aviso lo reintenta
+        actualizar(self.page, self.lista_marcaciones, self.stats_container, self.lista_ausentes)
+
+    def _aplicar(self, fila):
+        card = self.card_marcacion(fila)
+        controles = self.lista_marcaciones.controls
+        anterior = self.cards.get(fila["id"])
+        if anterior is not None:
+            controles[controles.index(anterior)] = card
+        else:
+            if not self.cards:
+                controles.clear()   # quitar el aviso de "No hay marcaciones"
+            controles.insert(0, card)
+        self.cards[fila["id"]] = card
+
+        emp_id = fila["empleado_id"]
+        if emp_id not in self.marcados:
+            self.marcados.add(emp_id)
+            self.contadores["marcados"] += 1
+        if fila["tarde"] and emp_id not in self.tarde:
+            self.tarde.add(emp_id)
+            self.contadores["tarde"] += 1
+
+        chip = self.chips_ausentes.pop(emp_id, None)
+        if chip is not None:
+            self.lista_ausentes.controls.remove(chip)
+            if not self.chips_ausentes:
+                self.lista_ausentes.controls.append(self.texto_sin_ausentes())
+
+        self.mostrar_contadores()
+
+
+    # =====================================================================
+    #                         EMPLEADO AUSENTE
+    # =====================================================================
+
+    def chip_ausente(self, emp):
+        numero = safe_get(emp, "numero")
+        return ft.Container(
+            content=ft.Row(
+                [
+                    ft.Icon(ft.Icons.PERSON_OFF, size=20, color="#546E7A"),
+                    ft.Text(safe_get(emp, "nombre", "Sin Nombre"), size=14, weight=ft.FontWeight.BOLD, color="#000000"),
+                    ft.Text(f"📱 {numero}" if numero else safe_get(emp, "cedula", ""), size=12, color="#000000"),
+                ],
+                spacing=8,
+                tight=True,
+            ),
+            bgcolor="#ECEFF1",
+            padding=10,
+            border_radius=10,
+        )
 
 
     # =====================================================================
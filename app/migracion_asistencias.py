@@ -0,0 +1,188 @@
+# migracion_asistencias.py
+# Migración en línea de asistencias al esquema compacto (tarde, turno_id, segundos_trabajados)
+#
+# Pasos:
+#   1. Expandir: la migración 002 (migraciones.py) agrega las columnas nuevas, el
+#      trigger que sincroniza viejas <-> nuevas y la vista de compatibilidad v_asistencias.
+#   2. backfill: llena las columnas nuevas de los registros antiguos por lotes.
+#      Guarda el último id procesado, así que se puede interrumpir y reanudar.
+#   3. contraer: cuando no quedan pendientes, cambia la vista al esquema compacto
+#      y elimina las columnas de texto y el trigger.
+#
+# Uso:
+#   python app/migracion_asistencias.py estado
+#   python app/migracion_asistencias.py backfill [--lote 5000]
+#   python app/migracion_asistencias.py contraer
+
+import argparse
+import time
+
+import database
+import migraciones
+
+NOMBRE_BACKFILL = "asistencias_compacto"
+
+SQL_PENDIENTES = """
+SELECT COUNT(*) AS pendientes
+FROM asistencias
+WHERE tarde IS NULL
+   OR turno_id IS NULL
+   OR (segundos_trabajados IS NULL AND horas_trabajadas IS NOT NULL)
+"""
+
+
+def _asegurar_tabla_progreso(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS migracion_progreso (
+        nombre TEXT PRIMARY KEY,
+        ultimo_id BIGINT NOT NULL DEFAULT 0,
+        actualizado TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """)
+
+
+def estado() -> dict:
+    """Resumen de la migración: si quedan columnas viejas, pendientes y progreso."""
+    with database.conexion() as conn:
+        c = conn.cursor()
+        legado = migraciones.tiene_columnas_legado(c)
+        if not legado:
+            return {"legado": False, "pendientes": 0, "ultimo_id": None}
+
+        _asegurar_tabla_progreso(c)
+        c.execute(SQL_PENDIENTES)
+        pendientes = c.fetchone()["pendientes"]
+        c.execute("SELECT ultimo_id FROM migracion_progreso WHERE nombre = %s", (NOMBRE_BACKFILL,))
+        row = c.fetchone()
+        conn.commit()
+    return {"legado": True, "pendientes": pendientes, "ultimo_id": row["ultimo_id"] if row else 0}
+
+
+def backfill(lote: int = 5000, pausa: float = 0.0, on_progreso=None) -> int:
+    """
+    Llena tarde, turno_id y segundos_trabajados a partir de las columnas de texto.
+    Recorre la tabla por id en lotes de `lote` filas, cada uno en su propia transacción,
+    para no bloquear las marcaciones. Retorna el número de filas actualizadas.
+    """
+    total = 0
+    with database.conexion() as conn:
+        c = conn.cursor()
+        if not migraciones.tiene_columnas_legado(c):
+            return 0
+
+        _asegurar_tabla_progreso(c)
+        c.execute("""
+            INSERT INTO migracion_progreso (nombre) VALUES (%s)
+            ON CONFLICT (nombre) DO NOTHING
+        """, (NOMBRE_BACKFILL,))
+        c.execute("SELECT ultimo_id FROM migracion_progreso WHERE nombre = %s", (NOMBRE_BACKFILL,))
+        ultimo_id = c.fetchone()["ultimo_id"]
+        conn.commit()
+
+        while True:
+            c.execute("""
+                SELECT MAX(id) AS hasta FROM (
+                    SELECT id FROM asistencias
+                    WHERE id > %s
+                    ORDER BY id
+                    LIMIT %s
+                ) lote
+            """, (ultimo_id, lote))
+            hasta = c.fetchone()["hasta"]
+            if hasta is None:
+                break
+
+            c.execute("""
+                UPDATE asistencias a
+                SET tarde = COALESCE(a.tarde, a.llego_tarde = 'SI'),
+                    turno_id = COALESCE(a.turno_id, (SELECT t.id FROM turnos t WHERE t.nombre = a.turno)),
+                    segundos_trabajados = COALESCE(
+                        a.segundos_trabajados,
+                        EXTRACT(EPOCH FROM replace(a.horas_trabajadas, ',', '')::interval)::integer
+                    )
+                WHERE a.id > %s AND a.id <= %s
+                AND (a.tarde IS NULL
+                     OR a.turno_id IS NULL
+                     OR (a.segundos_trabajados IS NULL AND a.horas_trabajadas IS NOT NULL))
+            """, (ultimo_id, hasta))
+            total += c.rowcount
+
+            c.execute("""
+                UPDATE migracion_progreso
+                SET ultimo_id = %s, actualizado = now()
+                WHERE nombre = %s
+            """, (hasta, NOMBRE_BACKFILL))
+            conn.commit()
+
+            ultimo_id = hasta
+            if on_progreso:
+                on_progreso(ultimo_id, total)
+            if pausa:
+                time.sleep(pausa)
+
+    return total
+
+
+def contraer() -> bool:
+    """
+    Pasa al esquema compacto definitivo. Solo procede si el backfill terminó.
+    Todo ocurre en una transacción; DROP COLUMN solo marca las columnas, el espacio
+    se recupera a medida que se reescriben las filas (o con VACUUM FULL).
+    """
+    with database.conexion() as conn:
+        c = conn.cursor()
+        if not migraciones.tiene_columnas_legado(c):
+            return True
+
+        c.execute(SQL_PENDIENTES)
+        if c.fetchone()["pendientes"]:
+            conn.rollback()
+            return False
+
+        c.execute("LOCK TABLE asistencias IN ACCESS EXCLUSIVE MODE")
+        # Revalidar con el lock tomado: nadie pudo escribir filas viejas en medio
+        c.execute(SQL_PENDIENTES)
+        if c.fetchone()["pendientes"]:
+            conn.rollback()
+            return False
+
+        _asegurar_tabla_progreso(c)
+        c.execute(migraciones.SQL_VISTA_COMPACTA)
+        c.execute("DROP TRIGGER IF EXISTS trg_asistencias_sincronizar_legado ON asistencias")
+        c.execute("DROP FUNCTION IF EXISTS asistencias_sincronizar_legado()")
+        c.execute("""
+            ALTER TABLE asistencias
+            DROP COLUMN llego_tarde,
+            DROP COLUMN turno,
+            DROP COLUMN horas_trabajadas,
+            ALTER COLUMN tarde SET DEFAULT FALSE,
+            ALTER COLUMN tarde SET NOT NULL,
+            ALTER COLUMN turno_id SET NOT NULL,
+            ADD CONSTRAINT asistencias_turno_id_fkey FOREIGN KEY (turno_id) REFERENCES turnos(id)
+        """)
+        c.execute("DELETE FROM migracion_progreso WHERE nombre = %s", (NOMBRE_BACKFILL,))
+        conn.commit()
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migración de asistencias al esquema compacto")
+    parser.add_argument("accion", choices=["estado", "backfill", "contraer"])
+    parser.add_argument("--lote", type=int, default=5000, help="filas por transacción en el backfill")
+    parser.add_argument("--pausa", type=float, default=0.0, help="segundos de espera entre lotes")
+    args = parser.parse_args()
+
+    if args.accion == "estado":
+        print(estado())
+    elif args.accion == "backfill":
+        filas = backfill(
+            lote=args.lote,
+            pausa=args.pausa,
+            on_progreso=lambda ultimo, total: print(f"  hasta id {ultimo}: {total} filas actualizadas"),
+        )
+        print(f"✅ Backfill terminado: {filas} filas actualizadas")
+    else:
+        if contraer():
+            print("✅ Esquema compacto aplicado")
+        else:
+            print("❌ Quedan filas sin migrar; ejecute primero: backfill")
@@ -0,0 +1,904 @@
+# migraciones.py
+# Migraciones versionadas del esquema PostgreSQL
+#
+# Cada migración tiene un número de versión y se aplica una sola vez, en orden,
+# dentro de su propia transacción; la tabla schema_version registra las aplicadas.
+# La aplicación solo consulta la versión al arrancar (database.verificar_esquema),
+# nunca ejecuta DDL. Para agregar una migración: escribir la función y sumarla
+# al final de MIGRACIONES.
+#
+# Uso:
+#   python app/migraciones.py estado
+#   python app/migraciones.py aplicar          (también corre el mantenimiento)
+#   python app/migraciones.py mantenimiento    (particiones de los próximos meses)
+
+import argparse
+from typing import Optional
+
+import psycopg2
+import psycopg2.errors
+
+import database
+from database import TURNOS
+
+# Lock de sesión para que dos despliegues no migren al mismo tiempo
+LOCK_MIGRACIONES = 7210001
+
+
+class ConversionEnCurso(Exception):
+    """asistencias_part existe (particionar_asistencias.py a medias): no se migra."""
+
+# ---------- Esquema compacto de asistencias ----------
+# asistencias guarda tipos compactos: tarde BOOLEAN, turno_id SMALLINT (tabla turnos)
+# y segundos_trabajados INTEGER. Las bases creadas antes tenían llego_tarde 'SI'/'NO',
+# turno con el nombre completo y horas_trabajadas como texto; mientras esas columnas
+# existan, un trigger las mantiene sincronizadas en ambas direcciones y la vista
+# v_asistencias expone siempre las mismas columnas (las tipadas y las de texto
+# que usan reportes y exportaciones). Backfill y retiro de las columnas viejas:
+# migracion_asistencias.py.
+
+SQL_VISTA_LEGADO = """
+CREATE OR REPLACE VIEW v_asistencias AS
+SELECT
+    a.id,
+    a.empleado_id,
+    a.fecha,
+    a.hora_llegada,
+    a.hora_salida,
+    a.turno_completado,
+    COALESCE(a.tarde, a.llego_tarde = 'SI') AS tarde,
+    COALESCE(a.turno_id, t_nombre.id) AS turno_id,
+    COALESCE(t.codigo, t_nombre.codigo) AS turno_codigo,
+    COALESCE(a.segundos_trabajados,
+             EXTRACT(EPOCH FROM replace(a.horas_trabajadas, ',', '')::interval)::integer) AS segundos_trabajados,
+    COALESCE(t.nombre, a.turno) AS turno,
+    a.llego_tarde,
+    a.horas_trabajadas
+FROM asistencias a
+LEFT JOIN turnos t ON t.id = a.turno_id
+LEFT JOIN turnos t_nombre ON a.turno_id IS NULL AND t_nombre.nombre = a.turno;
+"""
+
+SQL_VISTA_COMPACTA = """
+CREATE OR REPLACE VIEW v_asistencias AS
+SELECT
+    a.id,
+    a.empleado_id,
+    a.fecha,
+    a.hora_llegada,
+    a.hora_salida,
+    a.turno_completado,
+    a.tarde,
+    a.turno_id,
+    t.codigo AS turno_codigo,
+    a.segundos_trabajados,
+    t.nombre AS turno,
+    CASE WHEN a.tarde THEN 'SI' ELSE 'NO' END AS llego_tarde,
+    to_char(make_interval(secs => a.segundos_trabajados), 'FMHH24:MI:SS') AS horas_trabajadas
+FROM asistencias a
+LEFT JOIN turnos t ON t.id = a.turno_id;
+"""
+
+# Sincroniza columnas viejas y nuevas: lo que escribió el código nuevo (tipado)
+# manda; si solo escribió un proceso viejo, se derivan las tipadas del texto.
+SQL_SINCRONIZAR_LEGADO = """
+CREATE OR REPLACE FUNCTION asistencias_sincronizar_legado() RETURNS trigger AS $$
+BEGIN
+    IF NEW.tarde IS NOT NULL AND (TG_OP = 'INSERT' OR NEW.tarde IS DISTINCT FROM OLD.tarde) THEN
+        NEW.llego_tarde := CASE WHEN NEW.tarde THEN 'SI' ELSE 'NO' END;
+    ELSIF NEW.llego_tarde IS NOT NULL THEN
+        NEW.tarde := NEW.llego_tarde = 'SI';
+    END IF;
+
+    IF NEW.turno_id IS NOT NULL AND (TG_OP = 'INSERT' OR NEW.turno_id IS DISTINCT FROM OLD.turno_id) THEN
+        SELECT t.nombre INTO NEW.turno FROM turnos t WHERE t.id = NEW.turno_id;
+    ELSIF NEW.turno IS NOT NULL THEN
+        SELECT t.id INTO NEW.turno_id FROM turnos t WHERE t.nombre = NEW.turno;
+    END IF;
+
+    IF NEW.segundos_trabajados IS NOT NULL
+       AND (TG_OP = 'INSERT' OR NEW.segundos_trabajados IS DISTINCT FROM OLD.segundos_trabajados) THEN
+        NEW.horas_trabajadas := to_char(make_interval(secs => NEW.segundos_trabajados), 'FMHH24:MI:SS');
+    ELSIF NEW.horas_trabajadas IS NOT NULL THEN
+        NEW.segundos_trabajados := EXTRACT(EPOCH FROM replace(NEW.horas_trabajadas, ',', '')::interval)::integer;
+    END IF;
+
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_asistencias_sincronizar_legado ON asistencias;
+CREATE TRIGGER trg_asistencias_sincronizar_legado
+BEFORE INSERT OR UPDATE ON asistencias
+FOR EACH ROW EXECUTE FUNCTION asistencias_sincronizar_legado();
+"""
+
+def tiene_columnas_legado(c) -> bool:
+    """True mientras asistencias conserve las columnas de texto previas a la migración."""
+    c.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+        AND table_name = 'asistencias'
+        AND column_name = 'llego_tarde'
+    """)
+    return c.fetchone() is not None
+
+# Función del servidor que resuelve una marcación completa: busca al empleado,
+# decide llegada o salida según su turno abierto y escribe el registro.
+# El lock por empleado evita dobles registros si se marca dos veces seguidas, y
+# una marcación a menos de p_minimo_segundos de la llegada (doble Enter, volver
+# a poner la cédula para comprobar) responde DUPLICADO sin cerrar el turno.
+SQL_FUNCION_MARCAR = """
+DROP FUNCTION IF EXISTS marcar_asistencia(TEXT, DATE, TIME, BOOLEAN, TEXT, TEXT);
+DROP FUNCTION IF EXISTS marcar_asistencia(TEXT, DATE, TIME, BOOLEAN, SMALLINT, BOOLEAN);
+
+CREATE OR REPLACE FUNCTION marcar_asistencia(
+    p_cedula TEXT,
+    p_fecha DATE,
+    p_hora TIME,
+    p_madrugada BOOLEAN,
+    p_turno_id SMALLINT,
+    p_tarde BOOLEAN,
+    p_minimo_segundos INTEGER DEFAULT 0
+)
+RETURNS TABLE (
+    tipo TEXT,
+    empleado_id INTEGER,
+    nombre TEXT,
+    cedula TEXT,
+    numero TEXT,
+    fecha DATE,
+    hora_llegada TIME,
+    hora_salida TIME,
+    turno TEXT,
+    tarde BOOLEAN,
+    segundos_trabajados INTEGER
+) AS $$
+#variable_conflict use_column
+DECLARE
+    v_emp empleados%ROWTYPE;
+    v_reg asistencias%ROWTYPE;
+BEGIN
+    SELECT e.* INTO v_emp
+    FROM empleados e
+    WHERE e.cedula = p_cedula AND e.activo = TRUE;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    PERFORM pg_advisory_xact_lock(v_emp.id);
+
+    -- Registro de hoy o, de madrugada, el turno nocturno de ayer sin cerrar
+    SELECT a.* INTO v_reg
+    FROM asistencias a
+    WHERE a.empleado_id = v_emp.id
+      AND (a.fecha = p_fecha
+           OR (p_madrugada
+               AND a.fecha = p_fecha - 1
+               AND a.turno_completado = FALSE
+               AND a.hora_salida IS NULL))
+    ORDER BY a.fecha DESC, a.id DESC
+    LIMIT 1;
+
+    IF NOT FOUND THEN
+        INSERT INTO asistencias (empleado_id, fecha, hora_llegada, turno_id, tarde, turno_completado)
+        VALUES (v_emp.id, p_fecha, p_hora, p_turno_id, p_tarde, FALSE)
+        RETURNING * INTO v_reg;
+        tipo := 'LLEGADA';
+    ELSIF v_reg.hora_salida IS NULL AND v_reg.hora_llegada IS NOT NULL
+          AND (p_fecha + p_hora) - (v_reg.fecha + v_reg.hora_llegada) < make_interval(secs => p_minimo_segundos) THEN
+        tipo := 'DUPLICADO';
+    ELSIF v_reg.hora_salida IS NULL AND v_reg.hora_llegada IS NOT NULL THEN
+        UPDATE asistencias a
+        SET hora_salida = p_hora,
+            segundos_trabajados = EXTRACT(EPOCH FROM (p_fecha + p_hora) - (a.fecha + a.hora_llegada))::integer,
+            turno_completado = TRUE
+        WHERE a.id = v_reg.id
+        RETURNING a.* INTO v_reg;
+        tipo := 'SALIDA';
+    ELSE
+        tipo := 'COMPLETO';
+    END IF;
+
+    empleado_id := v_emp.id;
+    nombre := v_emp.nombre;
+    cedula := v_emp.cedula;
+    numero := v_emp.numero;
+    fecha := v_reg.fecha;
+    hora_llegada := v_reg.hora_llegada;
+    hora_salida := v_reg.hora_salida;
+    SELECT t.nombre INTO turno FROM turnos t WHERE t.id = v_reg.turno_id;
+    tarde := v_reg.tarde;
+    segundos_trabajados := v_reg.segundos_trabajados;
+    RETURN NEXT;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Crea la partición del mes de p_mes en p_padre. Las filas de ese mes que hayan
+# caído en asistencias_default se mueven antes de adjuntarla. El DELETE dispara
+# los triggers de la partición por defecto: sin avisos (asistencias.sin_avisos)
+# y, como el INSERT va a una tabla todavía suelta, resumen_diario de ese mes se
+# recalcula al final.
+SQL_FUNCION_CREAR_PARTICION = """
+CREATE OR REPLACE FUNCTION crear_particion_asistencias(p_padre TEXT, p_mes DATE)
+RETURNS TEXT AS $$
+DECLARE
+    v_desde DATE := date_trunc('month', p_mes)::date;
+    v_hasta DATE := (date_trunc('month', p_mes) + interval '1 month')::date;
+    v_nombre TEXT := 'asistencias_' || to_char(v_desde, 'YYYY_MM');
+    v_movidas INTEGER := 0;
+BEGIN
+    IF to_regclass(v_nombre) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+
+    EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                   v_nombre, p_padre);
+
+    IF to_regclass('asistencias_default') IS NOT NULL THEN
+        PERFORM set_config('asistencias.sin_avisos', 'on', true);
+        EXECUTE format(
+            'WITH movidas AS (DELETE FROM asistencias_default WHERE fecha >= %L AND fecha < %L RETURNING *) '
+            'INSERT INTO %I SELECT * FROM movidas',
+            v_desde, v_hasta, v_nombre);
+        GET DIAGNOSTICS v_movidas = ROW_COUNT;
+        PERFORM set_config('asistencias.sin_avisos', 'off', true);
+    END IF;
+
+    EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                   p_padre, v_nombre, v_desde, v_hasta);
+
+    -- El trigger de resumen restó las filas movidas y nada las volvió a sumar
+    IF v_movidas > 0 AND p_padre = 'asistencias' AND to_regclass('resumen_diario') IS NOT NULL THEN
+        PERFORM resumen_diario_reconstruir(v_desde, v_hasta - 1);
+    END IF;
+    RETURN v_nombre;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+# Publica cada llegada/salida de hoy o ayer en el canal asistencias_marcaciones
+# (ver _m010_notificar_marcaciones). Con asistencias.sin_avisos = 'on' en la
+# transacción (mover filas entre particiones) no avisa.
+SQL_FUNCION_NOTIFICAR = """
+CREATE OR REPLACE FUNCTION asistencias_notificar() RETURNS trigger AS $$
+DECLARE
+    v_fila asistencias%ROWTYPE;
+BEGIN
+    IF current_setting('asistencias.sin_avisos', true) = 'on' THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP = 'DELETE' THEN
+        v_fila := OLD;
+    ELSE
+        v_fila := NEW;
+    END IF;
+    IF v_fila.fecha < CURRENT_DATE - 1 THEN
+        RETURN NULL;
+    END IF;
+    PERFORM pg_notify('asistencias_marcaciones', json_build_object(
+        'op', TG_OP,
+        'id', v_fila.id,
+        'empleado_id', v_fila.empleado_id,
+        'fecha', v_fila.fecha,
+        'hora_llegada', v_fila.hora_llegada,
+        'hora_salida', v_fila.hora_salida,
+        'turno_id', v_fila.turno_id,
+        'tarde', v_fila.tarde,
+        'turno_completado', v_fila.turno_completado,
+        'segundos_trabajados', v_fila.segundos_trabajados
+    )::text);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+# ---------- Migraciones ----------
+def sin_transaccion(migracion):
+    """Marca una migración que corre en autocommit (p. ej. CREATE INDEX CONCURRENTLY)."""
+    migracion.sin_transaccion = True
+    return migracion
+
+
+def _crear_indice_concurrente(c, nombre: str, definicion: str):
+    """
+    CREATE INDEX CONCURRENTLY sin bloquear escrituras. Si un intento anterior falló
+    y dejó el índice inválido, se elimina primero para que IF NOT EXISTS no lo salte.
+    """
+    c.execute("""
+        SELECT i.indisvalid
+        FROM pg_index i
+        JOIN pg_class ci ON ci.oid = i.indexrelid
+        WHERE ci.relname = %s AND ci.relnamespace = current_schema()::regnamespace
+    """, (nombre,))
+    row = c.fetchone()
+    if row and not row["indisvalid"]:
+        c.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nombre}")
+    c.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {nombre} {definicion}")
+
+
+def _m001_esquema_base(c):
+    """Tablas empleados, turnos y asistencias con sus índices."""
+    # Tabla empleados
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS empleados (
+        id SERIAL PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        cedula TEXT UNIQUE NOT NULL,
+        numero TEXT,
+        activo BOOLEAN DEFAULT TRUE
+    );
+    """)
+
+    # Catálogo de turnos (asistencias guarda solo el id)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS turnos (
+        id SMALLINT PRIMARY KEY,
+        codigo TEXT UNIQUE NOT NULL,
+        nombre TEXT NOT NULL
+    );
+    """)
+    for codigo, info in TURNOS.items():
+        c.execute("""
+            INSERT INTO turnos (id, codigo, nombre) VALUES (%s, %s, %s)
+            ON CONFLICT (id) DO UPDATE SET codigo = EXCLUDED.codigo, nombre = EXCLUDED.nombre
+        """, (info["id"], codigo, info["nombre"]))
+
+    # Tabla asistencias (las bases antiguas ya la tienen con columnas de texto)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS asistencias (
+        id SERIAL PRIMARY KEY,
+        empleado_id INTEGER NOT NULL,
+        fecha DATE NOT NULL,
+        hora_llegada TIME,
+        hora_salida TIME,
+        turno_id SMALLINT NOT NULL REFERENCES turnos(id),
+        tarde BOOLEAN NOT NULL DEFAULT FALSE,
+        segundos_trabajados INTEGER,
+        turno_completado BOOLEAN DEFAULT FALSE,
+        FOREIGN KEY (empleado_id) REFERENCES empleados(id)
+    );
+    """)
+
+    c.execute("""
+    ALTER TABLE asistencias 
+    ADD COLUMN IF NOT EXISTS turno_completado BOOLEAN DEFAULT FALSE;
+    """)
+
+    # Índices para mejor rendimiento
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_asistencias_empleado_fecha 
+    ON asistencias(empleado_id, fecha);
+    """)
+
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_empleados_cedula 
+    ON empleados(cedula);
+    """)
+
+
+def _m002_columnas_compactas(c):
+    """Columnas tipadas, sincronización con las de texto y vista v_asistencias."""
+    # Solo metadatos en bases creadas con el esquema anterior
+    c.execute("""
+    ALTER TABLE asistencias
+    ADD COLUMN IF NOT EXISTS turno_id SMALLINT,
+    ADD COLUMN IF NOT EXISTS tarde BOOLEAN,
+    ADD COLUMN IF NOT EXISTS segundos_trabajados INTEGER;
+    """)
+
+    if tiene_columnas_legado(c):
+        c.execute(SQL_SINCRONIZAR_LEGADO)
+        c.execute(SQL_VISTA_LEGADO)
+    else:
+        c.execute(SQL_VISTA_COMPACTA)
+
+
+def _m003_funcion_marcar(c):
+    """Función marcar_asistencia() para marcar en un solo viaje (database.marcar)."""
+    c.execute(SQL_FUNCION_MARCAR)
+
+
+def _crear_f_unaccent(c):
+    """
+    unaccent() es STABLE (depende del diccionario configurado); fijando el
+    diccionario se puede declarar IMMUTABLE y usar en un índice de expresión.
+    Función y diccionario van con el esquema de la extensión: ANALYZE, autovacuum,
+    REINDEX y CREATE INDEX (PostgreSQL 17) corren con search_path = pg_catalog,
+    y pg_restore con search_path vacío. Se califica en vez de usar SET
+    search_path para que la función siga pudiendo expandirse en línea.
+    """
+    c.execute("SELECT extnamespace::regnamespace::text AS esquema FROM pg_extension WHERE extname = 'unaccent'")
+    esquema = c.fetchone()["esquema"]
+    c.execute(f"""
+    CREATE OR REPLACE FUNCTION f_unaccent(TEXT) RETURNS TEXT
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT AS
+    $$ SELECT {esquema}.unaccent('{esquema}.unaccent'::regdictionary, $1) $$;
+    """)
+
+
+def _m004_busqueda_trigramas(c):
+    """Índices GIN de trigramas para buscar por nombre (sin tildes) y cédula."""
+    c.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    c.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+
+    _crear_f_unaccent(c)
+
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_empleados_nombre_trgm
+    ON empleados USING gin (f_unaccent(nombre) gin_trgm_ops);
+    """)
+
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_empleados_cedula_trgm
+    ON empleados USING gin (cedula gin_trgm_ops);
+    """)
+
+
+@sin_transaccion
+def _m005_indices_reportes(c):
+    """Índices según los patrones de acceso reales de reportes y turnos abiertos."""
+    # Reportes: rango de fechas ordenado como ORDER BY de consultar_asistencias,
+    # sin Sort; INCLUDE con las columnas tipadas permite index-only scans.
+    _crear_indice_concurrente(c, "idx_asistencias_fecha_hora", """
+    ON asistencias (fecha DESC, hora_llegada DESC, id DESC)
+    INCLUDE (empleado_id, hora_salida, turno_id, tarde, segundos_trabajados, turno_completado)
+    """)
+
+    # Turnos abiertos: solo las filas sin cerrar (unas decenas), para la salida
+    # y el turno nocturno de ayer en marcar_asistencia().
+    _crear_indice_concurrente(c, "idx_asistencias_abiertas", """
+    ON asistencias (empleado_id, fecha DESC)
+    WHERE turno_completado = FALSE
+    """)
+
+    # Duplicaba el índice único que ya crea la restricción UNIQUE de cedula
+    c.execute("DROP INDEX CONCURRENTLY IF EXISTS idx_empleados_cedula")
+
+
+def _m006_funciones_particiones(c):
+    """Funciones para crear particiones mensuales de asistencias (ver particionar_asistencias.py)."""
+    c.execute(SQL_FUNCION_CREAR_PARTICION)
+
+    # Mantiene creadas las particiones del mes actual y los p_meses siguientes.
+    # No hace nada mientras asistencias siga siendo una tabla sin particionar.
+    c.execute("""
+    CREATE OR REPLACE FUNCTION crear_particiones_asistencias(p_meses INTEGER DEFAULT 3)
+    RETURNS INTEGER AS $$
+    DECLARE
+        v_creadas INTEGER := 0;
+        v_mes DATE;
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_class WHERE oid = to_regclass('asistencias') AND relkind = 'p') THEN
+            RETURN 0;
+        END IF;
+
+        FOR i IN 0..p_meses LOOP
+            v_mes := (date_trunc('month', CURRENT_DATE) + make_interval(months => i))::date;
+            IF crear_particion_asistencias('asistencias', v_mes) IS NOT NULL THEN
+                v_creadas := v_creadas + 1;
+            END IF;
+        END LOOP;
+        RETURN v_creadas;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+
+def _m007_notificar_empleados(c):
+    """Avisa por NOTIFY cada cambio en empleados (caché de database.py)."""
+    # El payload es el id del empleado; '*' (TRUNCATE) pide recargar todo
+    c.execute("""
+    CREATE OR REPLACE FUNCTION empleados_notificar_cambio() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            PERFORM pg_notify('empleados_cambios', '*');
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('empleados_cambios', OLD.id::text);
+        ELSE
+            PERFORM pg_notify('empleados_cambios', NEW.id::text);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS trg_empleados_notificar ON empleados;
+    CREATE TRIGGER trg_empleados_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON empleados
+    FOR EACH ROW EXECUTE FUNCTION empleados_notificar_cambio();
+
+    DROP TRIGGER IF EXISTS trg_empleados_notificar_truncate ON empleados;
+    CREATE TRIGGER trg_empleados_notificar_truncate
+    AFTER TRUNCATE ON empleados
+    FOR EACH STATEMENT EXECUTE FUNCTION empleados_notificar_cambio();
+    """)
+
+
+def _m008_resumen_dia(c):
+    """Contadores del día y lista de ausentes en una sola llamada (vista de marcaciones diarias)."""
+    # Cuenta empleados distintos, no filas: quien tiene dos registros el mismo día
+    # (turno nocturno y diurno) cuenta una vez. Los ausentes salen de un anti-join
+    # sobre idx_asistencias_empleado_fecha.
+    c.execute("""
+    CREATE OR REPLACE FUNCTION resumen_dia(p_fecha DATE)
+    RETURNS TABLE (
+        total_empleados INTEGER,
+        marcados INTEGER,
+        tarde INTEGER,
+        en_turno INTEGER,
+        registros INTEGER,
+        ausentes JSONB
+    ) AS $$
+        SELECT
+            (SELECT COUNT(*) FROM empleados WHERE activo = TRUE)::integer,
+            COUNT(DISTINCT a.empleado_id)::integer,
+            COUNT(DISTINCT a.empleado_id) FILTER (WHERE a.tarde)::integer,
+            COUNT(DISTINCT a.empleado_id) FILTER (WHERE NOT a.turno_completado
+                                                  AND a.hora_salida IS NULL)::integer,
+            COUNT(*)::integer,
+            (SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                        'id', e.id, 'nombre', e.nombre, 'cedula', e.cedula, 'numero', e.numero
+                    ) ORDER BY e.nombre), '[]'::jsonb)
+             FROM empleados e
+             WHERE e.activo = TRUE
+             AND NOT EXISTS (SELECT 1 FROM asistencias x
+                             WHERE x.empleado_id = e.id AND x.fecha = p_fecha))
+        FROM asistencias a
+        JOIN empleados e ON e.id = a.empleado_id AND e.activo = TRUE
+        WHERE a.fecha = p_fecha
+    $$ LANGUAGE sql STABLE;
+    """)
+
+
+# Mantiene resumen_diario al día en la misma transacción que cada escritura en
+# asistencias: resta el aporte de la fila vieja y suma el de la nueva.
+SQL_TRIGGER_RESUMEN = """
+DROP TRIGGER IF EXISTS trg_asistencias_resumen ON asistencias;
+CREATE TRIGGER trg_asistencias_resumen
+AFTER INSERT OR UPDATE OR DELETE ON asistencias
+FOR EACH ROW EXECUTE FUNCTION asistencias_actualizar_resumen();
+"""
+
+
+def _m009_resumen_diario(c):
+    """Tabla resumen_diario por fecha y turno, mantenida por trigger."""
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS resumen_diario (
+        fecha DATE NOT NULL,
+        turno_id SMALLINT NOT NULL,
+        llegadas INTEGER NOT NULL DEFAULT 0,
+        tarde INTEGER NOT NULL DEFAULT 0,
+        completos INTEGER NOT NULL DEFAULT 0,
+        segundos_trabajados BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (fecha, turno_id)
+    );
+    """)
+
+    c.execute("""
+    CREATE OR REPLACE FUNCTION resumen_diario_sumar(
+        p_fecha DATE, p_turno_id SMALLINT, p_signo INTEGER,
+        p_llegada BOOLEAN, p_tarde BOOLEAN, p_completo BOOLEAN, p_segundos INTEGER
+    ) RETURNS VOID AS $$
+    BEGIN
+        -- Filas del esquema viejo todavía sin turno_id: las suma el backfill al llenarlo
+        IF p_fecha IS NULL OR p_turno_id IS NULL THEN
+            RETURN;
+        END IF;
+        INSERT INTO resumen_diario AS r (fecha, turno_id, llegadas, tarde, completos, segundos_trabajados)
+        VALUES (p_fecha, p_turno_id,
+                p_signo * (p_llegada)::integer,
+                p_signo * COALESCE(p_tarde, FALSE)::integer,
+                p_signo * COALESCE(p_completo, FALSE)::integer,
+                p_signo * COALESCE(p_segundos, 0))
+        ON CONFLICT (fecha, turno_id) DO UPDATE
+        SET llegadas = r.llegadas + EXCLUDED.llegadas,
+            tarde = r.tarde + EXCLUDED.tarde,
+            completos = r.completos + EXCLUDED.completos,
+            segundos_trabajados = r.segundos_trabajados + EXCLUDED.segundos_trabajados;
+    END;
+    $$ LANGUAGE plpgsql;
+
+    CREATE OR REPLACE FUNCTION asistencias_actualizar_resumen() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE'
+           AND NEW.fecha IS NOT DISTINCT FROM OLD.fecha
+           AND NEW.turno_id IS NOT DISTINCT FROM OLD.turno_id
+           AND (NEW.hora_llegada IS NULL) = (OLD.hora_llegada IS NULL)
+           AND NEW.tarde IS NOT DISTINCT FROM OLD.tarde
+           AND NEW.turno_completado IS NOT DISTINCT FROM OLD.turno_completado
+           AND NEW.segundos_trabajados IS NOT DISTINCT FROM OLD.segundos_trabajados THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM resumen_diario_sumar(OLD.fecha, OLD.turno_id, -1, OLD.hora_llegada IS NOT NULL,
+                                         OLD.tarde, OLD.turno_completado, OLD.segundos_trabajados);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM resumen_diario_sumar(NEW.fecha, NEW.turno_id, 1, NEW.hora_llegada IS NOT NULL,
+                                         NEW.tarde, NEW.turno_completado, NEW.segundos_trabajados);
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    # Recalcula un rango de fechas desde asistencias. SHARE bloquea las escrituras
+    # (no las lecturas) mientras dura, para que el trigger no sume sobre filas borradas.
+    c.execute("""
+    CREATE OR REPLACE FUNCTION resumen_diario_reconstruir(p_desde DATE, p_hasta DATE)
+    RETURNS INTEGER AS $$
+    DECLARE
+        v_filas INTEGER;
+    BEGIN
+        LOCK TABLE asistencias IN SHARE MODE;
+        DELETE FROM resumen_diario WHERE fecha >= p_desde AND fecha <= p_hasta;
+        INSERT INTO resumen_diario (fecha, turno_id, llegadas, tarde, completos, segundos_trabajados)
+        SELECT fecha,
+               turno_id,
+               COUNT(*) FILTER (WHERE hora_llegada IS NOT NULL),
+               COUNT(*) FILTER (WHERE tarde),
+               COUNT(*) FILTER (WHERE turno_completado),
+               COALESCE(SUM(segundos_trabajados), 0)
+        FROM asistencias
+        WHERE fecha >= p_desde AND fecha <= p_hasta
+        AND turno_id IS NOT NULL
+        GROUP BY fecha, turno_id;
+        GET DIAGNOSTICS v_filas = ROW_COUNT;
+        RETURN v_filas;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    c.execute(SQL_TRIGGER_RESUMEN)
+    # La historia existente NO se calcula aquí: resumen_diario_reconstruir toma
+    # SHARE sobre asistencias y, sobre toda la historia en una transacción,
+    # frenaría las marcaciones durante el despliegue. Después de aplicar se llena
+    # mes por mes con: python app/resumen_diario.py reconstruir
+
+
+# Publica cada llegada/salida de hoy o ayer en el canal asistencias_marcaciones
+# (pantalla de marcaciones diarias en vivo). Los cambios a fechas viejas
+# (backfill, correcciones) no generan avisos.
+SQL_TRIGGER_NOTIFICAR = """
+DROP TRIGGER IF EXISTS trg_asistencias_notificar ON asistencias;
+CREATE TRIGGER trg_asistencias_notificar
+AFTER INSERT OR UPDATE OR DELETE ON asistencias
+FOR EACH ROW EXECUTE FUNCTION asistencias_notificar();
+"""
+
+
+def _m010_notificar_marcaciones(c):
+    """Aviso por NOTIFY de cada marcación (vista de marcaciones diarias en vivo)."""
+    c.execute(SQL_FUNCION_NOTIFICAR)
+    c.execute(SQL_TRIGGER_NOTIFICAR)
+
+
+# Anota en asistencias.cambio el id de la transacción que escribió cada fila
+# (exportación incremental, database.exportacion_incremental). Un UPDATE que no
+# cambia nada no la mueve.
+SQL_TRIGGER_CAMBIO = """
+DROP TRIGGER IF EXISTS trg_asistencias_cambio ON asistencias;
+CREATE TRIGGER trg_asistencias_cambio
+BEFORE INSERT OR UPDATE ON asistencias
+FOR EACH ROW EXECUTE FUNCTION asistencias_marcar_cambio();
+"""
+
+
+@sin_transaccion
+def _m011_indice_empleados_nombre(c):
+    """Índice para paginar empleados activos por (nombre, id)."""
+    _crear_indice_concurrente(
+        c, "idx_empleados_activos_nombre",
+        "ON empleados (nombre, id) WHERE activo = TRUE",
+    )
+
+
+def _m012_marcas_exportacion(c):
+    """Columna asistencias.cambio y marcas por consumidor para exportar solo lo nuevo."""
+    # Sin DEFAULT: solo metadatos. Las filas viejas quedan en NULL y salen
+    # únicamente en la primera exportación de cada consumidor (marca 0).
+    c.execute("ALTER TABLE asistencias ADD COLUMN IF NOT EXISTS cambio BIGINT")
+
+    c.execute("""
+    CREATE OR REPLACE FUNCTION asistencias_marcar_cambio() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND NEW IS NOT DISTINCT FROM OLD THEN
+            RETURN NEW;
+        END IF;
+        NEW.cambio := txid_current();
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    c.execute(SQL_TRIGGER_CAMBIO)
+
+    # marca: xmin del snapshot de la última exportación confirmada (ver database.py)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS marcas_exportacion (
+        consumidor TEXT PRIMARY KEY,
+        marca BIGINT NOT NULL,
+        filas INTEGER NOT NULL DEFAULT 0,
+        actualizada TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """)
+
+
+@sin_transaccion
+def _m013_indice_cambios(c):
+    """Índice parcial sobre asistencias.cambio para la exportación incremental."""
+    c.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('asistencias')")
+    if c.fetchone()["relkind"] != "p":
+        _crear_indice_concurrente(
+            c, "idx_asistencias_cambio",
+            "ON asistencias (cambio) WHERE cambio IS NOT NULL",
+        )
+        return
+
+    # Ya particionada (particionar_asistencias.py): CONCURRENTLY no se admite en la
+    # tabla padre. Se crea el índice del padre con ON ONLY (inválido y sin bloquear
+    # escrituras), el de cada partición CONCURRENTLY y se adjuntan; al quedar todas
+    # adjuntas el del padre pasa a válido.
+    c.execute("""
+    CREATE INDEX IF NOT EXISTS idx_asistencias_cambio
+    ON ONLY asistencias (cambio) WHERE cambio IS NOT NULL
+    """)
+    c.execute("""
+        SELECT ci.relname AS particion
+        FROM pg_inherits i
+        JOIN pg_class ci ON ci.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass('asistencias')
+        ORDER BY ci.relname
+    """)
+    for row in c.fetchall():
+        indice = f"idx_{row['particion']}_cambio"
+        _crear_indice_concurrente(c, indice, f"ON {row['particion']} (cambio) WHERE cambio IS NOT NULL")
+        c.execute(f"ALTER INDEX idx_asistencias_cambio ATTACH PARTITION {indice}")
+
+
+def _m014_marcar_duplicado(c):
+    """marcar_asistencia() con intervalo mínimo entre llegada y salida."""
+    c.execute(SQL_FUNCION_MARCAR)
+
+
+def _m015_f_unaccent_calificada(c):
+    """f_unaccent() sin depender del search_path (mismo resultado: el índice sigue valiendo)."""
+    _crear_f_unaccent(c)
+
+
+def _m016_mover_particion_sin_efectos(c):
+    """Mover filas de asistencias_default a una partición nueva sin avisos ni descontar del resumen."""
+    c.execute(SQL_FUNCION_NOTIFICAR)
+    c.execute(SQL_FUNCION_CREAR_PARTICION)
+
+
+MIGRACIONES = [
+    (1, "esquema base", _m001_esquema_base),
+    (2, "columnas compactas de asistencias", _m002_columnas_compactas),
+    (3, "función marcar_asistencia", _m003_funcion_marcar),
+    (4, "búsqueda por trigramas", _m004_busqueda_trigramas),
+    (5, "índices de reportes y turnos abiertos", _m005_indices_reportes),
+    (6, "funciones de particiones mensuales", _m006_funciones_particiones),
+    (7, "notificación de cambios en empleados", _m007_notificar_empleados),
+    (8, "resumen del día con ausentes", _m008_resumen_dia),
+    (9, "tabla resumen_diario", _m009_resumen_diario),
+    (10, "aviso de marcaciones", _m010_notificar_marcaciones),
+    (11, "índice de empleados por nombre", _m011_indice_empleados_nombre),
+    (12, "marcas de exportación incremental", _m012_marcas_exportacion),
+    (13, "índice de cambios en asistencias", _m013_indice_cambios),
+    (14, "marcación duplicada en marcar_asistencia", _m014_marcar_duplicado),
+    (15, "f_unaccent con esquema calificado", _m015_f_unaccent_calificada),
+    (16, "particiones nuevas sin descontar de resumen_diario", _m016_mover_particion_sin_efectos),
+]
+
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+
+# ---------- Ejecución ----------
+def version_actual() -> Optional[int]:
+    """Versión aplicada del esquema, o None si la base aún no está versionada."""
+    with database.conexion() as conn:
+        c = conn.cursor()
+        try:
+            c.execute("SELECT MAX(version) AS version FROM schema_version")
+        except psycopg2.errors.UndefinedTable:
+            conn.rollback()
+            return None
+        row = c.fetchone()
+        conn.rollback()
+    return row["version"] or 0
+
+
+def aplicar(on_aplicada=None) -> int:
+    """Aplica en orden las migraciones pendientes. Retorna cuántas se aplicaron."""
+    aplicadas = 0
+    with database.conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_advisory_lock(%s)", (LOCK_MIGRACIONES,))
+        try:
+            c.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                descripcion TEXT NOT NULL,
+                aplicada TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """)
+            c.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_version")
+            version = c.fetchone()["version"]
+            # La réplica hacia asistencias_part copia columnas fijas: una migración
+            # que cambie asistencias dejaría las dos tablas distintas
+            c.execute("SELECT to_regclass('asistencias_part') IS NOT NULL AS convirtiendo")
+            convirtiendo = c.fetchone()["convirtiendo"]
+            conn.commit()
+            if convirtiendo and version < VERSION_ESQUEMA:
+                raise ConversionEnCurso(
+                    "asistencias_part existe: termine (intercambiar) o deshaga la conversión "
+                    "de particionar_asistencias.py antes de migrar"
+                )
+
+            for numero, descripcion, migracion in MIGRACIONES:
+                if numero <= version:
+                    continue
+                if getattr(migracion, "sin_transaccion", False):
+                    conn.autocommit = True
+                    try:
+                        migracion(c)
+                    finally:
+                        conn.autocommit = False
+                else:
+                    migracion(c)
+                c.execute(
+                    "INSERT INTO schema_version (version, descripcion) VALUES (%s, %s)",
+                    (numero, descripcion),
+                )
+                conn.commit()
+                aplicadas += 1
+                if on_aplicada:
+                    on_aplicada(numero, descripcion)
+        finally:
+            conn.rollback()
+            c.execute("SELECT pg_advisory_unlock(%s)", (LOCK_MIGRACIONES,))
+            conn.commit()
+    return aplicadas
+
+
+def mantenimiento(meses: int = 3) -> int:
+    """Crea por adelantado las particiones mensuales de asistencias. Retorna cuántas creó."""
+    with database.conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT crear_particiones_asistencias(%s) AS creadas", (meses,))
+        creadas = c.fetchone()["creadas"]
+        conn.commit()
+    return creadas
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de asistencia")
+    parser.add_argument("accion", choices=["estado", "aplicar", "mantenimiento"])
+    parser.add_argument("--meses", type=int, default=3, help="meses de particiones a crear por adelantado")
+    args = parser.parse_args()
+
+    if args.accion == "estado":
+        version = version_actual()
+        print(f"Versión aplicada: {version if version is not None else 'sin versionar'}")
+        print(f"Versión requerida: {VERSION_ESQUEMA}")
+    else:
+        aplicadas = []
+
+        def on_aplicada(numero, descripcion):
+            aplicadas.append(numero)
+            print(f"  ✅ {numero:03d} {descripcion}")
+
+        try:
+            total = aplicar(on_aplicada=on_aplicada)
+        except ConversionEnCurso as e:
+            print(f"❌ {e}")
+            raise SystemExit(1)
+        print(f"Migraciones aplicadas: {total} (versión {VERSION_ESQUEMA})")
+        if 9 in aplicadas:
+            print("⚠️ Falta llenar resumen_diario con la historia: python app/resumen_diario.py reconstruir")
+
+    if args.accion in ("aplicar", "mantenimiento"):
+        print(f"Particiones nuevas de asistencias: {mantenimiento(args.meses)}")
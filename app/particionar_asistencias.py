@@ -0,0 +1,370 @@
+# particionar_asistencias.py
+# Conversión en línea de asistencias a una tabla particionada por mes (RANGE sobre fecha)
+#
+# Pasos:
+#   1. preparar: crea asistencias_part (misma estructura, particionada), sus
+#      particiones mensuales, una por defecto y los índices; un trigger en la
+#      tabla actual replica cada INSERT/UPDATE/DELETE hacia la nueva.
+#   2. copiar: copia las filas existentes por lotes de id, cada lote en su propia
+#      transacción; guarda el progreso y se puede interrumpir y reanudar.
+#   3. intercambiar: compara los conteos sin bloquear y, con un lock breve
+#      (lock_timeout), renombra las tablas (la vieja queda como
+#      asistencias_heap para volver atrás) y recrea la vista y los triggers.
+#   4. archivar: desprende las particiones de meses viejos; quedan como tablas
+#      sueltas que se pueden respaldar y borrar sin DELETE masivos. Usa DETACH
+#      normal con lock_timeout y reintentos (CONCURRENTLY no se admite con
+#      partición por defecto).
+#
+# Las particiones futuras las crea `python app/migraciones.py mantenimiento`
+# (también se ejecuta en cada `aplicar`). No correr a la vez que
+# migracion_asistencias.py contraer: ambas cambian las columnas de asistencias.
+#
+# Uso:
+#   python app/particionar_asistencias.py estado
+#   python app/particionar_asistencias.py preparar
+#   python app/particionar_asistencias.py copiar [--lote 10000]
+#   python app/particionar_asistencias.py intercambiar
+#   python app/particionar_asistencias.py archivar --antes-de 2024-01
+
+import argparse
+import time
+from datetime import date, datetime
+
+import psycopg2.errors
+
+import database
+import migraciones
+from migracion_asistencias import _asegurar_tabla_progreso
+
+NOMBRE_COPIA = "asistencias_particionada"
+
+# Espera máxima por el lock exclusivo de intercambiar y de cada DETACH de
+# archivar (las marcaciones no quedan en fila detrás); intentos y pausa de archivar
+LOCK_TIMEOUT = "2s"
+ARCHIVAR_INTENTOS = 10
+ARCHIVAR_PAUSA = 5.0
+
+# Índices de la tabla particionada: (nombre definitivo, definición). Se crean con
+# sufijo _part y se renombran en el intercambio.
+INDICES = [
+    ("idx_asistencias_empleado_fecha", "(empleado_id, fecha)"),
+    ("idx_asistencias_fecha_hora",
+     "(fecha DESC, hora_llegada DESC, id DESC) "
+     "INCLUDE (empleado_id, hora_salida, turno_id, tarde, segundos_trabajados, turno_completado)"),
+    ("idx_asistencias_abiertas", "(empleado_id, fecha DESC) WHERE turno_completado = FALSE"),
+    ("idx_asistencias_cambio", "(cambio) WHERE cambio IS NOT NULL"),
+]
+
+def _columnas(c, tabla: str) -> str:
+    """Columnas de `tabla` en orden, ya entre comillas, para listas explícitas."""
+    c.execute("""
+        SELECT string_agg(quote_ident(column_name), ', ' ORDER BY ordinal_position) AS columnas
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+    """, (tabla,))
+    return c.fetchone()["columnas"]
+
+
+def _sql_replicar(columnas: str) -> str:
+    """
+    Trigger de réplica con la lista de columnas de asistencias_part: con SELECT NEW.*
+    una columna agregada solo a asistencias haría fallar cada escritura. Mientras
+    asistencias_part exista, migraciones.py no aplica migraciones.
+    """
+    valores = ", ".join(f"NEW.{columna}" for columna in columnas.split(", "))
+    return f"""
+CREATE OR REPLACE FUNCTION asistencias_replicar_particionada() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        DELETE FROM asistencias_part WHERE id = OLD.id AND fecha = OLD.fecha;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO asistencias_part ({columnas}) VALUES ({valores}) ON CONFLICT (id, fecha) DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_asistencias_replicar ON asistencias;
+CREATE TRIGGER trg_asistencias_replicar
+AFTER INSERT OR UPDATE OR DELETE ON asistencias
+FOR EACH ROW EXECUTE FUNCTION asistencias_replicar_particionada();
+"""
+
+
+def _particionada(c, tabla: str) -> bool:
+    c.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (tabla,))
+    row = c.fetchone()
+    return bool(row) and row["relkind"] == "p"
+
+
+def _meses(desde: date, hasta: date):
+    mes = desde.replace(day=1)
+    while mes <= hasta:
+        yield mes
+        mes = date(mes.year + (mes.month == 12), mes.month % 12 + 1, 1)
+
+
+def estado() -> dict:
+    with database.conexion() as conn:
+        c = conn.cursor()
+        resultado = {
+            "particionada": _particionada(c, "asistencias"),
+            "preparada": _particionada(c, "asistencias_part"),
+            "ultimo_id_copiado": None,
+        }
+        if resultado["preparada"]:
+            c.execute("SELECT ultimo_id FROM migracion_progreso WHERE nombre = %s", (NOMBRE_COPIA,))
+            row = c.fetchone()
+            resultado["ultimo_id_copiado"] = row["ultimo_id"] if row else 0
+        c.execute("""
+            SELECT c.relname AS particion, pg_get_expr(c.relpartbound, c.oid) AS rango
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass(%s)
+            ORDER BY c.relname
+        """, ("asistencias" if resultado["particionada"] else "asistencias_part",))
+        resultado["particiones"] = [dict(r) for r in c.fetchall()]
+        conn.rollback()
+    return resultado
+
+
+def preparar(meses_adelante: int = 3):
+    """Crea asistencias_part con sus particiones e índices y activa la réplica."""
+    with database.conexion() as conn:
+        c = conn.cursor()
+        if _particionada(c, "asistencias"):
+            return
+
+        if not _particionada(c, "asistencias_part"):
+            c.execute("""
+                CREATE TABLE asistencias_part (
+                    LIKE asistencias INCLUDING DEFAULTS INCLUDING CONSTRAINTS,
+                    PRIMARY KEY (id, fecha),
+                    FOREIGN KEY (empleado_id) REFERENCES empleados(id)
+                ) PARTITION BY RANGE (fecha)
+            """)
+            if not migraciones.tiene_columnas_legado(c):
+                c.execute("""
+                    ALTER TABLE asistencias_part
+                    ADD FOREIGN KEY (turno_id) REFERENCES turnos(id)
+                """)
+            for nombre, definicion in INDICES:
+                c.execute(f"CREATE INDEX {nombre}_part ON asistencias_part {definicion}")
+            c.execute("CREATE TABLE asistencias_default PARTITION OF asistencias_part DEFAULT")
+
+        c.execute("SELECT MIN(fecha) AS desde FROM asistencias")
+        desde = c.fetchone()["desde"] or date.today()
+        hoy = date.today()
+        hasta = date(hoy.year + (hoy.month + meses_adelante - 1) // 12,
+                     (hoy.month + meses_adelante - 1) % 12 + 1, 1)
+        for mes in _meses(desde, hasta):
+            c.execute("SELECT crear_particion_asistencias('asistencias_part', %s)", (mes,))
+
+        c.execute(_sql_replicar(_columnas(c, "asistencias_part")))
+        _asegurar_tabla_progreso(c)
+        c.execute("""
+            INSERT INTO migracion_progreso (nombre) VALUES (%s)
+            ON CONFLICT (nombre) DO NOTHING
+        """, (NOMBRE_COPIA,))
+        conn.commit()
+
+
+def copiar(lote: int = 10000, pausa: float = 0.0, on_progreso=None) -> int:
+    """
+    Copia a asistencias_part las filas existentes, por lotes de id. FOR SHARE evita
+    copiar una versión vieja de una fila que se está actualizando: la actualización
+    espera al lote y su trigger de réplica deja la versión nueva.
+    """
+    total = 0
+    with database.conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT ultimo_id FROM migracion_progreso WHERE nombre = %s", (NOMBRE_COPIA,))
+        ultimo_id = c.fetchone()["ultimo_id"]
+        columnas = _columnas(c, "asistencias_part")
+        conn.commit()
+
+        while True:
+            c.execute("""
+                SELECT MAX(id) AS hasta FROM (
+                    SELECT id FROM asistencias
+                    WHERE id > %s
+                    ORDER BY id
+                    LIMIT %s
+                ) lote
+            """, (ultimo_id, lote))
+            hasta = c.fetchone()["hasta"]
+            if hasta is None:
+                break
+
+            c.execute(f"""
+                INSERT INTO asistencias_part ({columnas})
+                SELECT {columnas} FROM asistencias
+                WHERE id > %s AND id <= %s
+                FOR SHARE
+                ON CONFLICT (id, fecha) DO NOTHING
+            """, (ultimo_id, hasta))
+            total += c.rowcount
+
+            c.execute("""
+                UPDATE migracion_progreso
+                SET ultimo_id = %s, actualizado = now()
+                WHERE nombre = %s
+            """, (hasta, NOMBRE_COPIA))
+            conn.commit()
+
+            ultimo_id = hasta
+            if on_progreso:
+                on_progreso(ultimo_id, total)
+            if pausa:
+                time.sleep(pausa)
+
+    return total
+
+
+def intercambiar() -> bool:
+    """
+    Cambia asistencias por la tabla particionada en una transacción corta.
+    Los conteos completos se comparan antes del lock, en un mismo snapshot (la
+    réplica escribe en las dos tablas dentro de la misma transacción, así que
+    deben coincidir). Con el lock exclusivo solo se verifica, por índice, que la
+    réplica siga activa y que el último id esté en ambas.
+    """
+    with database.conexion() as conn:
+        c = conn.cursor()
+        if _particionada(c, "asistencias"):
+            return True
+        conn.rollback()
+
+        c.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+        c.execute("""
+            SELECT (SELECT COUNT(*) FROM asistencias) AS origen,
+                   (SELECT COUNT(*) FROM asistencias_part) AS copia
+        """)
+        conteos = c.fetchone()
+        conn.rollback()
+        if conteos["origen"] != conteos["copia"]:
+            return False
+
+        c.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+        c.execute("LOCK TABLE asistencias IN ACCESS EXCLUSIVE MODE")
+        c.execute("""
+            SELECT EXISTS (SELECT 1 FROM pg_trigger
+                           WHERE tgname = 'trg_asistencias_replicar'
+                           AND tgrelid = to_regclass('asistencias')) AS replicando,
+                   (SELECT MAX(id) FROM asistencias) AS origen,
+                   (SELECT MAX(id) FROM asistencias_part) AS copia
+        """)
+        row = c.fetchone()
+        if not row["replicando"] or row["origen"] != row["copia"]:
+            conn.rollback()
+            return False
+
+        c.execute("DROP TRIGGER trg_asistencias_replicar ON asistencias")
+        c.execute("DROP FUNCTION asistencias_replicar_particionada()")
+
+        c.execute("ALTER TABLE asistencias RENAME TO asistencias_heap")
+        for nombre, _ in INDICES:
+            c.execute(f"ALTER INDEX IF EXISTS {nombre} RENAME TO {nombre}_heap")
+            c.execute(f"ALTER INDEX {nombre}_part RENAME TO {nombre}")
+        c.execute("ALTER TABLE asistencias_part RENAME TO asistencias")
+        c.execute("ALTER SEQUENCE asistencias_id_seq OWNED BY asistencias.id")
+
+        # La vista y los triggers seguían apuntando a la tabla vieja
+        if migraciones.tiene_columnas_legado(c):
+            c.execute("DROP TRIGGER IF EXISTS trg_asistencias_sincronizar_legado ON asistencias_heap")
+            c.execute(migraciones.SQL_SINCRONIZAR_LEGADO)
+            c.execute(migraciones.SQL_VISTA_LEGADO)
+        else:
+            c.execute(migraciones.SQL_VISTA_COMPACTA)
+        c.execute("DROP TRIGGER IF EXISTS trg_asistencias_resumen ON asistencias_heap")
+        c.execute(migraciones.SQL_TRIGGER_RESUMEN)
+        c.execute("DROP TRIGGER IF EXISTS trg_asistencias_notificar ON asistencias_heap")
+        c.execute(migraciones.SQL_TRIGGER_NOTIFICAR)
+        c.execute("DROP TRIGGER IF EXISTS trg_asistencias_cambio ON asistencias_heap")
+        c.execute(migraciones.SQL_TRIGGER_CAMBIO)
+
+        c.execute("DELETE FROM migracion_progreso WHERE nombre = %s", (NOMBRE_COPIA,))
+        conn.commit()
+    return True
+
+
+def archivar(antes_de: date, intentos: int = ARCHIVAR_INTENTOS) -> list:
+    """
+    Desprende de asistencias las particiones de meses anteriores a `antes_de`;
+    las tablas quedan sueltas para respaldarlas (pg_dump -t) y borrarlas con
+    DROP TABLE.
+
+    DETACH ... CONCURRENTLY no se puede usar: Postgres lo rechaza cuando la tabla
+    tiene partición por defecto, y preparar() siempre crea asistencias_default.
+    Cada partición se desprende con un DETACH normal en su propia transacción:
+    solo cambia el catálogo, pero toma ACCESS EXCLUSIVE sobre asistencias. Con
+    lock_timeout, si hay consultas largas en curso se desiste enseguida (las
+    marcaciones no quedan en fila detrás del DETACH) y se reintenta más tarde.
+    """
+    with database.conexion() as conn:
+        c = conn.cursor()
+        c.execute("""
+            SELECT c.relname AS particion
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = to_regclass('asistencias')
+            AND c.relname ~ '^asistencias_[0-9]{4}_[0-9]{2}$'
+            AND c.relname < %s
+            ORDER BY c.relname
+        """, ("asistencias_" + antes_de.strftime("%Y_%m"),))
+        particiones = [row["particion"] for row in c.fetchall()]
+        conn.rollback()
+
+        desprendidas = []
+        for particion in particiones:
+            for intento in range(1, intentos + 1):
+                try:
+                    c.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+                    c.execute(f"ALTER TABLE asistencias DETACH PARTITION {particion}")
+                    conn.commit()
+                    desprendidas.append(particion)
+                    break
+                except psycopg2.errors.LockNotAvailable:
+                    conn.rollback()
+                    if intento == intentos:
+                        raise
+                    time.sleep(ARCHIVAR_PAUSA)
+    return desprendidas
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Particionado mensual de asistencias")
+    parser.add_argument("accion", choices=["estado", "preparar", "copiar", "intercambiar", "archivar"])
+    parser.add_argument("--lote", type=int, default=10000, help="filas por transacción al copiar")
+    parser.add_argument("--pausa", type=float, default=0.0, help="segundos de espera entre lotes")
+    parser.add_argument("--antes-de", help="archivar meses anteriores a YYYY-MM")
+    args = parser.parse_args()
+
+    if args.accion == "estado":
+        print(estado())
+    elif args.accion == "preparar":
+        preparar()
+        print("✅ asistencias_part creada; la réplica de escrituras está activa")
+    elif args.accion == "copiar":
+        filas = copiar(
+            lote=args.lote,
+            pausa=args.pausa,
+            on_progreso=lambda ultimo, total: print(f"  hasta id {ultimo}: {total} filas copiadas"),
+        )
+        print(f"✅ Copia terminada: {filas} filas")
+    elif args.accion == "intercambiar":
+        try:
+            listo = intercambiar()
+        except psycopg2.errors.LockNotAvailable:
+            print(f"❌ asistencias estuvo ocupada más de {LOCK_TIMEOUT}; intente de nuevo")
+        else:
+            if listo:
+                print("✅ asistencias ahora está particionada (la tabla anterior quedó como asistencias_heap)")
+            else:
+                print("❌ La copia no está completa o la réplica no está activa; ejecute de nuevo: preparar y copiar")
+    else:
+        if not args.antes_de:
+            parser.error("archivar requiere --antes-de YYYY-MM")
+        mes = datetime.strptime(args.antes_de, "%Y-%m").date()
+        for particion in archivar(mes):
+            print(f"  📦 {particion} desprendida")
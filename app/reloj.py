@@ -0,0 +1,61 @@
+# reloj.py
+# Reloj compartido: un solo hilo por proceso avisa cada segundo a las vistas suscritas
+#
+# Antes cada MarcacionView arrancaba su propio hilo que nunca terminaba. Ahora las
+# vistas se suscriben con suscribir() y se dan de baja con cancelar() (o solas,
+# al liberarse: se guardan con referencia débil). El hilo se detiene cuando no
+# queda nadie suscrito y vuelve a arrancar con la siguiente suscripción.
+
+import threading
+import time
+import weakref
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+ZONA = ZoneInfo("America/Bogota")
+
+_lock = threading.Lock()
+_suscriptores = []
+_hilo = None
+
+
+def ahora() -> datetime:
+    return datetime.now(ZONA)
+
+
+def suscribir(callback):
+    """callback(ahora) en cada segundo, desde el hilo del reloj."""
+    global _hilo
+    ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+    with _lock:
+        _suscriptores.append(ref)
+        if _hilo is None or not _hilo.is_alive():
+            _hilo = threading.Thread(target=_latir, name="reloj", daemon=True)
+            _hilo.start()
+
+
+def cancelar(callback):
+    with _lock:
+        _suscriptores[:] = [ref for ref in _suscriptores if ref() not in (None, callback)]
+
+
+def _latir():
+    global _hilo
+    while True:
+        # Dormir hasta el próximo segundo exacto para que el reloj no se atrase
+        time.sleep(1 - (time.time() % 1))
+        with _lock:
+            _suscriptores[:] = [ref for ref in _suscriptores if ref()]
+            callbacks = [ref() for ref in _suscriptores]
+            if not callbacks:
+                _hilo = None
+                return
+        momento = ahora()
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(momento)
+            except Exception:
+                # Sesión cerrada o vista desmontada: se da de baja
+                cancelar(callback)
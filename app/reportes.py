@@ -1,14 +1,31 @@
 # reportes.py
 import flet as ft
 import database
-from exportar import exportar_excel, exportar_pdf
+from actualizaciones import actualizar, agrupar, lote
+from busqueda import BusquedaIncremental, contiene
+from tabla_paginada import TablaPaginada
+import descargas
+import exportar
+import trabajos
 from datetime import datetime, timedelta
-import base64
+
+# Filas por página en la tabla de resultados
+TAMANO_PAGINA = 50
 
 class ReportesView:
     def __init__(self, page, on_lock_callback=None):
         self.page = page
         self.on_lock = on_lock_callback
+        self.filtros = {}  # filtros con los que se cargó la tabla (los usa la paginación)
+        self.exportaciones = []  # exportaciones pedidas en esta sesión (trabajos.Trabajo)
+        self.descargar_al_terminar = set()
+        self.busqueda = BusquedaIncremental(
+            page,
+            buscar=self.buscar_texto,
+            coincide=lambda r, texto: contiene(texto, r["nombre"], r["cedula"]),
+            mostrar=self.mostrar_busqueda,
+            clave=self.filtros_sin_texto,
+        )
 
         self.build_ui()
 
@@ -47,7 +64,8 @@ class ReportesView:
             border_radius=10, 
             prefix_icon=ft.Icons.SEARCH, 
             label_style=ft.TextStyle(color="black"), 
-            color="black"
+            color="black",
+            on_change=self.busqueda.tecla,
         )
         self.f_tarde = ft.Checkbox(
             label="Solo llegadas tarde", 
@@ -88,6 +106,23 @@ class ReportesView:
             height=45, 
             on_click=lambda e: self.exportar_archivo("pdf")
         )
+        # CSV: lo genera la BD y va directo al navegador, sin pasar por la cola
+        self.btn_export_csv = ft.ElevatedButton(
+            "Exportar CSV", 
+            icon=ft.Icons.DESCRIPTION, 
+            bgcolor="#455A64", 
+            color="white", 
+            height=45, 
+            on_click=self.exportar_csv
+        )
+        self.f_gzip = ft.Checkbox(
+            label="Comprimir CSV (gzip)", 
+            value=False, 
+            label_style=ft.TextStyle(color="black")
+        )
+
+        # Exportaciones pedidas en esta sesión, con su avance
+        self.lista_trabajos = ft.Column(spacing=6)
 
         # Filtros rápidos
         self.btn_hoy = ft.TextButton(
@@ -109,9 +144,10 @@ class ReportesView:
             style=ft.ButtonStyle(color="black")
         )
 
-        # Tabla
-        self.table = ft.DataTable(
-            columns=[
+        # Tabla paginada: solo se construyen las filas de la página visible
+        self.tabla = TablaPaginada(
+            self.page,
+            columnas=[
                 ft.DataColumn(ft.Text("Nombre", weight=ft.FontWeight.BOLD, color="black")),
                 ft.DataColumn(ft.Text("Cédula", weight=ft.FontWeight.BOLD, color="black")),
                 ft.DataColumn(ft.Text("Fecha", weight=ft.FontWeight.BOLD, color="black")),
@@ -121,7 +157,13 @@ class ReportesView:
                 ft.DataColumn(ft.Text("Horas", weight=ft.FontWeight.BOLD, color="black")),
                 ft.DataColumn(ft.Text("Tarde", weight=ft.FontWeight.BOLD, color="black")),
             ],
-            rows=[],
+            obtener_pagina=lambda limite, despues_de: database.consultar_asistencias(
+                **self.filtros, limite=limite, despues_de=despues_de
+            ),
+            cursor=database.cursor_asistencia,
+            construir_fila=self.fila_asistencia,
+            contar=lambda: database.contar_asistencias(**self.filtros),
+            tamano_pagina=TAMANO_PAGINA,
             border=ft.border.all(1, "#000000"),
             border_radius=10,
             horizontal_lines=ft.border.BorderSide(1, "#000000"),
@@ -173,10 +215,14 @@ class ReportesView:
                                         self.btn_filtrar, 
                                         self.btn_limpiar, 
                                         self.btn_export_excel, 
-                                        self.btn_export_pdf
+                                        self.btn_export_pdf,
+                                        self.btn_export_csv,
+                                        self.f_gzip
                                     ], 
-                                    spacing=15
+                                    spacing=15,
+                                    wrap=True
                                 ),
+                                self.lista_trabajos,
                             ],
                             spacing=15,
                         ),
@@ -189,8 +235,14 @@ class ReportesView:
                         shadow=ft.BoxShadow(spread_radius=2, blur_radius=10, color="#00000019"), 
                         content=ft.Column(
                             [
-                                ft.Text("Resultados", size=18, weight=ft.FontWeight.BOLD, color="black"), 
-                                self.table
+                                ft.Row(
+                                    [
+                                        ft.Text("Resultados", size=18, weight=ft.FontWeight.BOLD, color="black"),
+                                        self.tabla.paginacion,
+                                    ],
+                                    alignment=ft.MainAxisAlignment.SPACE_BETWEEN,
+                                ),
+                                self.tabla.table
                             ], 
                             spacing=15
                         )
@@ -203,12 +255,14 @@ class ReportesView:
 
         self.cargar_tabla()
 
+    @agrupar
     def filtrar_hoy(self, e):
         hoy = datetime.now().strftime("%Y-%m-%d")
         self.f_inicio.value = hoy
         self.f_fin.value = hoy
         self.cargar_tabla()
 
+    @agrupar
     def filtrar_semana(self, e):
         hoy = datetime.now()
         hace_semana = hoy - timedelta(days=7)
@@ -216,6 +270,7 @@ class ReportesView:
         self.f_fin.value = hoy.strftime("%Y-%m-%d")
         self.cargar_tabla()
 
+    @agrupar
     def filtrar_mes(self, e):
         hoy = datetime.now()
         hace_mes = hoy - timedelta(days=30)
@@ -223,53 +278,74 @@ class ReportesView:
         self.f_fin.value = hoy.strftime("%Y-%m-%d")
         self.cargar_tabla()
 
+    def filtros_actuales(self):
+        """Filtros del formulario, tal como los recibe database.consultar_asistencias."""
+        return {
+            "f_inicio": self.f_inicio.value.strip() if self.f_inicio.value else None,
+            "f_fin": self.f_fin.value.strip() if self.f_fin.value else None,
+            "filtro_texto": self.f_texto.value.strip() if self.f_texto.value else None,
+            "solo_tarde": bool(self.f_tarde.value),
+        }
+
+    def filtros_sin_texto(self):
+        """Filtros que no son el texto; si cambian, la búsqueda no se acota en memoria."""
+        filtros = self.filtros_actuales()
+        return (filtros["f_inicio"], filtros["f_fin"], filtros["solo_tarde"])
+
+    @agrupar
     def cargar_tabla(self, e=None):
-        f_inicio = self.f_inicio.value.strip() if self.f_inicio.value else None
-        f_fin = self.f_fin.value.strip() if self.f_fin.value else None
-        filas = database.consultar_asistencias(f_inicio=f_inicio, f_fin=f_fin)
-        texto = self.f_texto.value.strip().lower() if self.f_texto.value else ""
-        
-        if texto:
-            filas = [f for f in filas if texto in f["nombre"].lower() or texto in f["cedula"].lower()]
-        
-        if self.f_tarde.value:
-            filas = [f for f in filas if f["llego_tarde"] == "SI"]
-
-        rows = []
-        for r in filas:
-            turno = r["turno"]
-            turno_color = "#FFA726" if "DIA" in turno.upper() or "DÍA" in turno.upper() else "#5C6BC0"
-            turno_icon = "🌞" if turno_color == "#FFA726" else "🌙"
-            tarde_color = "#C62828" if r["llego_tarde"] == "SI" else "#2E7D32"
-            
-            rows.append(ft.DataRow(cells=[
-                ft.DataCell(ft.Text(r["nombre"], color="black")),
-                ft.DataCell(ft.Text(r["cedula"], color="black")),
-                ft.DataCell(ft.Text(str(r["fecha"]), color="black")),
-                ft.DataCell(
-                    ft.Container(
-                        bgcolor=turno_color, 
-                        padding=5, 
-                        border_radius=5, 
-                        content=ft.Text(f"{turno_icon} {turno}", color="white")
-                    )
-                ),
-                ft.DataCell(ft.Text(str(r["hora_llegada"]) if r["hora_llegada"] else "-", color="black")),
-                ft.DataCell(ft.Text(str(r["hora_salida"]) if r["hora_salida"] else "-", color="black")),
-                ft.DataCell(ft.Text(r["horas_trabajadas"] if r["horas_trabajadas"] else "-", color="black")),
-                ft.DataCell(
-                    ft.Container(
-                        bgcolor=tarde_color, 
-                        padding=5, 
-                        border_radius=5, 
-                        content=ft.Text(r["llego_tarde"], color="white")
-                    )
-                ),
-            ]))
+        """Aplica los filtros en SQL y vuelve a la primera página."""
+        self.busqueda.reiniciar()
+        self.filtros = self.filtros_actuales()
+        self.tabla.cargar()
+
+    # ---------- Búsqueda mientras se escribe ----------
+    def buscar_texto(self, texto, cancelacion):
+        """Primera página para `texto` (en segundo plano); el total solo si hay más de una."""
+        filtros = {**self.filtros_actuales(), "filtro_texto": texto or None}
+        filas = database.consultar_asistencias(
+            **filtros, limite=TAMANO_PAGINA + 1, cancelacion=cancelacion
+        )
+        if len(filas) <= TAMANO_PAGINA:
+            return filas, len(filas)
+        return filas, database.contar_asistencias(**filtros, cancelacion=cancelacion)
+
+    def mostrar_busqueda(self, texto, filas, total):
+        self.filtros = {**self.filtros_actuales(), "filtro_texto": texto or None}
+        self.tabla.mostrar_primera(filas, total)
+
+    def fila_asistencia(self, r):
+        turno = r["turno"]
+        turno_color = "#FFA726" if "DIA" in turno.upper() or "DÍA" in turno.upper() else "#5C6BC0"
+        turno_icon = "🌞" if turno_color == "#FFA726" else "🌙"
+        tarde_color = "#C62828" if r["llego_tarde"] == "SI" else "#2E7D32"
         
-        self.table.rows = rows
-        self.page.update()
+        return ft.DataRow(cells=[
+            ft.DataCell(ft.Text(r["nombre"], color="black")),
+            ft.DataCell(ft.Text(r["cedula"], color="black")),
+            ft.DataCell(ft.Text(str(r["fecha"]), color="black")),
+            ft.DataCell(
+                ft.Container(
+                    bgcolor=turno_color, 
+                    padding=5, 
+                    border_radius=5, 
+                    content=ft.Text(f"{turno_icon} {turno}", color="white")
+                )
+            ),
+            ft.DataCell(ft.Text(str(r["hora_llegada"]) if r["hora_llegada"] else "-", color="black")),
+            ft.DataCell(ft.Text(str(r["hora_salida"]) if r["hora_salida"] else "-", color="black")),
+            ft.DataCell(ft.Text(r["horas_trabajadas"] if r["horas_trabajadas"] else "-", color="black")),
+            ft.DataCell(
+                ft.Container(
+                    bgcolor=tarde_color, 
+                    padding=5, 
+                    border_radius=5, 
+                    content=ft.Text(r["llego_tarde"], color="white")
+                )
+            ),
+        ])
 
+    @agrupar
     def limpiar_filtros(self, e):
         self.f_inicio.value = ""
         self.f_fin.value = ""
@@ -277,90 +353,150 @@ class ReportesView:
         self.f_tarde.value = False
         self.cargar_tabla()
 
+    @agrupar
     def exportar_archivo(self, tipo):
+        """Pide el archivo a la cola de exportaciones; se descarga solo al terminar."""
         try:
-            print(f"[DEBUG] Iniciando exportación de {tipo}...")
-            
-            f_inicio = self.f_inicio.value.strip() if self.f_inicio.value else None
-            f_fin = self.f_fin.value.strip() if self.f_fin.value else None
-
-            filas = database.consultar_asistencias(f_inicio=f_inicio, f_fin=f_fin)
-            texto = self.f_texto.value.strip().lower() if self.f_texto.value else ""
-            
-            if texto:
-                filas = [f for f in filas if texto in f["nombre"].lower() or texto in f["cedula"].lower()]
-            
-            if self.f_tarde.value:
-                filas = [f for f in filas if f["llego_tarde"] == "SI"]
-
-            print(f"[DEBUG] Filas encontradas: {len(filas)}")
-
-            if not filas:
+            filtros = self.filtros_actuales()
+            total = database.contar_asistencias(**filtros)
+            if not total:
                 self.mostrar_snackbar("⚠️ No hay datos para exportar", "#C62828")
                 return
 
-            # Generar archivo en memoria
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            if tipo == "excel":
-                datos = [
-                    {
-                        "Nombre": r["nombre"], 
-                        "Cédula": r["cedula"], 
-                        "Fecha": str(r["fecha"]), 
-                        "Turno": r["turno"],
-                        "Llegada": str(r["hora_llegada"]) if r["hora_llegada"] else "-", 
-                        "Salida": str(r["hora_salida"]) if r["hora_salida"] else "-",
-                        "Horas": r["horas_trabajadas"] if r["horas_trabajadas"] else "-", 
-                        "Tarde": r["llego_tarde"]
-                    } for r in filas
-                ]
-                archivo_bytes = exportar_excel(datos)
-                mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                extension = "xlsx"
-            else:  # PDF
-                datos = [
-                    [
-                        r["nombre"], 
-                        r["cedula"], 
-                        str(r["fecha"]), 
-                        r["turno"],
-                        str(r["hora_llegada"]) if r["hora_llegada"] else "-", 
-                        str(r["hora_salida"]) if r["hora_salida"] else "-",
-                        r["horas_trabajadas"] if r["horas_trabajadas"] else "-", 
-                        r["llego_tarde"]
-                    ] for r in filas
-                ]
-                archivo_bytes = exportar_pdf(datos)
-                mime_type = "application/pdf"
-                extension = "pdf"
-
-            print(f"[DEBUG] Archivo generado, tamaño: {len(archivo_bytes)} bytes")
-
-            # Convertir a base64
-            b64 = base64.b64encode(archivo_bytes).decode()
-            
-            # Crear nombre de archivo
-            filename = f"asistencias_{timestamp}.{extension}"
-            
-            # Crear data URL
-            data_url = f"data:{mime_type};base64,{b64}"
-            
-            print(f"[DEBUG] Lanzando descarga: {filename}")
-            
-            # Usar launch_url para descargar
-            self.page.launch_url(data_url)
-            
-            self.mostrar_snackbar(f"✅ Descargando {filename}...", "#2E7D32")
-            print("[DEBUG] Descarga iniciada correctamente")
-            
+            trabajo = trabajos.solicitar(tipo, filtros, self.page.session_id, self.trabajo_cambio, total)
+            print(f"[DEBUG] Exportación {trabajo.id} ({tipo}): {trabajo.estado}")
+            if trabajo not in self.exportaciones:
+                self.exportaciones.insert(0, trabajo)
+            self.descargar_al_terminar.add(trabajo.id)
+            if trabajo.activo:
+                self.mostrar_snackbar(f"⏳ Generando {tipo.upper()} en segundo plano...", "#1976D2")
+            # Si ya estaba listo (otro supervisor pidió lo mismo hace poco) o terminó
+            # antes de quedar en la lista, se descarga aquí
+            self.trabajo_cambio(trabajo)
+
         except Exception as e:
             self.mostrar_snackbar(f"❌ Error: {str(e)}", "#C62828")
             print(f"[ERROR] Error en exportación: {e}")
             import traceback
             traceback.print_exc()
 
+    @agrupar
+    def exportar_csv(self, e):
+        """CSV por COPY de la BD, enviado al navegador a medida que se genera."""
+        try:
+            filtros = self.filtros_actuales()
+            if not database.contar_asistencias(**filtros):
+                self.mostrar_snackbar("⚠️ No hay datos para exportar", "#C62828")
+                return
+
+            comprimir = bool(self.f_gzip.value)
+            nombre = f"asistencias_{datetime.now():%Y%m%d_%H%M%S}.csv" + (".gz" if comprimir else "")
+            mime = "application/gzip" if comprimir else "text/csv; charset=utf-8"
+            token = descargas.registrar_flujo(
+                lambda escribir: exportar.exportar_csv(escribir, filtros, comprimir), nombre, mime
+            )
+            print(f"[DEBUG] Lanzando descarga: {nombre}")
+            self.page.launch_url(descargas.url(token))
+            self.mostrar_snackbar(f"✅ Descargando {nombre}...", "#2E7D32")
+
+        except Exception as e:
+            self.mostrar_snackbar(f"❌ Error: {str(e)}", "#C62828")
+            print(f"[ERROR] Error en exportación: {e}")
+
+    # ---------- Exportaciones en segundo plano ----------
+    def mostrar_trabajos(self):
+        self.lista_trabajos.controls = [self.fila_trabajo(t) for t in self.exportaciones]
+        actualizar(self.page, self.lista_trabajos)
+
+    def fila_trabajo(self, t):
+        if t.estado == trabajos.GENERANDO:
+            detalle = f"{t.filas:,} de {t.total:,} filas" if t.total else f"{t.filas:,} filas"
+            if t.paginas:
+                detalle += f", {t.paginas} páginas"
+        elif t.estado == trabajos.LISTO:
+            detalle = f"listo, {t.filas:,} filas"
+        elif t.estado == trabajos.ERROR:
+            detalle = f"error: {t.error}"
+        else:
+            detalle = t.estado
+
+        if t.activo:
+            progreso = min(t.filas / t.total, 1) if t.total and t.estado == trabajos.GENERANDO else None
+            acciones = [
+                ft.ProgressBar(value=progreso, width=200, color="#1976D2"),
+                ft.IconButton(icon=ft.Icons.CANCEL, tooltip="Cancelar", icon_color="#C62828",
+                              data=t, on_click=self.cancelar_trabajo),
+            ]
+        else:
+            acciones = [
+                ft.IconButton(icon=ft.Icons.CLOSE, tooltip="Quitar de la lista", icon_color="black",
+                              data=t, on_click=self.quitar_trabajo),
+            ]
+            if t.estado == trabajos.LISTO:
+                acciones.insert(0, ft.IconButton(icon=ft.Icons.DOWNLOAD, tooltip="Descargar",
+                                                 icon_color="#2E7D32", data=t, on_click=self.click_descargar))
+
+        icono = ft.Icons.PICTURE_AS_PDF if t.tipo == "pdf" else ft.Icons.TABLE_CHART
+        return ft.Row(
+            [
+                ft.Icon(icono, color="#C62828" if t.tipo == "pdf" else "#2E7D32"),
+                ft.Text(t.descripcion(), color="black", weight=ft.FontWeight.BOLD),
+                ft.Text(detalle, color="black"),
+                *acciones,
+            ],
+            spacing=10,
+            vertical_alignment=ft.CrossAxisAlignment.CENTER,
+        )
+
+    def trabajo_cambio(self, trabajo):
+        """Avance o fin de un trabajo (desde el hilo de exportaciones)."""
+        if trabajo not in self.exportaciones:
+            return
+        with lote(self.page):
+            if trabajo.estado == trabajos.LISTO and self.quitar_pendiente(trabajo):
+                self.descargar(trabajo)
+            elif trabajo.estado == trabajos.ERROR:
+                self.mostrar_snackbar(f"❌ Error: {trabajo.error}", "#C62828")
+            self.mostrar_trabajos()
+
+    def quitar_pendiente(self, trabajo) -> bool:
+        """True solo para el primer hilo que lo quita (la descarga se lanza una vez)."""
+        try:
+            self.descargar_al_terminar.remove(trabajo.id)
+            return True
+        except KeyError:
+            return False
+
+    @agrupar
+    def cancelar_trabajo(self, e):
+        trabajo = e.control.data
+        trabajos.cancelar(trabajo, self.page.session_id)
+        self.quitar_pendiente(trabajo)
+        if trabajo in self.exportaciones:
+            self.exportaciones.remove(trabajo)
+        self.mostrar_trabajos()
+
+    @agrupar
+    def quitar_trabajo(self, e):
+        if e.control.data in self.exportaciones:
+            self.exportaciones.remove(e.control.data)
+        self.mostrar_trabajos()
+
+    @agrupar
+    def click_descargar(self, e):
+        self.descargar(e.control.data)
+
+    def descargar(self, trabajo):
+        """Abre el archivo terminado por /descargas con un token de un solo uso."""
+        url = trabajos.url_descarga(trabajo)
+        if url is None:
+            self.mostrar_snackbar("⚠️ El archivo venció, vuelva a exportar", "#C62828")
+            return
+        print(f"[DEBUG] Lanzando descarga: {trabajo.nombre}")
+        self.page.launch_url(url)
+        self.mostrar_snackbar(f"✅ Descargando {trabajo.nombre}...", "#2E7D32")
+
     def mostrar_snackbar(self, msg, color):
         self.page.snack_bar = ft.SnackBar(ft.Text(msg, color="white"), bgcolor=color)
         self.page.snack_bar.open = True
-        self.page.update()
\ No newline at end of file
+        actualizar(self.page)
\ No newline at end of file
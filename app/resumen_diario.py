@@ -0,0 +1,117 @@
+# resumen_diario.py
+# Reconstrucción y verificación de la tabla resumen_diario (migración 009)
+#
+# El trigger de asistencias la mantiene al día; esto hace falta para llenar la
+# historia una vez aplicada la migración 009 (que no la calcula, para no frenar
+# las marcaciones durante el despliegue) y para recalcularla después (datos
+# importados a mano, filas viejas sin turno_id, etc.).
+# Reconstruye mes por mes, cada mes en su propia transacción, para que las
+# marcaciones solo esperen lo que tarda un mes.
+#
+# Uso:
+#   python app/resumen_diario.py reconstruir [--desde 2024-01] [--hasta 2024-12]
+#   python app/resumen_diario.py verificar [--desde 2024-01] [--hasta 2024-12]
+
+import argparse
+from datetime import date, datetime, timedelta
+
+import database
+
+SQL_DIFERENCIAS = """
+WITH calculado AS (
+    SELECT fecha, turno_id,
+           COUNT(*) FILTER (WHERE hora_llegada IS NOT NULL) AS llegadas,
+           COUNT(*) FILTER (WHERE tarde) AS tarde,
+           COUNT(*) FILTER (WHERE turno_completado) AS completos,
+           COALESCE(SUM(segundos_trabajados), 0) AS segundos_trabajados
+    FROM asistencias
+    WHERE fecha >= %(desde)s AND fecha <= %(hasta)s AND turno_id IS NOT NULL
+    GROUP BY fecha, turno_id
+),
+resumen AS (
+    SELECT fecha, turno_id, llegadas, tarde, completos, segundos_trabajados
+    FROM resumen_diario
+    WHERE fecha >= %(desde)s AND fecha <= %(hasta)s
+    AND (llegadas, tarde, completos, segundos_trabajados) <> (0, 0, 0, 0)
+)
+SELECT fecha, turno_id
+FROM calculado
+FULL JOIN resumen USING (fecha, turno_id)
+WHERE (calculado.llegadas, calculado.tarde, calculado.completos, calculado.segundos_trabajados)
+      IS DISTINCT FROM
+      (resumen.llegadas, resumen.tarde, resumen.completos, resumen.segundos_trabajados)
+ORDER BY 1, 2
+"""
+
+
+def _rango(desde: str = None, hasta: str = None):
+    """Primer día de `desde` y último día de `hasta` (YYYY-MM); por defecto toda la historia."""
+    with database.conexion() as conn:
+        c = conn.cursor()
+        c.execute("SELECT MIN(fecha) AS desde, MAX(fecha) AS hasta FROM asistencias")
+        limites = c.fetchone()
+        conn.rollback()
+
+    inicio = datetime.strptime(desde, "%Y-%m").date() if desde else limites["desde"]
+    fin = datetime.strptime(hasta, "%Y-%m").date() if hasta else limites["hasta"]
+    if inicio is None or fin is None:
+        return None, None
+    fin = date(fin.year + (fin.month == 12), fin.month % 12 + 1, 1) - timedelta(days=1)
+    return inicio.replace(day=1), fin
+
+
+def reconstruir(desde: str = None, hasta: str = None, on_progreso=None) -> int:
+    """Recalcula resumen_diario mes por mes. Retorna cuántas filas escribió."""
+    inicio, fin = _rango(desde, hasta)
+    total = 0
+    mes = inicio
+    while mes and mes <= fin:
+        siguiente = date(mes.year + (mes.month == 12), mes.month % 12 + 1, 1)
+        with database.conexion() as conn:
+            c = conn.cursor()
+            c.execute(
+                "SELECT resumen_diario_reconstruir(%s, %s) AS filas",
+                (mes, siguiente - timedelta(days=1)),
+            )
+            filas = c.fetchone()["filas"]
+            conn.commit()
+        total += filas
+        if on_progreso:
+            on_progreso(mes, filas)
+        mes = siguiente
+    return total
+
+
+def verificar(desde: str = None, hasta: str = None) -> list:
+    """Fechas y turnos donde resumen_diario no coincide con asistencias."""
+    inicio, fin = _rango(desde, hasta)
+    if inicio is None:
+        return []
+    with database.conexion() as conn:
+        c = conn.cursor()
+        c.execute(SQL_DIFERENCIAS, {"desde": inicio, "hasta": fin})
+        rows = c.fetchall()
+        conn.rollback()
+    return [dict(row) for row in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tabla resumen_diario")
+    parser.add_argument("accion", choices=["reconstruir", "verificar"])
+    parser.add_argument("--desde", help="primer mes, YYYY-MM")
+    parser.add_argument("--hasta", help="último mes, YYYY-MM")
+    args = parser.parse_args()
+
+    if args.accion == "reconstruir":
+        filas = reconstruir(
+            args.desde,
+            args.hasta,
+            on_progreso=lambda mes, filas: print(f"  {mes:%Y-%m}: {filas} filas"),
+        )
+        print(f"✅ resumen_diario reconstruido: {filas} filas")
+    else:
+        diferencias = verificar(args.desde, args.hasta)
+        for d in diferencias:
+            print(f"  ❌ {d['fecha']} turno {d['turno_id']}")
+        print("✅ resumen_diario coincide con asistencias" if not diferencias
+              else f"{len(diferencias)} diferencias; ejecute: reconstruir")
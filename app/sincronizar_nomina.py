@@ -0,0 +1,57 @@
+# sincronizar_nomina.py
+# Exportación incremental de asistencias para sistemas externos (nómina)
+#
+# Cada consumidor tiene su propia marca (tabla marcas_exportacion, migración 012):
+# `exportar` deja en un archivo solo las asistencias creadas o cambiadas desde su
+# última exportación que terminó bien, con las mismas columnas que el Excel/CSV de
+# reportes. La primera vez van todas. Si la exportación falla, la marca no se
+# mueve y la próxima vez salen de nuevo las mismas filas. Una fila cambiada
+# vuelve a salir entera: el consumidor reemplaza la que ya tenía (misma cédula,
+# fecha y llegada). Los borrados no se informan.
+#
+# Uso:
+#   python app/sincronizar_nomina.py exportar nomina --salida /srv/nomina/asistencias.csv
+#   python app/sincronizar_nomina.py exportar nomina --salida cambios.xlsx --formato excel
+#   python app/sincronizar_nomina.py estado
+#   python app/sincronizar_nomina.py reiniciar nomina     (la próxima exportación trae todo)
+
+import argparse
+import sys
+
+import database
+from exportar import exportar_incremental
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exportación incremental de asistencias")
+    parser.add_argument("accion", choices=["exportar", "estado", "reiniciar"])
+    parser.add_argument("consumidor", nargs="?", help="nombre del sistema que recibe los cambios")
+    parser.add_argument("--salida", help="archivo a generar (se reemplaza)")
+    parser.add_argument("--formato", choices=["csv", "excel"], help="por defecto, según la extensión de --salida")
+    args = parser.parse_args()
+
+    if args.accion == "estado":
+        marcas = database.marcas_exportacion()
+        for m in marcas:
+            print(f"  {m['consumidor']}: {m['filas']} filas el {m['actualizada']:%Y-%m-%d %H:%M:%S} (marca {m['marca']})")
+        if not marcas:
+            print("Ningún consumidor ha exportado todavía")
+        sys.exit(0)
+
+    if not args.consumidor:
+        parser.error("falta el consumidor")
+
+    if args.accion == "reiniciar":
+        if database.reiniciar_marca_exportacion(args.consumidor):
+            print(f"✅ Marca de {args.consumidor} reiniciada: la próxima exportación trae todas las filas")
+        else:
+            print(f"{args.consumidor} no tenía marca")
+    else:
+        if not args.salida:
+            parser.error("falta --salida")
+        formato = args.formato or ("excel" if args.salida.lower().endswith(".xlsx") else "csv")
+        try:
+            filas = exportar_incremental(args.consumidor, args.salida, formato)
+        except database.ExportacionEnCurso:
+            print(f"❌ Ya hay una exportación de {args.consumidor} en curso")
+            sys.exit(1)
+        print(f"✅ {filas} filas nuevas o cambiadas en {args.salida}")
@@ -0,0 +1,157 @@
+# tabla_paginada.py
+# DataTable paginada por cursor: solo construye las filas de la página visible
+#
+# La vista le pasa cómo traer una página (obtener_pagina(limite, despues_de)),
+# cómo sacar el cursor de una fila, cómo dibujarla (construir_fila) y,
+# opcionalmente, cómo contar el total. Mientras se mira una página, la
+# siguiente se trae en segundo plano, así que "siguiente" no espera a la BD.
+#
+#   tabla = TablaPaginada(page, columnas, obtener_pagina, cursor, construir_fila, contar)
+#   ... ft.Row([titulo, tabla.paginacion]) ... tabla.table ...
+#   tabla.cargar()          # primera página (al cambiar filtros)
+#   tabla.recargar()        # misma página (tras editar una fila)
+#   tabla.mostrar_primera(filas, total)   # primera página ya traída (búsqueda)
+
+import threading
+
+import flet as ft
+
+from actualizaciones import actualizar, agrupar
+
+TAMANO_PAGINA = 50
+
+
+class TablaPaginada:
+    def __init__(self, page, columnas, obtener_pagina, cursor, construir_fila,
+                 contar=None, tamano_pagina: int = TAMANO_PAGINA, color="black", **estilo_tabla):
+        self.page = page
+        self.obtener_pagina = obtener_pagina
+        self.cursor = cursor
+        self.construir_fila = construir_fila
+        self.contar = contar
+        self.tamano_pagina = tamano_pagina
+
+        self.cursores = [None]          # cursor de inicio de cada página visitada
+        self.cursor_siguiente = None
+        self.total = None
+        self.filas = []                 # filas (datos) de la página visible
+
+        # Página siguiente traída por adelantado: (generación, cursor, filas)
+        self._lock = threading.Lock()
+        self._generacion = 0
+        self._adelantada = None
+
+        self.table = ft.DataTable(columns=columnas, rows=[], **estilo_tabla)
+        self.texto_pagina = ft.Text("", color=color)
+        self.btn_anterior = ft.IconButton(
+            icon=ft.Icons.CHEVRON_LEFT,
+            tooltip="Página anterior",
+            icon_color=color,
+            on_click=self.pagina_anterior,
+            disabled=True,
+        )
+        self.btn_siguiente = ft.IconButton(
+            icon=ft.Icons.CHEVRON_RIGHT,
+            tooltip="Página siguiente",
+            icon_color=color,
+            on_click=self.pagina_siguiente,
+            disabled=True,
+        )
+        self.paginacion = ft.Row([self.btn_anterior, self.texto_pagina, self.btn_siguiente])
+
+    # ---------- Navegación ----------
+    @agrupar
+    def cargar(self, e=None):
+        """Vuelve a la primera página (filtros nuevos)."""
+        self._invalidar()
+        self.cursores = [None]
+        self.total = self.contar() if self.contar else None
+        self._mostrar(self._traer(None))
+
+    @agrupar
+    def recargar(self, e=None):
+        """Vuelve a traer la página actual (después de editar o borrar una fila)."""
+        self._invalidar()
+        self.total = self.contar() if self.contar else None
+        filas = self._traer(self.cursores[-1])
+        # Se borró la última fila de una página que no es la primera: volver una atrás
+        while not filas and len(self.cursores) > 1:
+            self.cursores.pop()
+            filas = self._traer(self.cursores[-1])
+        self._mostrar(filas)
+
+    @agrupar
+    def mostrar_primera(self, filas, total=None):
+        """Primera página ya traída por otro lado (búsqueda mientras se escribe)."""
+        self._invalidar()
+        self.cursores = [None]
+        self.total = total
+        self._mostrar(filas)
+
+    @agrupar
+    def pagina_siguiente(self, e=None):
+        if not self.cursor_siguiente:
+            return
+        cursor = self.cursor_siguiente
+        with self._lock:
+            adelantada = self._adelantada
+            self._adelantada = None
+        if adelantada and adelantada[0] == self._generacion and adelantada[1] == cursor:
+            filas = adelantada[2]
+        else:
+            filas = self._traer(cursor)
+        self.cursores.append(cursor)
+        self._mostrar(filas)
+
+    @agrupar
+    def pagina_anterior(self, e=None):
+        if len(self.cursores) > 1:
+            self.cursores.pop()
+            self._mostrar(self._traer(self.cursores[-1]))
+
+    # ---------- Internos ----------
+    def _traer(self, despues_de):
+        # Una fila de más solo para saber si hay página siguiente
+        return self.obtener_pagina(limite=self.tamano_pagina + 1, despues_de=despues_de)
+
+    def _invalidar(self):
+        with self._lock:
+            self._generacion += 1
+            self._adelantada = None
+
+    def _mostrar(self, filas):
+        hay_siguiente = len(filas) > self.tamano_pagina
+        self.filas = filas[:self.tamano_pagina]
+        self.cursor_siguiente = self.cursor(self.filas[-1]) if hay_siguiente else None
+
+        self.table.rows = [self.construir_fila(f) for f in self.filas]
+
+        desde = (len(self.cursores) - 1) * self.tamano_pagina
+        if not self.filas:
+            self.texto_pagina.value = "Sin resultados"
+        elif self.total is not None:
+            self.texto_pagina.value = f"{desde + 1}–{desde + len(self.filas)} de {self.total}"
+        else:
+            self.texto_pagina.value = f"{desde + 1}–{desde + len(self.filas)}"
+        self.btn_anterior.disabled = len(self.cursores) <= 1
+        self.btn_siguiente.disabled = not hay_siguiente
+        actualizar(self.page)
+
+        if hay_siguiente:
+            self._adelantar(self.cursor_siguiente)
+
+    def _adelantar(self, cursor):
+        """Trae en segundo plano la página que empieza en `cursor` (solo datos)."""
+        generacion = self._generacion
+
+        def traer():
+            try:
+                filas = self._traer(cursor)
+            except Exception as e:
+                print(f"⚠️ No se pudo adelantar la página siguiente: {e}")
+                return
+            with self._lock:
+                if generacion == self._generacion:
+                    self._adelantada = (generacion, cursor, filas)
+
+        threading.Thread(target=traer, daemon=True).start()
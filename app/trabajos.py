@@ -0,0 +1,203 @@
+# trabajos.py
+# Cola de exportaciones en segundo plano (Excel y PDF)
+#
+# El botón de exportar ya no genera el archivo dentro del on_click: pide un
+# trabajo y la vista lo muestra en su lista con el avance (filas leídas, páginas
+# hechas), un botón para cancelar y otro para descargar cuando termina.
+#   - los trabajos corren en el pool de procesos de exportar.py (a lo sumo
+#     EXPORTAR_PROCESOS a la vez; el resto espera en cola)
+#   - dos pedidos iguales (mismo tipo y filtros) mientras uno está en curso
+#     comparten el trabajo; cancelar solo lo detiene cuando ya nadie lo espera
+#   - el archivo terminado se guarda EXPORTAR_CACHE_TTL segundos: otro
+#     supervisor que pida el mismo mes lo recibe al instante
+#
+#   trabajo = trabajos.solicitar("pdf", filtros, page.session_id, self.trabajo_cambio, total)
+#   trabajos.cancelar(trabajo, page.session_id)
+#   page.launch_url(trabajos.url_descarga(trabajo))
+
+import itertools
+import os
+import threading
+import time
+import weakref
+from datetime import datetime
+
+import descargas
+from exportar import ExportacionCancelada, cancelar_exportacion, exportar_en_proceso
+
+EXPORTAR_CACHE_TTL = float(os.getenv("EXPORTAR_CACHE_TTL", "300"))
+
+MIME = {
+    "excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "pdf": ("pdf", "application/pdf"),
+}
+
+EN_COLA, GENERANDO, LISTO, ERROR, CANCELADO = "en cola", "generando", "listo", "error", "cancelado"
+
+_lock = threading.Lock()
+_trabajos = {}   # clave -> Trabajo en curso o terminado (mientras dure en caché)
+_ids = itertools.count(1)
+
+
+class Trabajo:
+    def __init__(self, tipo: str, filtros: dict, clave: tuple, total: int = None):
+        self.id = next(_ids)
+        self.tipo = tipo
+        self.filtros = filtros
+        self.clave = clave
+        self.total = total
+        self.estado = EN_COLA
+        self.filas = 0
+        self.paginas = 0
+        self.error = None
+        self.terminado = None
+
+        extension, self.mime = MIME[tipo]
+        self.nombre = f"asistencias_{datetime.now():%Y%m%d_%H%M%S}.{extension}"
+        self.ruta = descargas.nueva_ruta(extension)
+        self.futuro = None
+
+        self._sesiones = set()      # sesiones que esperan el archivo
+        self._suscriptores = []     # callbacks(trabajo), con referencia débil
+
+    @property
+    def activo(self) -> bool:
+        return self.estado in (EN_COLA, GENERANDO)
+
+    def descripcion(self) -> str:
+        f = self.filtros
+        rango = f"{f.get('f_inicio') or '…'} a {f.get('f_fin') or '…'}"
+        extra = "".join([
+            f", «{f['filtro_texto']}»" if f.get("filtro_texto") else "",
+            ", solo tarde" if f.get("solo_tarde") else "",
+        ])
+        return f"{self.tipo.upper()} {rango}{extra}"
+
+    def _suscribir(self, sesion, callback):
+        self._sesiones.add(sesion)
+        ref = weakref.WeakMethod(callback) if hasattr(callback, "__self__") else (lambda: callback)
+        self._suscriptores.append(ref)
+
+    def _avisar(self):
+        with _lock:
+            self._suscriptores = [ref for ref in self._suscriptores if ref()]
+            callbacks = [ref() for ref in self._suscriptores]
+        for callback in callbacks:
+            if callback is None:
+                continue
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"⚠️ Error mostrando el trabajo {self.id}: {e}")
+
+
+def _clave(tipo: str, filtros: dict) -> tuple:
+    """Mismo tipo y mismos filtros (sin espacios ni mayúsculas en el texto) = mismo archivo."""
+    texto = (filtros.get("filtro_texto") or "").strip().lower()
+    return (
+        tipo,
+        (filtros.get("f_inicio") or "").strip(),
+        (filtros.get("f_fin") or "").strip(),
+        texto,
+        bool(filtros.get("solo_tarde")),
+    )
+
+
+def _purgar():
+    """Borra los archivos terminados que ya pasaron su tiempo en caché."""
+    ahora = time.monotonic()
+    with _lock:
+        vencidos = [
+            clave for clave, t in _trabajos.items()
+            if t.estado == LISTO and t.terminado + EXPORTAR_CACHE_TTL < ahora
+        ]
+        quitados = [_trabajos.pop(clave) for clave in vencidos]
+    for trabajo in quitados:
+        try:
+            os.remove(trabajo.ruta)
+        except OSError:
+            pass
+
+
+def solicitar(tipo: str, filtros: dict, sesion, on_cambio, total: int = None) -> Trabajo:
+    """
+    Trabajo para exportar `filtros` en `tipo` ('excel' o 'pdf'): uno nuevo, el que
+    ya está en curso con los mismos filtros, o el ya terminado si sigue en caché.
+    on_cambio(trabajo) se llama desde otro hilo en cada avance y al terminar.
+    """
+    _purgar()
+    clave = _clave(tipo, filtros)
+    with _lock:
+        trabajo = _trabajos.get(clave)
+        nuevo = trabajo is None
+        if nuevo:
+            trabajo = _trabajos[clave] = Trabajo(tipo, filtros, clave, total)
+            # Con el lock tomado: un cancelar() de otra sesión siempre encuentra el futuro
+            trabajo.futuro = exportar_en_proceso(
+                tipo, filtros, trabajo.ruta, on_progreso=lambda filas, paginas: _avance(trabajo, filas, paginas)
+            )
+        trabajo._suscribir(sesion, on_cambio)
+    if nuevo:
+        # Fuera del lock: si ya terminó, _fin corre aquí mismo y toma el lock
+        trabajo.futuro.add_done_callback(lambda futuro: _fin(trabajo, futuro))
+    return trabajo
+
+
+def _avance(trabajo: Trabajo, filas: int, paginas: int):
+    if not trabajo.activo:
+        return   # el aviso llegó por la cola después del resultado
+    trabajo.estado = GENERANDO
+    trabajo.filas = filas
+    trabajo.paginas = paginas
+    trabajo._avisar()
+
+
+def _fin(trabajo: Trabajo, futuro):
+    if futuro.cancelled():
+        trabajo.estado = CANCELADO
+    else:
+        error = futuro.exception()
+        if isinstance(error, ExportacionCancelada):
+            trabajo.estado = CANCELADO
+        elif error is not None:
+            trabajo.estado = ERROR
+            trabajo.error = str(error)
+            print(f"[ERROR] Exportación {trabajo.id} falló: {error}")
+        else:
+            trabajo.estado = LISTO
+            trabajo.filas = futuro.result()
+            trabajo.terminado = time.monotonic()
+
+    if trabajo.estado != LISTO:
+        # Sin archivo útil: que un pedido igual empiece de cero
+        with _lock:
+            if _trabajos.get(trabajo.clave) is trabajo:
+                del _trabajos[trabajo.clave]
+        try:
+            os.remove(trabajo.ruta)
+        except OSError:
+            pass
+    trabajo._avisar()
+
+
+def cancelar(trabajo: Trabajo, sesion):
+    """La sesión deja de esperar el trabajo; si era la última, se detiene."""
+    with _lock:
+        trabajo._sesiones.discard(sesion)
+        detener = trabajo.activo and not trabajo._sesiones
+        if detener and _trabajos.get(trabajo.clave) is trabajo:
+            del _trabajos[trabajo.clave]   # un pedido igual desde ya empieza de cero
+    if detener and trabajo.futuro is not None:
+        cancelar_exportacion(trabajo.futuro, trabajo.ruta)
+
+
+def url_descarga(trabajo: Trabajo):
+    """
+    URL de un solo uso para bajar el archivo terminado (el archivo sigue en caché);
+    None si ya venció y se borró.
+    """
+    if not os.path.exists(trabajo.ruta):
+        return None
+    token = descargas.registrar(trabajo.ruta, trabajo.nombre, trabajo.mime, borrar=False)
+    return descargas.url(token)
+
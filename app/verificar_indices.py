@@ -0,0 +1,181 @@
+# verificar_indices.py
+# Comprueba que el planificador usa los índices de las migraciones en las consultas reales
+#
+# Siembra empleados y asistencias de prueba dentro de una transacción, ejecuta
+# ANALYZE y revisa el EXPLAIN de cada consulta; al final hace ROLLBACK, así que
+# no queda nada escrito. Pensado para una base local con el esquema al día:
+#
+#   DATABASE_URL=postgresql://postgres@localhost/asistencia python app/verificar_indices.py
+
+import argparse
+import sys
+from datetime import date, timedelta
+from urllib.parse import urlparse
+
+import database
+
+HOSTS_LOCALES = {"localhost", "127.0.0.1", "::1", ""}
+
+
+def _sembrar(c, empleados: int, dias: int):
+    """Inserta `empleados` empleados con una asistencia diaria durante `dias` días."""
+    c.execute("""
+        INSERT INTO empleados (nombre, cedula, numero)
+        SELECT 'Verificación ' || g, 'verif-' || g, ''
+        FROM generate_series(1, %s) g
+    """, (empleados,))
+    c.execute("""
+        INSERT INTO asistencias (empleado_id, fecha, hora_llegada, hora_salida,
+                                 turno_id, tarde, segundos_trabajados, turno_completado)
+        SELECT e.id,
+               d::date,
+               time '09:00' + (random() * interval '20 minutes'),
+               time '16:00' + (random() * interval '10 minutes'),
+               1,
+               random() < 0.1,
+               25200,
+               TRUE
+        FROM empleados e
+        CROSS JOIN generate_series(%s::date, %s::date, interval '1 day') d
+        WHERE e.cedula LIKE 'verif-%%'
+    """, (date.today() - timedelta(days=dias), date.today() - timedelta(days=1)))
+    # Hoy: la mitad de los empleados con el turno todavía abierto
+    c.execute("""
+        INSERT INTO asistencias (empleado_id, fecha, hora_llegada, turno_id, tarde, turno_completado)
+        SELECT e.id, CURRENT_DATE, time '09:05', 1, FALSE, FALSE
+        FROM empleados e
+        WHERE e.cedula LIKE 'verif-%' AND e.id % 2 = 0
+    """)
+    c.execute("ANALYZE empleados")
+    c.execute("ANALYZE asistencias")
+    c.execute("SELECT MIN(id) AS id FROM empleados WHERE cedula LIKE 'verif-%'")
+    return c.fetchone()["id"]
+
+
+def _nodos(plan):
+    yield plan
+    for hijo in plan.get("Plans", []):
+        yield from _nodos(hijo)
+
+
+def _explicar(c, sql: str, params) -> list:
+    c.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+    row = c.fetchone()
+    plan = row["QUERY PLAN"] if "QUERY PLAN" in row else list(row.values())[0]
+    return list(_nodos(plan[0]["Plan"]))
+
+
+def _indices_raiz(c) -> dict:
+    """
+    Nombre de cada índice -> nombre del índice de la tabla padre. Con asistencias
+    particionada el EXPLAIN muestra los índices de cada partición, que cuelgan
+    (pg_inherits) de los de la migración.
+    """
+    c.execute("""
+        WITH RECURSIVE arbol AS (
+            SELECT i.oid, i.relname AS raiz
+            FROM pg_class i
+            WHERE i.relkind IN ('i', 'I')
+              AND NOT EXISTS (SELECT 1 FROM pg_inherits h WHERE h.inhrelid = i.oid)
+            UNION ALL
+            SELECT h.inhrelid, arbol.raiz
+            FROM pg_inherits h
+            JOIN arbol ON h.inhparent = arbol.oid
+        )
+        SELECT i.relname AS nombre, arbol.raiz
+        FROM arbol
+        JOIN pg_class i ON i.oid = arbol.oid
+    """)
+    return {row["nombre"]: row["raiz"] for row in c.fetchall()}
+
+
+def _verificar(c, nombre: str, sql: str, params, indice: str, sin_sort: bool = False) -> bool:
+    nodos = _explicar(c, sql, params)
+    raices = _indices_raiz(c)
+    usados = {raices.get(n["Index Name"], n["Index Name"]) for n in nodos if n.get("Index Name")}
+    tipos = [n["Node Type"] for n in nodos]
+
+    ok = indice in usados
+    if sin_sort and any(t in ("Sort", "Incremental Sort") for t in tipos):
+        ok = False
+
+    estado = "✅" if ok else "❌"
+    print(f"{estado} {nombre}: espera {indice}{' sin Sort' if sin_sort else ''}")
+    print(f"     nodos: {', '.join(tipos)}")
+    print(f"     índices: {', '.join(sorted(usados)) or 'ninguno'}")
+    return ok
+
+
+def verificar(empleados: int = 300, dias: int = 90) -> bool:
+    with database.conexion() as conn:
+        c = conn.cursor()
+        try:
+            empleado_id = _sembrar(c, empleados, dias)
+            hoy = date.today()
+            resultados = []
+
+            # Reportes: última semana, primera página (idx_asistencias_fecha_hora)
+            sql, params = database.sql_consultar_asistencias(
+                f_inicio=hoy - timedelta(days=7), f_fin=hoy, limite=51
+            )
+            resultados.append(_verificar(
+                c, "reporte por rango de fechas", sql, params,
+                "idx_asistencias_fecha_hora", sin_sort=True,
+            ))
+
+            # Reportes: página siguiente por cursor
+            sql, params = database.sql_consultar_asistencias(
+                f_inicio=hoy - timedelta(days=30), f_fin=hoy, limite=51,
+                despues_de=(hoy - timedelta(days=3), "09:10:00", 0),
+            )
+            resultados.append(_verificar(
+                c, "reporte paginado por cursor", sql, params,
+                "idx_asistencias_fecha_hora", sin_sort=True,
+            ))
+
+            # Registro de hoy, o de madrugada el turno nocturno de ayer sin cerrar:
+            # la misma búsqueda que hace marcar_asistencia (migraciones.py)
+            for madrugada in (False, True):
+                resultados.append(_verificar(
+                    c, f"marcación {'de madrugada' if madrugada else 'de día'}",
+                    """
+                    SELECT a.* FROM asistencias a
+                    WHERE a.empleado_id = %(empleado_id)s
+                      AND (a.fecha = %(hoy)s
+                           OR (%(madrugada)s
+                               AND a.fecha = %(hoy)s::date - 1
+                               AND a.turno_completado = FALSE
+                               AND a.hora_salida IS NULL))
+                    ORDER BY a.fecha DESC, a.id DESC
+                    LIMIT 1
+                    """,
+                    {"empleado_id": empleado_id, "hoy": hoy, "madrugada": madrugada},
+                    "idx_asistencias_empleado_fecha",
+                ))
+
+            # Búsqueda por nombre sin tildes (migración 004)
+            resultados.append(_verificar(
+                c, "búsqueda por nombre",
+                "SELECT id FROM empleados WHERE f_unaccent(nombre) ILIKE f_unaccent(%s)",
+                ("%ficacion 12%",),
+                "idx_empleados_nombre_trgm",
+            ))
+        finally:
+            conn.rollback()
+
+    return all(resultados)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Verifica los planes de ejecución de los índices")
+    parser.add_argument("--empleados", type=int, default=300)
+    parser.add_argument("--dias", type=int, default=90)
+    parser.add_argument("--forzar", action="store_true", help="permitir una base que no es local")
+    args = parser.parse_args()
+
+    host = urlparse(database.DATABASE_URL).hostname or ""
+    if host not in HOSTS_LOCALES and not args.forzar:
+        print(f"❌ DATABASE_URL apunta a {host}; use una base local o --forzar")
+        sys.exit(2)
+
+    sys.exit(0 if verificar(args.empleados, args.dias) else 1)